@@ -2,20 +2,41 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import queue
+import time
 import webbrowser
 from pathlib import Path
 import threading
+import traceback
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
+# 这里只导入轻量模块（不含 pandas / numpy / openpyxl），窗口先显示；
+# 处理模块在窗口显示后由后台线程预加载（preload_modules），点击运行时已就绪
 from score_filter_core import (
-    process_files, process_one_file,
+    process_files, process_one_file, preload_modules,
     DEFAULT_PUBCLASS_QUALIFIED_NUM, SUPPORTED_EXTS
 )
+from score_filter_cache import ResultCache, FrameStore, SnapshotStore
+from score_filter_io import report_path
 
 # 在这里放你的 GitHub 仓库链接（可点击打开）
 GITHUB_URL = "https://github.com/panchangda/score-filter-tool"  # TODO: 替换为你的实际地址
 
+def _format_seconds(sec):
+    sec = int(round(sec))
+    if sec >= 3600:
+        return f"{sec // 3600} 小时 {sec % 3600 // 60} 分"
+    if sec >= 60:
+        return f"{sec // 60} 分 {sec % 60} 秒"
+    return f"{sec} 秒"
+
+# 日志：后台线程只入队，主线程定时批量取出写入 Text
+LOG_POLL_MS = 100          # 取队列的间隔
+LOG_BATCH_MAX = 2000       # 每次最多取出的条目数（其余留到下一轮，避免长时间占用主线程）
+LOG_MAX_LINES = 5000       # 日志窗口保留的最大行数（完整日志可另存文件）
+PRELOAD_DELAY_MS = 200     # 窗口显示后再开始后台预加载，避免与首次绘制争用
+
 class App:
     def __init__(self, root):
         self.root = root
@@ -74,16 +95,71 @@ class App:
         ttk.Checkbutton(row1, text="分开输出各规则 CSV（divide_output）", variable=self.divide_var)\
             .pack(side=tk.LEFT, padx=10)
 
+        ttk.Label(row1, text="并行进程数：").pack(side=tk.LEFT, padx=(10, 0))
+        self.workers_spin = tk.Spinbox(row1, from_=1, to=max(1, os.cpu_count() or 1), width=4)
+        self.workers_spin.delete(0, tk.END)
+        self.workers_spin.insert(0, str(max(1, (os.cpu_count() or 1) - 1)))
+        self.workers_spin.pack(side=tk.LEFT, padx=6)
+
+        row2 = ttk.Frame(param_row)
+        row2.pack(fill=tk.X, pady=(6, 0))
+        self.cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(row2, text="启用结果缓存（文件未变化时跳过处理）", variable=self.cache_var)\
+            .pack(side=tk.LEFT)
+        ttk.Button(row2, text="清空缓存", command=self.clear_cache).pack(side=tk.LEFT, padx=10)
+
+        self.snapshot_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(row2, text="解析快照（同一文件再次读取时免解析）", variable=self.snapshot_var)\
+            .pack(side=tk.LEFT, padx=10)
+
+        self.stream_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row2, text="超大文件流式处理（分块读取，省内存）", variable=self.stream_var)\
+            .pack(side=tk.LEFT, padx=10)
+
+        row3 = ttk.Frame(param_row)
+        row3.pack(fill=tk.X, pady=(6, 0))
+        ttk.Label(row3, text="分班列（可选，如“班级”；一个文件含多个班时填写）：").pack(side=tk.LEFT)
+        self.partition_var = tk.StringVar()
+        ttk.Entry(row3, textvariable=self.partition_var, width=16).pack(side=tk.LEFT, padx=6)
+
+        self.parquet_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row3, text="同时输出 Parquet（需 pyarrow）", variable=self.parquet_var)\
+            .pack(side=tk.LEFT, padx=10)
+
+        self.report_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row3, text="生成跨文件汇总预警表（按学生汇总）", variable=self.report_var)\
+            .pack(side=tk.LEFT, padx=10)
+
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row3, text="性能剖析（各阶段耗时/内存表）", variable=self.profile_var)\
+            .pack(side=tk.LEFT, padx=10)
+
+        self.logfile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row3, text="完整日志另存文件", variable=self.logfile_var)\
+            .pack(side=tk.LEFT, padx=10)
+
+        row4 = ttk.Frame(param_row)
+        row4.pack(fill=tk.X, pady=(6, 0))
+        ttk.Label(row4, text="规则配置（可选，JSON；留空使用内置规则）：").pack(side=tk.LEFT)
+        self.rules_var = tk.StringVar()
+        ttk.Entry(row4, textvariable=self.rules_var, width=50).pack(side=tk.LEFT, padx=6)
+        ttk.Button(row4, text="浏览", command=self.browse_rules).pack(side=tk.LEFT)
+
         # ========== 操作区 ==========
         ctl_row = ttk.Frame(frm)
         ctl_row.pack(fill=tk.X, pady=10)
         self.run_btn = ttk.Button(ctl_row, text="批量运行（Run）", command=self.on_run)
         self.run_btn.pack(side=tk.LEFT)
+        self.cancel_btn = ttk.Button(ctl_row, text="取消", command=self.on_cancel, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=6)
         ttk.Button(ctl_row, text="退出", command=root.quit).pack(side=tk.RIGHT)
 
-        # 进度条
-        self.progress = ttk.Progressbar(frm, mode="indeterminate")
-        self.progress.pack(fill=tk.X, pady=(0, 6))
+        # 进度条（按已完成文件数）与进度文字
+        self.progress = ttk.Progressbar(frm, mode="determinate")
+        self.progress.pack(fill=tk.X, pady=(0, 2))
+        self.status_var = tk.StringVar(value="就绪")
+        ttk.Label(frm, textvariable=self.status_var).pack(anchor=tk.W, pady=(0, 6))
+        self._cancel_event = None
 
         # 日志
         ttk.Label(frm, text="日志：").pack(anchor=tk.W, pady=(4, 0))
@@ -94,6 +170,37 @@ class App:
         # 记录最近输出位置（用于“打开目录”扩展时）
         self._last_outdir_used = None
 
+        # 日志队列：元素为 str（日志行）或可调用对象（需在主线程执行的界面操作）
+        self._ui_queue = queue.SimpleQueue()
+        # 本次会话内已解析的数据：只改阈值再次运行时跳过读取
+        self.frame_store = FrameStore()
+        self._log_file = None
+        self.preload_done = threading.Event()
+        self.preload_timings = None
+        self.root.after(LOG_POLL_MS, self._drain_ui_queue)
+        self.root.after(PRELOAD_DELAY_MS, self._start_preload)
+
+    # ---------- 后台预加载 ----------
+    def _start_preload(self):
+        self.status_var.set("就绪（正在后台加载处理模块…）")
+
+        def worker():
+            try:
+                self.preload_timings = preload_modules()
+            except Exception:
+                # 预加载失败不影响使用：运行时会再次导入并在日志中报告错误
+                self.log(traceback.format_exc())
+            finally:
+                self.preload_done.set()
+                self.call_in_ui(self._on_preload_finished)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_preload_finished(self):
+        # 已开始运行时状态栏显示进度，不覆盖
+        if self.status_var.get().startswith("就绪"):
+            self.status_var.set("就绪")
+
     # ---------- 文件区操作 ----------
     def add_files(self):
         filenames = filedialog.askopenfilenames(
@@ -142,13 +249,79 @@ class App:
             self.use_input_dir.set(False)
             self._toggle_outdir_state()
 
+    def browse_rules(self):
+        fn = filedialog.askopenfilename(title="选择规则配置",
+                                        filetypes=[("JSON files", ".json"), ("All files", "*.*")])
+        if fn:
+            self.rules_var.set(fn)
+
+    # ---------- 缓存 ----------
+    def clear_cache(self):
+        cache = ResultCache()
+        cache.clear()
+        snapshots = SnapshotStore()
+        snapshots.clear()
+        self.frame_store.clear()
+        self.log(f"已清空缓存：{cache.cache_dir}、{snapshots.snapshot_dir}（及内存中已解析的数据）")
+
     # ---------- 日志 ----------
     def log(self, s=""):
+        """可在任意线程调用：只入队，由主线程批量写入"""
+        self._ui_queue.put(str(s))
+
+    def call_in_ui(self, fn, *args):
+        """在主线程执行 fn(*args)，与之前入队的日志保持先后顺序"""
+        self._ui_queue.put(lambda: fn(*args))
+
+    def _drain_ui_queue(self):
+        lines = []
+        try:
+            for _ in range(LOG_BATCH_MAX):
+                item = self._ui_queue.get_nowait()
+                if callable(item):
+                    self._flush_log(lines)
+                    lines = []
+                    item()
+                else:
+                    lines.append(item)
+        except queue.Empty:
+            pass
+        self._flush_log(lines)
+        self.root.after(LOG_POLL_MS, self._drain_ui_queue)
+
+    def _flush_log(self, lines):
+        if not lines:
+            return
+        text = "\n".join(lines) + "\n"
+        if self._log_file is not None:
+            try:
+                self._log_file.write(text)
+                self._log_file.flush()
+            except OSError:
+                self._close_log_file()
         self.txt.configure(state=tk.NORMAL)
-        self.txt.insert(tk.END, s + "\n")
+        self.txt.insert(tk.END, text)
+        # 超出上限时删除最早的行
+        excess = int(self.txt.index("end-1c").split(".")[0]) - LOG_MAX_LINES
+        if excess > 0:
+            self.txt.delete("1.0", f"{excess + 1}.0")
         self.txt.see(tk.END)
         self.txt.configure(state=tk.DISABLED)
 
+    def _open_log_file(self, folder):
+        path = Path(folder) / f"score_filter_{time.strftime('%Y%m%d_%H%M%S')}.log"
+        try:
+            self._log_file = open(path, "w", encoding="utf-8")
+        except OSError as e:
+            self.log(f"无法创建日志文件：{path}（{e}）")
+            return
+        self.log(f"完整日志写入：{path}")
+
+    def _close_log_file(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
     # ---------- 介绍 / 关于 ----------
     def show_about(self):
         # 用 Toplevel 做一个简单“介绍”窗口，可点击打开 GitHub
@@ -174,7 +347,10 @@ class App:
             "其它处理：\n"
             "  - 若存在列“一层节点”为“其它”的行，会被过滤。\n"
             "  - 合并导出前会按 [学号, 课程名称, 学期(可选列)] 去重。\n"
-            "  - 可选将三类结果分别另存 CSV。\n\n"
+            "  - 填写分班列后，同一文件中的多个班级分别统计班级人数与未开设课程，总表每班一个工作表。\n"
+            "  - 可选将三类结果分别另存 CSV。\n"
+            "  - 列名、条件、阈值与来源规则文字可由“规则配置”JSON 自定义"
+            "（模板：python main.py --dump-rules 规则.json）。\n\n"
             "字段要求（列名）：\n"
             "  - 第一列作为学号；需包含：一层节点、课程名称、获得学分、成绩（大小写一致）。\n\n"
             "GitHub：点击下方链接打开仓库地址。"
@@ -205,6 +381,28 @@ class App:
 
         divide_output = bool(self.divide_var.get())
 
+        try:
+            workers = max(1, int(self.workers_spin.get()))
+        except Exception:
+            workers = 1
+
+        cache = ResultCache() if self.cache_var.get() else None
+        snapshots = SnapshotStore() if self.snapshot_var.get() else None
+        from score_filter_stream import DEFAULT_CHUNKSIZE
+        from score_filter_ruleset import load_ruleset
+        chunksize = DEFAULT_CHUNKSIZE if self.stream_var.get() else None
+        partition_col = self.partition_var.get().strip() or None
+        extra_formats = ("parquet",) if self.parquet_var.get() else ()
+        profile = self.profile_var.get()
+
+        # 规则配置在这里编译一次，整批共用
+        rules_file = self.rules_var.get().strip()
+        try:
+            ruleset = load_ruleset(rules_file) if rules_file else None
+        except (OSError, ValueError) as e:
+            messagebox.showerror("规则配置有误", str(e))
+            return
+
         # 输出目录策略
         output_dir = None
         if not self.use_input_dir.get():
@@ -222,16 +420,31 @@ class App:
 
         # UI状态
         self.run_btn.config(state=tk.DISABLED)
-        self.progress.start(10)
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.progress.config(maximum=len(files), value=0)
+        self.status_var.set(f"0/{len(files)}")
+        self._cancel_event = threading.Event()
+        cancel_event = self._cancel_event
+        if self.logfile_var.get():
+            self._open_log_file(output_dir or Path(files[0]).parent)
+        # 汇总预警表写到统一输出目录；输出到各输入目录时写到第一个文件所在目录
+        summary_path = report_path(output_dir or Path(files[0]).parent) if self.report_var.get() else None
 
         def worker():
             self.log(f"开始批量处理（{len(files)} 个文件）...")
-            ok, combined, results = process_files(
-                files, pubclass_qualified_num=pub_val,
-                divide_output=divide_output, output_dir=output_dir, log_fn=self.log
-            )
-            self.progress.stop()
-            self.run_btn.config(state=tk.NORMAL)
+            try:
+                ok, combined, results = process_files(
+                    files, pubclass_qualified_num=pub_val,
+                    divide_output=divide_output, output_dir=output_dir, log_fn=self.log,
+                    workers=workers, cache=cache, chunksize=chunksize, partition_col=partition_col,
+                    extra_formats=extra_formats, trace_memory=profile, show_profile=profile,
+                    progress_fn=lambda e: self.call_in_ui(self._on_progress, e), cancel_event=cancel_event,
+                    frame_store=self.frame_store, snapshots=snapshots, report_path=summary_path,
+                    ruleset=ruleset
+                )
+            except Exception:
+                # 进程池无法启动等批量级错误：也要恢复界面状态
+                ok, combined = False, traceback.format_exc()
 
             # 记录最近输出目录
             if output_dir:
@@ -242,12 +455,44 @@ class App:
                 except Exception:
                     self._last_outdir_used = None
 
-            # 弹窗与日志
+            # 弹窗与日志（界面操作交给主线程）
             self.log("\n=== 批量汇总 ===")
             self.log(combined)
-            if ok:
-                messagebox.showinfo("完成", "所有文件处理完毕！")
-            else:
-                messagebox.showwarning("部分失败", "已完成，但部分文件处理失败，请查看日志。")
+            self.call_in_ui(self._on_run_finished, ok, cancel_event.is_set())
 
         threading.Thread(target=worker, daemon=True).start()
+
+    def on_cancel(self):
+        if self._cancel_event is not None and not self._cancel_event.is_set():
+            self._cancel_event.set()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.status_var.set(self.status_var.get() + "  正在取消（等待处理中的文件完成）…")
+            self.log("用户取消：不再开始新文件，等待处理中的文件完成…")
+
+    def _on_progress(self, e):
+        self.progress.config(value=e["done"])
+        text = f"{e['done']}/{e['total']}"
+        if e["files_per_sec"]:
+            text += f"  {e['files_per_sec']:.2f} 文件/秒"
+        if e["eta_seconds"] is not None and e["done"] < e["total"]:
+            text += f"  剩余约 {_format_seconds(e['eta_seconds'])}"
+        if e["kind"] == "stage":
+            text += f"  当前：{e['file'].name}（{e['stage']}）"
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            text += "  正在取消…"
+        self.status_var.set(text)
+
+    def _on_run_finished(self, ok, cancelled=False):
+        self.run_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        self._cancel_event = None
+        self._close_log_file()
+        if cancelled:
+            self.status_var.set(f"已取消（完成 {int(self.progress['value'])}/{int(self.progress['maximum'])}）")
+            messagebox.showinfo("已取消", "批量处理已取消，已完成的文件结果已保留，详见日志。")
+            return
+        self.status_var.set("完成" if ok else "完成（部分失败）")
+        if ok:
+            messagebox.showinfo("完成", "所有文件处理完毕！")
+        else:
+            messagebox.showwarning("部分失败", "已完成，但部分文件处理失败，请查看日志。")
@@ -0,0 +1,481 @@
+# benchmark.py
+# -*- coding: utf-8 -*-
+"""
+性能基准脚本（不参与打包）。
+
+    python benchmark.py read                 # 各读取后端在 1k/10k/100k 行上的耗时与峰值内存
+    python benchmark.py read --rows 1000 5000
+    python benchmark.py write                # 各写出后端（xlsx / parquet / feather）的吞吐
+    python benchmark.py memory               # 紧凑列类型（categorical / float32）前后的内存与规则耗时
+    python benchmark.py suite --save benchmark_baseline.json     # 全套基准并保存基线
+    python benchmark.py suite --check benchmark_baseline.json    # 与基线比较，变慢超过容差时退出码为 1
+    python benchmark.py startup              # 冷启动：解释器 / 界面模块导入 / 处理模块导入 / 窗口显示 / 可开始处理
+    python benchmark.py startup --exe dist/score_filter_tool.exe --check startup_baseline.json
+
+合成成绩表的规模与分布可调：--students / --courses / --public-share / --not-offered / --seed。
+read / write 的每次测量在独立子进程中进行，峰值内存取子进程的最大常驻内存（RSS）；
+suite 在本进程内计时，每项重复 --repeat 次取最短耗时。
+startup 的每次测量都启动全新的子进程；窗口相关两项需要图形界面，无显示时跳过。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DEFAULT_ROWS = (1_000, 10_000, 100_000)
+SUITE_ROWS = (10_000, 100_000)
+DEFAULT_TOLERANCE = 0.25
+# 低于该差值（秒）的变化视为噪声，不判为回退
+NOISE_FLOOR_SECONDS = 0.005
+
+NON_PUBLIC_TYPES = ("专业必修课", "专业选修课", "通识必修课")
+
+
+def make_synthetic_workbook(path, rows, courses=40, seed=0, students=None, public_share=0.2,
+                            not_offered=0.1, other_share=0.05):
+    """
+    生成与教务导出格式一致的合成成绩表（rows 行）。
+    students:     学生人数；默认 rows // courses（每个学生修全部课程）。行数超过
+                  学生数×课程数时循环，产生重复记录（供去重）
+    public_share: 公共选修课占课程数的比例
+    not_offered:  非公选课程中“未开设”（全班成绩空白）的比例
+    other_share:  “其它”课程（应被过滤）的比例
+    """
+    import numpy as np
+    import pandas as pd
+    from score_filter_io import write_excel
+
+    rng = np.random.default_rng(seed)
+    students = students or max(1, rows // courses)
+    n_public = int(round(courses * public_share))
+    n_other = int(round(courses * other_share))
+    kinds = np.array(["公共选修课"] * n_public + ["其它"] * n_other
+                     + [NON_PUBLIC_TYPES[i % len(NON_PUBLIC_TYPES)] for i in range(courses - n_public - n_other)],
+                     dtype=object)
+    non_public = np.flatnonzero(np.isin(kinds, NON_PUBLIC_TYPES))
+    off = rng.choice(non_public, size=int(round(len(non_public) * not_offered)), replace=False)
+
+    i = np.arange(rows)
+    s = i % students
+    c = (i // students) % courses
+    # 成绩分布：约 75% 及格、12% 不及格、8% 空白、5% 为 0；未开设课程全部空白
+    u = rng.random(rows)
+    score = np.where(u < 0.75, rng.integers(120, 201, rows) / 2,            # 60 ~ 100，步长 0.5
+             np.where(u < 0.87, rng.integers(1, 60, rows).astype(float),
+             np.where(u < 0.95, np.nan, 0.0)))
+    score[np.isin(c, off)] = np.nan
+    is_public = kinds[c] == "公共选修课"
+    credit = np.where(is_public, rng.choice([0, 1, 2, 12], rows), rng.choice([0, 2, 3, 3.5, 4], rows))
+
+    df = pd.DataFrame({
+        "学号": [f"2021{x:05d}" for x in s],
+        "姓名": [f"学生{x}" for x in s],
+        "一层节点": kinds[c],
+        "课程名称": [f"课程{x:03d}" for x in c],
+        "获得学分": credit.astype(float),
+        "成绩": score,
+        "学年学期": np.where(c % 2 == 0, "2024-2025-1", "2024-2025-2"),
+    })
+    write_excel(path, [("Sheet1", df)])
+    return Path(path)
+
+
+def _workbook(workdir, rows, gen, prefix="synthetic"):
+    """按参数取得（必要时生成）合成工作簿；参数相同的文件复用"""
+    tag = "_".join(f"{k}{v}" for k, v in sorted(gen.items()) if v is not None)
+    path = Path(workdir) / (f"{prefix}_{rows}" + (f"_{tag}" if tag else "") + ".xlsx")
+    if not path.exists():
+        make_synthetic_workbook(path, rows, **gen)
+    return path
+
+
+def _peak_rss_bytes():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset
+        except Exception:
+            return None
+
+
+def _measure_read(path, backend, columns, conn):
+    from score_filter_io import read_excel, RULE_COLUMNS
+    base = _peak_rss_bytes()
+    t0 = time.perf_counter()
+    df, used = read_excel(path, backend=backend, columns=RULE_COLUMNS if columns else None)
+    elapsed = time.perf_counter() - t0
+    peak = _peak_rss_bytes()
+    conn.send({"backend": used, "rows": len(df), "seconds": elapsed,
+               "peak_mb": None if peak is None else peak / 2**20,
+               "delta_mb": None if peak is None or base is None else (peak - base) / 2**20})
+    conn.close()
+
+
+def _run_isolated(target, *args):
+    parent, child = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=target, args=(*args, child))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def bench_read(rows_list, workdir, gen):
+    from score_filter_io import available_readers
+    backends = [b for b in available_readers() if b != "xlrd"]
+    print(f"{'行数':>8} {'后端':<10} {'列':<6} {'耗时(s)':>9} {'峰值RSS(MB)':>12} {'增量(MB)':>10}")
+    for rows in rows_list:
+        path = _workbook(workdir, rows, gen)
+        for backend in backends:
+            for columns in (False, True):
+                r = _run_isolated(_measure_read, str(path), backend, columns)
+                print(f"{rows:>8} {r['backend']:<10} {'规则列' if columns else '全部':<6} "
+                      f"{r['seconds']:>9.3f} {r['peak_mb'] or 0:>12.1f} {r['delta_mb'] or 0:>10.1f}")
+
+
+def _measure_write(path, target, conn):
+    import pandas as pd
+    from score_filter_io import write_excel, write_table
+    df = pd.read_excel(path, dtype={0: str})
+    out = Path(path).with_name(f"out_{target}")
+    base = _peak_rss_bytes()
+    t0 = time.perf_counter()
+    if target in ("parquet", "feather", "csv"):
+        used = write_table(df, out.with_suffix(f".{target}"), target)
+    else:
+        used = write_excel(out.with_suffix(".xlsx"), [("Sheet1", df)], backend=target)
+    elapsed = time.perf_counter() - t0
+    peak = _peak_rss_bytes()
+    conn.send({"writer": used, "rows": len(df), "seconds": elapsed,
+               "delta_mb": None if peak is None or base is None else (peak - base) / 2**20})
+    conn.close()
+
+
+def bench_write(rows_list, workdir, gen):
+    from score_filter_io import _has_module
+    targets = ["pandas", "openpyxl"]
+    if _has_module("xlsxwriter"):
+        targets.append("xlsxwriter")
+    targets.append("csv")
+    if _has_module("pyarrow"):
+        targets += ["parquet", "feather"]
+    print(f"{'行数':>8} {'写出':<12} {'耗时(s)':>9} {'行/秒':>10} {'增量(MB)':>10}")
+    for rows in rows_list:
+        path = _workbook(workdir, rows, gen)
+        for target in targets:
+            r = _run_isolated(_measure_write, str(path), target)
+            rate = r["rows"] / r["seconds"] if r["seconds"] else float("inf")
+            print(f"{rows:>8} {target:<12} {r['seconds']:>9.3f} {rate:>10.0f} {r['delta_mb'] or 0:>10.1f}")
+
+
+def _rules_pass(df, cols, valid):
+    """规则计算 + 去重（与 score_filter_core 的整表路径相同），返回 (耗时, tracemalloc 峰值字节)"""
+    import tracemalloc
+    from score_filter_rules import evaluate_base, apply_rule1, dedup_positions
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    res = apply_rule1(evaluate_base(df, cols, valid=valid), 10)
+    subset = [c for c in (cols["student_id"], cols["course_name"], cols["term"]) if c is not None]
+    dedup_positions(df, res["export_pos"], subset)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_memory(rows_list, workdir, gen, repeat=3):
+    from score_filter_io import read_excel
+    from score_filter_rules import detect_columns, normalize_frame, compact_frame
+    print(f"{'行数':>8} {'列类型':<8} {'表内存(MB)':>11} {'规则+去重(s)':>13} {'计算峰值(MB)':>13}")
+    for rows in rows_list:
+        path = _workbook(workdir, rows, gen)
+        raw, _ = read_excel(path)
+        for mode in ("原始", "紧凑"):
+            df = raw.copy()
+            cols = detect_columns(df.columns)
+            valid, _ = normalize_frame(df, cols)
+            if mode == "紧凑":
+                compact_frame(df, cols)
+            size = df.memory_usage(index=True, deep=True).sum()
+            runs = [_rules_pass(df, cols, valid) for _ in range(repeat)]
+            elapsed = min(r[0] for r in runs)
+            peak = max(r[1] for r in runs)
+            print(f"{rows:>8} {mode:<8} {size / 2**20:>11.1f} {elapsed:>13.4f} {peak / 2**20:>13.1f}")
+
+
+# ---------------- 基准套件 ----------------
+
+def _best_of(repeat, fn):
+    """重复 repeat 次，返回 (最短耗时, 最后一次的返回值)"""
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def _suite_file(path, rows, repeat, workdir):
+    """单个工作簿的分阶段基准：read / filter / masks / rule1..3 / dedup / write"""
+    from score_filter_io import read_excel, write_excel
+    from score_filter_profile import StageProfiler
+    from score_filter_rules import (
+        detect_columns, normalize_frame, evaluate_base, apply_rule1,
+        dedup_positions, take_labeled, restore_dtypes,
+    )
+    results = {}
+    results["read"], (raw, _) = _best_of(repeat, lambda: read_excel(path))
+    cols = detect_columns(raw.columns)
+
+    def prepare():
+        df = raw.copy()
+        # 与单次处理一致：不压缩（compact_frame 只用于常驻 FrameStore 的数据，见 bench_memory）
+        valid, export_dtypes = normalize_frame(df, cols)
+        return df, valid, export_dtypes
+
+    results["filter"], (df, valid, dtypes) = _best_of(repeat, prepare)
+
+    stages = {}
+    for _ in range(repeat):
+        prof = StageProfiler()
+        res = apply_rule1(evaluate_base(df, cols, valid=valid, profiler=prof), 10, profiler=prof)
+        for r in prof.to_dict()["stages"]:
+            stages[r["stage"]] = min(stages.get(r["stage"], float("inf")), r["seconds"])
+    results.update(stages)
+
+    subset = [c for c in (cols["student_id"], cols["course_name"], cols["term"]) if c is not None]
+
+    def dedup():
+        pos = dedup_positions(df, res["export_pos"], subset)
+        return restore_dtypes(take_labeled(df, pos, res["codes"], 10), dtypes)
+
+    results["dedup"], df_final = _best_of(repeat, dedup)
+    out = Path(workdir) / f"suite_out_{rows}.xlsx"
+    results["write"], _ = _best_of(repeat, lambda: write_excel(out, [("Sheet1", df_final)]))
+    return {f"rows={rows}/{k}": v for k, v in results.items()}
+
+
+def _suite_batch(path, rows, files, workers, repeat, workdir):
+    """整批吞吐：同一工作簿复制 files 份，串行与进程池各跑一次（不使用缓存/快照）"""
+    from score_filter_core import process_files
+    batch_dir = Path(workdir) / f"batch_{rows}"
+    shutil.rmtree(batch_dir, ignore_errors=True)
+    batch_dir.mkdir(parents=True)
+    infiles = []
+    for k in range(files):
+        dst = batch_dir / f"班级{k:03d}.xlsx"
+        shutil.copyfile(path, dst)
+        infiles.append(dst)
+    out_dir = batch_dir / "out"
+    results = {}
+    for w in sorted({1, workers}):
+        def run():
+            ok, _, _ = process_files(infiles, output_dir=out_dir, log_fn=lambda s: None, workers=w)
+            if not ok:
+                raise RuntimeError("批量处理失败")
+        results[f"rows={rows}/batch_files={files}_workers={w}"], _ = _best_of(repeat, run)
+    return results
+
+
+def run_suite(rows_list, workdir, gen, repeat=3, batch_files=8, workers=None):
+    """返回 {"meta": {...}, "results": {指标: 秒}}"""
+    import pandas as pd
+    workers = workers or max(1, (os.cpu_count() or 1) - 1)
+    results = {}
+    for rows in rows_list:
+        path = _workbook(workdir, rows, gen, prefix="suite")
+        results.update(_suite_file(path, rows, repeat, workdir))
+    batch_rows = min(rows_list)
+    results.update(_suite_batch(_workbook(workdir, batch_rows, gen, prefix="suite"), batch_rows,
+                                batch_files, workers, max(1, repeat // 2), workdir))
+    return {
+        "meta": {
+            "python": platform.python_version(), "pandas": pd.__version__, "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "generator": gen, "repeat": repeat, "batch_files": batch_files, "workers": workers,
+        },
+        "results": results,
+    }
+
+
+# ---------------- 冷启动 ----------------
+
+STARTUP_SNIPPETS = {
+    "interpreter": "pass",
+    "gui_imports": "import main, app_gui",
+    "processing_imports": "from score_filter_core import preload_modules; preload_modules()",
+}
+
+
+def _wall(cmd, cwd):
+    """在新子进程中运行 cmd，返回 (墙钟耗时, 退出码)"""
+    import subprocess
+    t0 = time.perf_counter()
+    rc = subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+    return time.perf_counter() - t0, rc
+
+
+def _measure_window(cmd, workdir, repeat):
+    """运行 `<程序> --measure-startup 文件` repeat 次，返回 {"window": 秒, "ready": 秒}（取最短）；无法显示窗口时返回 None"""
+    import subprocess
+    out = Path(workdir) / "startup.json"
+    best = {}
+    for _ in range(repeat):
+        out.unlink(missing_ok=True)
+        proc = subprocess.run([*cmd, "--measure-startup", str(out)], capture_output=True, text=True)
+        if proc.returncode != 0 or not out.exists():
+            print(f"跳过窗口计时：{(proc.stderr or '').strip() or f'退出码 {proc.returncode}'}")
+            return None
+        r = json.loads(out.read_text(encoding="utf-8"))
+        for k in ("window", "ready"):
+            best[k] = min(best.get(k, float("inf")), r[k])
+    return best
+
+
+def run_startup(workdir, repeat=5, exe=None):
+    """返回 {"meta": {...}, "results": {指标: 秒}}；每项在全新子进程中测量，重复 repeat 次取最短"""
+    here = Path(__file__).resolve().parent
+    results = {}
+    for name, code in STARTUP_SNIPPETS.items():
+        best = float("inf")
+        for _ in range(repeat):
+            elapsed, rc = _wall([sys.executable, "-c", code], here)
+            if rc != 0:
+                raise RuntimeError(f"启动计时失败：{code}")
+            best = min(best, elapsed)
+        results[f"startup/{name}"] = best
+    targets = [("", [sys.executable, str(here / "main.py")])]
+    if exe:
+        targets.append(("exe_", [str(Path(exe).resolve())]))
+    for prefix, cmd in targets:
+        r = _measure_window(cmd, workdir, repeat)
+        if r:
+            results.update({f"startup/{prefix}{k}": v for k, v in r.items()})
+    return {
+        "meta": {
+            "python": platform.python_version(), "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"), "repeat": repeat, "exe": exe,
+        },
+        "results": results,
+    }
+
+
+def print_results(report):
+    print(f"{'指标':<44} {'耗时(s)':>10}")
+    for k, v in report["results"].items():
+        extra = ""
+        if "/batch_files=" in k:
+            files = int(k.split("batch_files=")[1].split("_")[0])
+            extra = f"  ({files / v:.2f} 文件/秒)"
+        print(f"{k:<44} {v:>10.4f}{extra}")
+
+
+def check_regressions(report, baseline, tolerance=DEFAULT_TOLERANCE, floor=NOISE_FLOOR_SECONDS):
+    """与基线逐项比较，返回回退项列表 [(指标, 基线秒, 当前秒)]；同时打印对比表"""
+    regressions = []
+    print(f"{'指标':<44} {'基线(s)':>10} {'当前(s)':>10} {'变化':>8}")
+    for k, cur in report["results"].items():
+        base = baseline["results"].get(k)
+        if base is None:
+            print(f"{k:<44} {'-':>10} {cur:>10.4f} {'新增':>8}")
+            continue
+        change = (cur - base) / base if base else 0.0
+        slow = cur > base * (1 + tolerance) and cur - base > floor
+        flag = "  <-- 回退" if slow else ""
+        print(f"{k:<44} {base:>10.4f} {cur:>10.4f} {change:>+8.0%}{flag}")
+        if slow:
+            regressions.append((k, base, cur))
+    return regressions
+
+
+def _add_generator_args(p, rows_default):
+    p.add_argument("--rows", type=int, nargs="+", default=list(rows_default))
+    p.add_argument("--workdir", default=None, help="合成工作簿存放目录（默认临时目录）")
+    g = p.add_argument_group("合成数据")
+    g.add_argument("--students", type=int, default=None, help="学生人数（默认 行数/课程数）")
+    g.add_argument("--courses", type=int, default=40, help="课程数")
+    g.add_argument("--public-share", type=float, default=0.2, help="公共选修课比例")
+    g.add_argument("--not-offered", type=float, default=0.1, help="非公选课程中未开设的比例")
+    g.add_argument("--seed", type=int, default=0)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="score_filter_tool 性能基准")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_read = sub.add_parser("read", help="读取后端对比")
+    _add_generator_args(p_read, DEFAULT_ROWS)
+    p_write = sub.add_parser("write", help="写出后端对比")
+    _add_generator_args(p_write, DEFAULT_ROWS)
+    p_mem = sub.add_parser("memory", help="紧凑列类型前后的内存与规则耗时对比")
+    _add_generator_args(p_mem, DEFAULT_ROWS)
+    p_suite = sub.add_parser("suite", help="读取/各规则/去重/写出/批量吞吐，可保存基线并检查回退")
+    _add_generator_args(p_suite, SUITE_ROWS)
+    p_suite.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最短耗时）")
+    p_suite.add_argument("--batch-files", type=int, default=8, help="批量吞吐测试的文件数")
+    p_suite.add_argument("--workers", type=int, default=None, help="批量吞吐测试的进程数（默认 CPU 核数-1）")
+    p_start = sub.add_parser("startup", help="冷启动耗时（窗口显示 / 可开始处理），可保存基线并检查回退")
+    p_start.add_argument("--repeat", type=int, default=5, help="每项重复次数（取最短耗时）")
+    p_start.add_argument("--exe", default=None, help="同时测量打包后的 exe")
+    p_start.add_argument("--workdir", default=None, help="临时文件目录（默认临时目录）")
+    for p in (p_suite, p_start):
+        p.add_argument("--save", default=None, help="把结果保存为基线 JSON")
+        p.add_argument("--check", default=None, help="与基线 JSON 比较，有回退时退出码为 1")
+        p.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                       help=f"允许变慢的比例（默认 {DEFAULT_TOLERANCE * 100:.0f}%%）")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "startup":
+        with tempfile.TemporaryDirectory() as tmp:
+            workdir = args.workdir or tmp
+            Path(workdir).mkdir(parents=True, exist_ok=True)
+            return _report(run_startup(workdir, repeat=args.repeat, exe=args.exe), args)
+
+    gen = {"courses": args.courses, "students": args.students, "public_share": args.public_share,
+           "not_offered": args.not_offered, "seed": args.seed}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        Path(workdir).mkdir(parents=True, exist_ok=True)
+        if args.cmd == "read":
+            bench_read(args.rows, workdir, gen)
+        elif args.cmd == "write":
+            bench_write(args.rows, workdir, gen)
+        elif args.cmd == "memory":
+            bench_memory(args.rows, workdir, gen)
+        elif args.cmd == "suite":
+            report = run_suite(args.rows, workdir, gen, repeat=args.repeat,
+                               batch_files=args.batch_files, workers=args.workers)
+            return _report(report, args)
+    return 0
+
+
+def _report(report, args):
+    """打印结果或与基线比较（--check），按需保存基线（--save）；返回退出码"""
+    rc = 0
+    if args.check:
+        baseline = json.loads(Path(args.check).read_text(encoding="utf-8"))
+        regressions = check_regressions(report, baseline, args.tolerance)
+        if regressions:
+            print(f"性能回退 {len(regressions)} 项（容差 {args.tolerance:.0%}）")
+            rc = 1
+        else:
+            print("未发现性能回退")
+    else:
+        print_results(report)
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"基线已保存: {args.save}")
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,65 @@
 # main.py
 # -*- coding: utf-8 -*-
-import tkinter as tk
-from app_gui import App
+import time
+_T0 = time.perf_counter()  # 冷启动计时起点（--measure-startup 使用）
 
-def main():
+import multiprocessing
+import sys
+
+MEASURE_FLAG = "--measure-startup"
+
+
+def measure_startup(out_path=None):
+    """
+    测量冷启动：窗口首次绘制完成的时间与后台预加载完成（可以开始处理）的时间，
+    单位秒、从解释器执行 main.py 起计。结果以 JSON 写入 out_path（未给出时打印），随后关闭窗口。
+    """
+    import json
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"无法创建窗口（没有可用的显示？）：{e}", file=sys.stderr)
+        return 1
+    from app_gui import App
+    app = App(root)
+    root.update()
+    window = time.perf_counter() - _T0
+
+    # 预加载由 root.after 调度，需要继续处理事件直到完成
+    while not app.preload_done.is_set():
+        root.update()
+        time.sleep(0.005)
+    ready = time.perf_counter() - _T0
+    root.destroy()
+
+    result = {"window": round(window, 4), "ready": round(ready, 4), "preload": app.preload_timings}
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == MEASURE_FLAG:
+        return measure_startup(argv[1] if len(argv) > 1 else None)
+    if argv:
+        # 带参数：命令行模式（不导入 tkinter，适合无界面的服务器）
+        from score_filter_cli import main as cli_main
+        return cli_main(argv)
+
+    import tkinter as tk
+    from app_gui import App
     root = tk.Tk()
     App(root)
     root.mainloop()
+    return 0
 
 if __name__ == "__main__":
-    main()
+    # PyInstaller 打包后的 exe 使用进程池时必需
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,372 @@
+# score_filter_cache.py
+# -*- coding: utf-8 -*-
+"""
+结果缓存：以输入文件内容哈希 + 处理参数为键，保存汇总文本与导出文件副本。
+输入未变化时直接从缓存恢复导出文件，跳过读取与规则计算。
+缓存目录按总大小做 LRU 淘汰（以 meta.json 的修改时间作为最近访问时间）。
+
+FrameStore：会话内的内存缓存，保存已解析的表，只改阈值时免去重新读取。
+SnapshotStore：磁盘上的列式快照（Feather，不可用时为 pickle），跨会话复用 xlsx 的解析结果。
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path.home() / ".score_filter_tool" / "cache"
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 导出格式或规则实现变化时递增，使旧缓存全部失效
+CACHE_VERSION = 2
+DEFAULT_FRAME_STORE_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_SNAPSHOT_DIR = Path.home() / ".score_filter_tool" / "snapshots"
+DEFAULT_SNAPSHOT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """文件内容的 sha256（十六进制）"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _dir_size(path):
+    total = 0
+    for p in Path(path).rglob("*"):
+        try:
+            if p.is_file():
+                total += p.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+class ResultCache:
+    """
+    磁盘结果缓存。
+    max_bytes: 缓存目录总大小上限，超出时淘汰最久未使用的条目
+    refresh:   为 True 时不读取已有条目（强制重算），但仍写入新结果
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES, refresh=False):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(max_bytes)
+        self.refresh = refresh
+
+    def make_key(self, infile, params: dict, digest=None):
+        """键 = 文件内容哈希 + 文件名 + 处理参数（文件名决定导出文件名，故一并纳入）"""
+        infile = Path(infile)
+        payload = json.dumps({
+            "version": CACHE_VERSION,
+            "digest": digest or file_digest(infile),
+            "name": infile.name,
+            "params": params,
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, out_dir):
+        """
+        命中时把缓存的导出文件恢复到 out_dir，返回 (summary, outputs)；未命中返回 None。
+        """
+        if self.refresh:
+            return None
+        entry = self.cache_dir / key
+        meta_path = entry / "meta.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        summary = meta["summary"]
+        outputs = {}
+        try:
+            for k, v in meta["outputs"].items():
+                if isinstance(v, dict) and "artifact" in v:
+                    src = entry / v["artifact"]
+                    dst = out_dir / v["artifact"]
+                    if not (dst.exists() and dst.stat().st_size == src.stat().st_size
+                            and file_digest(dst) == v["digest"]):
+                        shutil.copyfile(src, dst)
+                    # 汇总中的输出路径按本次输出目录改写
+                    summary = summary.replace(v["path"], str(dst))
+                    outputs[k] = dst
+                else:
+                    outputs[k] = v
+        except OSError:
+            return None
+
+        os.utime(meta_path)  # 刷新最近访问时间
+        return summary, outputs
+
+    def put(self, key, summary, outputs):
+        """写入一条结果；outputs 中的 Path 值会连同文件内容一起保存"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = self.cache_dir / key
+        if entry.exists():
+            return
+        tmp = Path(tempfile.mkdtemp(prefix=".tmp_", dir=self.cache_dir))
+        try:
+            meta_outputs = {}
+            for k, v in outputs.items():
+                if isinstance(v, Path) and v.is_file():
+                    shutil.copyfile(v, tmp / v.name)
+                    meta_outputs[k] = {"artifact": v.name, "path": str(v), "digest": file_digest(v)}
+                else:
+                    meta_outputs[k] = v
+            (tmp / "meta.json").write_text(
+                json.dumps({"summary": summary, "outputs": meta_outputs}, ensure_ascii=False, default=str),
+                encoding="utf-8")
+            os.replace(tmp, entry)
+        except OSError:
+            # 并发写入同一键或磁盘问题：放弃本次缓存，不影响处理结果
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """按最近访问时间淘汰条目，直到总大小不超过 max_bytes"""
+        if not self.cache_dir.exists():
+            return
+        entries = []
+        for e in self.cache_dir.iterdir():
+            meta = e / "meta.json"
+            try:
+                entries.append((meta.stat().st_mtime, _dir_size(e), e))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, e in sorted(entries, key=lambda t: t[0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(e, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """清空全部缓存"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+def estimate_nbytes(obj):
+    """估算 DataFrame / ndarray（可嵌套在 dict、list 中）占用的内存字节数"""
+    if hasattr(obj, "memory_usage"):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(estimate_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in obj)
+    return 0
+
+
+class FrameStore:
+    """
+    内存中的已解析数据缓存（GUI 会话内有效）：保存读取并规范化后的表及与阈值无关的规则结果，
+    同一批文件只改公选课学分阈值时，只需重算规则一、去重与写出。
+    键包含文件路径、修改时间与大小，文件变化后自动失效；按估算字节数做 LRU 淘汰。线程安全。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_FRAME_STORE_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()  # 键 -> (数据, 字节数)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(infile, params: dict):
+        st = Path(infile).stat()
+        return json.dumps([os.path.normcase(os.path.abspath(infile)), st.st_mtime_ns, st.st_size, params],
+                          sort_keys=True, ensure_ascii=False, default=str)
+
+    def get(self, key):
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None:
+                return None
+            self._entries.move_to_end(key)
+            return hit[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, entry, nbytes=None):
+        """写入一条数据；超过 max_bytes 的单条数据不保存。返回是否已保存"""
+        nbytes = estimate_nbytes(entry) if nbytes is None else int(nbytes)
+        if nbytes > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total -= old[1]
+            self._entries[key] = (entry, nbytes)
+            self._total += nbytes
+            while self._total > self.max_bytes:
+                _, (_, size) = self._entries.popitem(last=False)
+                self._total -= size
+        return True
+
+    def items(self):
+        with self._lock:
+            return [(k, v[0]) for k, v in self._entries.items()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total = 0
+
+    @property
+    def nbytes(self):
+        return self._total
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SnapshotStore:
+    """
+    解析结果的磁盘快照：读取 Excel 得到的 DataFrame 以 Feather（pyarrow，未压缩，
+    读取时 memory_map）保存；混合类型列（如成绩列中夹有“缺考”）等无法无损转为 Arrow 的列
+    另存 pickle，无 pyarrow 时整表用 pickle。写入后读回校验，保证与直接解析的结果完全一致。
+    源文件的修改时间与大小一致时直接加载；不一致但大小相同时比较内容哈希（复制、touch 后仍可命中）。
+    快照按“源文件路径 + 读取后端 + 读取列”命名，目录总大小超出 max_bytes 时按最近访问时间淘汰。
+    """
+
+    def __init__(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR, max_bytes=DEFAULT_SNAPSHOT_MAX_BYTES):
+        self.snapshot_dir = Path(snapshot_dir)
+        self.max_bytes = int(max_bytes)
+
+    def _base(self, source, params):
+        payload = json.dumps([os.path.normcase(os.path.abspath(source)), params],
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return self.snapshot_dir / hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _versions():
+        import pandas as pd
+        return {"cache": CACHE_VERSION, "pandas": pd.__version__}
+
+    def load(self, source, params: dict):
+        """源文件未变化时返回快照中的 DataFrame，否则返回 None"""
+        base = self._base(source, params)
+        meta_path = base.with_suffix(".json")
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            st = Path(source).stat()
+        except (OSError, ValueError):
+            return None
+        if meta.get("versions") != self._versions() or meta.get("size") != st.st_size:
+            return None
+        if meta.get("mtime_ns") != st.st_mtime_ns:
+            if file_digest(source) != meta.get("digest"):
+                return None
+            meta["mtime_ns"] = st.st_mtime_ns
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        try:
+            df = self._read(base, meta)
+        except Exception:
+            return None
+        os.utime(meta_path)  # 刷新最近访问时间
+        return df
+
+    @staticmethod
+    def _read(base, meta):
+        import pandas as pd
+        parts = []
+        if meta["arrow_columns"]:
+            from pyarrow import feather
+            parts.append(feather.read_table(base.with_suffix(".feather"), memory_map=True).to_pandas())
+        if meta["pickle_columns"]:
+            with open(base.with_suffix(".pickle"), "rb") as f:
+                parts.append(pickle.load(f))
+        if len(parts) == 1:
+            return parts[0]
+        # 恢复原列顺序（列名可能不是字符串，按位置还原）
+        df = pd.concat(parts, axis=1)
+        return df.iloc[:, meta["order"]]
+
+    def save(self, source, params: dict, df):
+        """保存快照，返回格式说明（feather / feather+pickle / pickle），失败时返回 None"""
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        base = self._base(source, params)
+        st = Path(source).stat()
+        arrow_cols = self._arrow_columns(df)
+        pickle_cols = [i for i in range(df.shape[1]) if i not in set(arrow_cols)]
+        meta = {"source": str(source), "params": params, "versions": self._versions(),
+                "size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": file_digest(source),
+                "arrow_columns": arrow_cols, "pickle_columns": pickle_cols,
+                # 拼接后第 k 列 -> 原第 order 位置（feather 部分在前）
+                "order": [(arrow_cols + pickle_cols).index(i) for i in range(df.shape[1])]}
+        meta_path = base.with_suffix(".json")
+        meta_path.unlink(missing_ok=True)
+        try:
+            if arrow_cols:
+                from pyarrow import feather
+                feather.write_feather(df.iloc[:, arrow_cols], base.with_suffix(".feather"),
+                                      compression="uncompressed")
+            if pickle_cols:
+                with open(base.with_suffix(".pickle"), "wb") as f:
+                    pickle.dump(df.iloc[:, pickle_cols], f, protocol=pickle.HIGHEST_PROTOCOL)
+            if not self._read(base, meta).equals(df):
+                raise ValueError("快照读回与原表不一致")
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        except Exception:
+            for suffix in (".feather", ".pickle"):
+                base.with_suffix(suffix).unlink(missing_ok=True)
+            return None
+        self.evict()
+        return "+".join(fmt for fmt, cols in (("feather", arrow_cols), ("pickle", pickle_cols)) if cols)
+
+    @staticmethod
+    def _arrow_columns(df):
+        """可无损存为 Feather 的列位置；需要 pyarrow、字符串列名、默认行索引"""
+        import pandas as pd
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return []
+        if not df.index.equals(pd.RangeIndex(len(df))):
+            return []
+        if len(set(df.columns)) != df.shape[1]:
+            return []
+        out = []
+        for i, c in enumerate(df.columns):
+            if not isinstance(c, str):
+                continue
+            try:
+                pa.Array.from_pandas(df.iloc[:, i])
+            except (pa.ArrowException, TypeError, ValueError):
+                continue
+            out.append(i)
+        return out
+
+    def evict(self):
+        """按最近访问时间淘汰快照，直到总大小不超过 max_bytes"""
+        if not self.snapshot_dir.exists():
+            return
+        entries = []
+        for meta in self.snapshot_dir.glob("*.json"):
+            paths = [meta] + [meta.with_suffix(s) for s in (".feather", ".pickle")]
+            try:
+                entries.append((meta.stat().st_mtime, sum(p.stat().st_size for p in paths if p.exists()), paths))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, paths in sorted(entries, key=lambda t: t[0]):
+            if total <= self.max_bytes:
+                break
+            for p in paths:
+                p.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        """清空全部快照"""
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
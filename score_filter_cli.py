@@ -0,0 +1,257 @@
+# score_filter_cli.py
+# -*- coding: utf-8 -*-
+"""
+命令行入口（无界面），用于服务器上的定时/批处理任务。不导入 tkinter / webbrowser。
+
+    python main.py 成绩/*.xlsx -o 输出 -j 4
+    python main.py 成绩目录 -r --json summary.json
+    python -m score_filter_cli "成绩/**/*.xls*" -r --no-cache --json -
+    python main.py 成绩目录 -o 输出 --report          # 另写出跨文件汇总预警表（按学生汇总）
+    python main.py 成绩目录 --watch -o 输出 -j 2      # 持续监视目录，新增/修改的文件自动处理（Ctrl+C 结束）
+    python main.py --dump-rules 规则.json             # 导出内置规则，修改后用 --rules 规则.json 处理
+
+输入可以是文件、目录或通配符；目录下只收集 .xlsx/.xls，跳过 Excel 的 ~$ 锁文件
+和本工具生成的“学业预警表_*”总表。处理日志写到 stderr，--json - 时汇总 JSON 写到 stdout。
+退出码：0 全部成功；1 有文件失败；2 未找到输入文件或参数（含规则配置）有误。
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from pathlib import Path
+
+from score_filter_core import process_files, DEFAULT_PUBCLASS_QUALIFIED_NUM
+from score_filter_io import READER_BACKENDS, EXCEL_WRITERS, is_input_candidate, report_path
+
+_GLOB_CHARS = set("*?[")
+
+
+class _DumpRulesAction(argparse.Action):
+    """--dump-rules PATH：写出内置规则配置后退出（不需要输入文件）"""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from score_filter_ruleset import dump_default_config
+        dump_default_config(values)
+        parser.exit(message=f"内置规则配置已写出: {values}\n")
+
+
+def discover_inputs(patterns, recursive=False):
+    """
+    文件 / 目录 / 通配符 -> 去重后的输入文件列表（保持给出顺序，目录内按路径排序）。
+    recursive: 目录递归查找子目录；通配符中的 ** 匹配任意层目录
+    """
+    found = []
+    seen = set()
+
+    def _add(p):
+        key = os.path.normcase(os.path.abspath(p))
+        if key not in seen:
+            seen.add(key)
+            found.append(Path(p))
+
+    for pattern in patterns:
+        p = Path(pattern)
+        if p.is_dir():
+            walk = p.rglob("*") if recursive else p.glob("*")
+            for q in sorted(q for q in walk if q.is_file() and is_input_candidate(q)):
+                _add(q)
+        elif _GLOB_CHARS & set(str(pattern)):
+            for q in sorted(glob.glob(str(pattern), recursive=recursive)):
+                if Path(q).is_file() and is_input_candidate(q):
+                    _add(q)
+        elif p.is_file():
+            # 显式给出的文件不做名称过滤；扩展名不支持时由 process_one_file 报告跳过
+            _add(p)
+    return found
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(
+        prog="score_filter_tool",
+        description="学业预警筛选（命令行模式）。不带参数运行 main.py 时启动图形界面。")
+    ap.add_argument("inputs", nargs="+", help="输入文件、目录或通配符（如 \"成绩/*.xlsx\"）")
+    ap.add_argument("-r", "--recursive", action="store_true", help="目录递归查找；通配符中的 ** 匹配多层目录")
+    ap.add_argument("-o", "--output-dir", default=None, help="统一输出目录（默认输出到各输入文件所在目录）")
+    ap.add_argument("-t", "--threshold", type=int, default=DEFAULT_PUBCLASS_QUALIFIED_NUM,
+                    help=f"公选课学分阈值（默认 {DEFAULT_PUBCLASS_QUALIFIED_NUM}）")
+    ap.add_argument("-j", "--workers", type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                    help="并行进程数（默认 CPU 核数-1）")
+    ap.add_argument("--divide-output", action="store_true", help="分开输出各规则 CSV")
+    ap.add_argument("--partition-col", default=None, help="分班列名（一个文件含多个班时指定，如“班级”）")
+    ap.add_argument("--chunksize", type=int, default=None, help="按块流式处理超大 .xlsx，每块行数")
+    ap.add_argument("--reader", default="auto", choices=["auto", *READER_BACKENDS], help="读取后端")
+    ap.add_argument("--writer", default="auto", choices=["auto", *EXCEL_WRITERS], help="xlsx 写出后端")
+    ap.add_argument("--format", dest="extra_formats", action="append", default=[],
+                    choices=["parquet", "feather"], help="额外输出总表的列式副本（可重复）")
+    ap.add_argument("--report", nargs="?", const="", default=None, metavar="PATH",
+                    help="写出跨文件汇总预警表（学生汇总 + 预警明细）；"
+                         "省略路径时写到输出目录（或第一个输入文件所在目录）下的“学业预警表_汇总.xlsx”")
+    rules = ap.add_argument_group("规则配置")
+    rules.add_argument("--rules", default=None, metavar="PATH",
+                       help="规则配置 JSON（列名、条件、阈值、来源规则文字、去重键；默认使用内置规则）")
+    rules.add_argument("--dump-rules", action=_DumpRulesAction, metavar="PATH",
+                       help="把内置规则写成 JSON 模板后退出")
+    watch = ap.add_argument_group("监视目录")
+    watch.add_argument("--watch", action="store_true",
+                       help="持续监视输入目录（只能给一个目录），处理新增或修改的工作簿，Ctrl+C 结束")
+    watch.add_argument("--poll-seconds", type=float, default=None, help="轮询间隔（秒，默认 1）")
+    watch.add_argument("--settle-seconds", type=float, default=None,
+                       help="文件大小与修改时间保持不变多久后才处理（秒，默认 2）")
+    cache = ap.add_argument_group("结果缓存")
+    cache.add_argument("--no-cache", action="store_true", help="不使用结果缓存")
+    cache.add_argument("--cache-dir", default=None, help="缓存目录（默认 ~/.score_filter_tool/cache）")
+    cache.add_argument("--refresh-cache", action="store_true", help="忽略已有缓存并重新写入")
+    cache.add_argument("--no-snapshot", action="store_true", help="不使用解析快照（每次重新解析 Excel）")
+    cache.add_argument("--snapshot-dir", default=None, help="快照目录（默认 ~/.score_filter_tool/snapshots）")
+    out = ap.add_argument_group("汇总与日志")
+    out.add_argument("--json", dest="json_path", default=None, help="汇总 JSON 写出路径；- 表示 stdout")
+    out.add_argument("--profile-jsonl", default=None, help="分阶段耗时/内存记录（JSON lines）写出路径")
+    out.add_argument("--profile", action="store_true", help="日志中输出分阶段耗时表（并记录峰值内存）")
+    out.add_argument("--progress", action="store_true", help="每完成一个文件输出进度、速率与剩余时间（stderr）")
+    out.add_argument("-q", "--quiet", action="store_true", help="不输出处理日志")
+    return ap
+
+
+def _jsonable(v):
+    if isinstance(v, Path):
+        return str(v)
+    if isinstance(v, dict):
+        return {str(k): _jsonable(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_jsonable(x) for x in v]
+    return v
+
+
+def summary_dict(ok, results, args, report=None):
+    """机器可读的批量汇总"""
+    return {
+        "ok": ok,
+        "threshold": args.threshold,
+        "output_dir": args.output_dir,
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r["success"]),
+        "failed": sum(1 for r in results if not r["success"]),
+        "cache_hits": sum(1 for r in results if r["outputs"].get("cache_hit")),
+        "report": None if report is None else str(report),
+        "files": [{
+            "file": str(r["file"]),
+            "success": r["success"],
+            "summary": r["summary"],
+            "outputs": _jsonable({k: v for k, v in r["outputs"].items() if k != "profile"}),
+            "profile": r.get("profile"),
+        } for r in results],
+    }
+
+
+def _make_cache(args):
+    if args.no_cache:
+        return None
+    from score_filter_cache import ResultCache, DEFAULT_CACHE_DIR
+    return ResultCache(args.cache_dir or DEFAULT_CACHE_DIR, refresh=args.refresh_cache)
+
+
+def _make_snapshots(args):
+    if args.no_snapshot:
+        return None
+    from score_filter_cache import SnapshotStore, DEFAULT_SNAPSHOT_DIR
+    return SnapshotStore(args.snapshot_dir or DEFAULT_SNAPSHOT_DIR)
+
+
+def _load_rules(parser, args):
+    """--rules：批处理开始前编译一次；配置有误时报错退出（退出码 2）"""
+    if args.rules is None:
+        return None
+    from score_filter_ruleset import load_ruleset
+    try:
+        return load_ruleset(args.rules)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+
+def _watch_main(args, log, ruleset=None):
+    """--watch：监视单个目录直到 Ctrl+C；退出码 0，目录不存在时为 2"""
+    from score_filter_watch import watch_folder, DEFAULT_POLL_SECONDS, DEFAULT_SETTLE_SECONDS
+    if len(args.inputs) != 1 or not Path(args.inputs[0]).is_dir():
+        log("--watch 需要且只能指定一个输入目录。")
+        return 2
+    if args.report is not None or args.json_path or args.profile_jsonl:
+        log("--watch 模式不支持 --report / --json / --profile-jsonl，已忽略。")
+    err = sys.stderr
+
+    def result(r):
+        if args.progress and err is not None:
+            print(f"{'成功' if r['success'] else '失败'} {r['file'].name}", file=err, flush=True)
+
+    watch_folder(
+        args.inputs[0], log_fn=log, workers=args.workers, recursive=args.recursive,
+        poll_seconds=args.poll_seconds or DEFAULT_POLL_SECONDS,
+        settle_seconds=DEFAULT_SETTLE_SECONDS if args.settle_seconds is None else args.settle_seconds,
+        result_fn=result, pubclass_qualified_num=args.threshold, divide_output=args.divide_output,
+        output_dir=args.output_dir, reader=args.reader, cache=_make_cache(args), chunksize=args.chunksize,
+        partition_col=args.partition_col, writer=args.writer,
+        extra_formats=tuple(dict.fromkeys(args.extra_formats)), trace_memory=args.profile,
+        snapshots=_make_snapshots(args), ruleset=ruleset,
+    )
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    ruleset = _load_rules(parser, args)
+    # 打包为窗口程序时没有控制台，stderr 可能为 None
+    err = sys.stderr
+
+    def log(s=""):
+        if not args.quiet and err is not None:
+            print(s, file=err, flush=True)
+
+    if args.watch:
+        return _watch_main(args, log, ruleset)
+
+    files = discover_inputs(args.inputs, recursive=args.recursive)
+    if not files:
+        log("未找到输入文件（.xlsx/.xls）。")
+        return 2
+
+    cache = _make_cache(args)
+
+    def progress(e):
+        if e["kind"] == "file" and err is not None:
+            eta = "-" if e["eta_seconds"] is None else f"{e['eta_seconds']:.0f}s"
+            print(f"[{e['done']}/{e['total']}] {'成功' if e['success'] else '失败'} {e['file'].name}"
+                  f"  {e['files_per_sec']:.2f} 文件/秒  剩余约 {eta}", file=err, flush=True)
+
+    snapshots = _make_snapshots(args)
+
+    report = None
+    if args.report is not None:
+        report = Path(args.report) if args.report else report_path(args.output_dir or files[0].parent)
+
+    log(f"开始批量处理（{len(files)} 个文件）...")
+    ok, combined, results = process_files(
+        files, pubclass_qualified_num=args.threshold, divide_output=args.divide_output,
+        output_dir=args.output_dir, log_fn=log, workers=args.workers, reader=args.reader, cache=cache,
+        chunksize=args.chunksize, partition_col=args.partition_col, writer=args.writer,
+        extra_formats=tuple(dict.fromkeys(args.extra_formats)),
+        trace_memory=args.profile, profile_jsonl=args.profile_jsonl, show_profile=args.profile,
+        progress_fn=progress if args.progress else None, snapshots=snapshots, report_path=report,
+        ruleset=ruleset,
+    )
+    log("\n=== 批量汇总 ===")
+    log(combined)
+
+    if args.json_path:
+        text = json.dumps(summary_dict(ok, results, args, report), ensure_ascii=False, indent=2, default=str)
+        if args.json_path == "-":
+            if sys.stdout is not None:
+                print(text)
+        else:
+            Path(args.json_path).write_text(text, encoding="utf-8")
+            log(f"汇总 JSON 已写出: {args.json_path}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,237 +1,617 @@
 # score_filter_core.py
 # -*- coding: utf-8 -*-
 from pathlib import Path
-import pandas as pd
+import multiprocessing
+import queue
+import time
 import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack
 
-# 显式导入 openpyxl，便于 PyInstaller 收集
-try:
-    import openpyxl  # noqa: F401
-except Exception:
-    pass
+from score_filter_io import (
+    SUPPORTED_EXTS, read_excel, resolve_reader, resolve_writer, export_paths, safe_sheet_names, write_excel,
+    write_table,
+)
+from score_filter_cache import FrameStore
+from score_filter_profile import (
+    NULL_PROFILER, StageProfiler, aggregate_profiles, format_profile_table, write_profile_jsonl,
+)
+# 规则引擎、汇总表等依赖 pandas / numpy 的模块在处理时才导入（见各函数）：导入本模块很快，
+# 图形界面先显示窗口，再用 preload_modules 在后台加载
 
 DEFAULT_PUBCLASS_QUALIFIED_NUM = 10
-SUPPORTED_EXTS = {".xlsx", ".xls"}
-
-def find_col_exact(columns, wanted):
-    for c in columns:
-        if str(c) == wanted:
-            return c
-    return None
-
-def _read_excel_auto(path):
-    """按扩展名自动选择引擎：.xlsx -> openpyxl；.xls -> xlrd（如需支持请自行安装xlrd==1.2.0）"""
-    ext = Path(path).suffix.lower()
-    if ext == ".xlsx":
-        return pd.read_excel(path, dtype={0: str}, engine="openpyxl")
-    elif ext == ".xls":
+_POLL_SECONDS = 0.2  # 进程池模式下检查取消与转发阶段进度的间隔
+# 处理时用到的重模块；可选的读写后端未安装时跳过
+PRELOAD_MODULES = (
+    "pandas", "numpy", "score_filter_rules", "score_filter_ruleset", "score_filter_report",
+    "score_filter_stream", "python_calamine", "openpyxl", "xlsxwriter",
+)
+
+def preload_modules(names=PRELOAD_MODULES):
+    """预先导入处理所需的模块（可在后台线程调用），返回 {模块名: 耗时秒}；未安装的模块记为 None"""
+    timings = {}
+    for name in names:
+        t0 = time.perf_counter()
         try:
-            import xlrd  # noqa: F401
-        except Exception as e:
-            raise RuntimeError("检测到 .xls 文件，但未安装 xlrd==1.2.0；"
-                               "建议先将 .xls 另存为 .xlsx，或安装 xlrd==1.2.0 再试。") from e
-        return pd.read_excel(path, dtype={0: str}, engine="xlrd")
-    else:
-        raise ValueError("仅支持 .xlsx 或 .xls")
+            __import__(name)
+        except ImportError:
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - t0
+    return timings
+
+# 已移到 score_filter_rules 的函数，仍可从本模块导入；按需加载，不拖慢本模块的导入
+_RULES_EXPORTS = ("find_col_exact",)
+
+def __getattr__(name):
+    if name in _RULES_EXPORTS:
+        import score_filter_rules
+        return getattr(score_filter_rules, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _resolve_ruleset(ruleset):
+    """None -> 内置规则"""
+    if ruleset is None:
+        from score_filter_ruleset import DEFAULT_RULESET
+        return DEFAULT_RULESET
+    return ruleset
+
+def _read_with_snapshot(path, backend="auto", columns=None, snapshots=None):
+    """返回 (DataFrame, 来源说明)；来源为读取后端名，或“快照”"""
+    if snapshots is None:
+        return read_excel(path, backend=backend, columns=columns)
+    params = {"reader": resolve_reader(path, backend), "columns": sorted(map(str, columns)) if columns else None}
+    df = snapshots.load(path, params)
+    if df is not None:
+        return df, "快照"
+    df, used = read_excel(path, backend=backend, columns=columns)
+    fmt = snapshots.save(path, params, df)
+    return df, used if fmt is None else f"{used}，已保存 {fmt} 快照"
+
+def _resolve_partition(df, partition_col, log):
+    """分班列 -> (分班编号数组, 分班名列表, 实际列名)；未指定分班列时返回 (None, None, None)"""
+    if not partition_col:
+        return None, None, None
+    from score_filter_rules import find_col_exact, partition_codes
+    col = find_col_exact(df.columns, partition_col)
+    if col is None:
+        raise ValueError(f"未找到分班列：{partition_col}")
+    groups, names = partition_codes(df[col])
+    log(f"按 '{col}' 分班：{len(names)} 个班")
+    return groups, names, col
+
+def _load_prepared(infile, log, reader="auto", partition_col=None, profiler=NULL_PROFILER, snapshots=None,
+                   ruleset=None, compact=False):
+    """
+    读取、列识别、数值化与分班，并按规则配置 ruleset 计算与阈值无关的规则结果（evaluate_base）。
+    返回的 dict 可保存在 FrameStore 中，阈值变化时直接交给 _export_prepared：
+        df, cols, valid, groups, group_names, group_col, base,
+        dtypes: 写出时还原的列类型（compact_frame 压缩前的类型；normalize_frame 给出的导出类型）
+    compact: 为 True 时压缩内存（compact_frame）。只在结果要常驻 FrameStore 时使用：
+        单次处理时压缩与写出前还原的开销大于规则计算省下的时间
+    """
+    from score_filter_rules import detect_columns, normalize_frame, compact_frame, evaluate_base
+    ruleset = _resolve_ruleset(ruleset)
+    with profiler.stage("read") as rec:
+        df, reader_used = _read_with_snapshot(infile, reader, snapshots=snapshots)
+        rec["rows"] = len(df)
+    log(f"读取文件: {infile}（{reader_used}）")
+
+    # 关键列
+    with profiler.stage("columns"):
+        cols = detect_columns(df.columns, ruleset)
+    log(f"列识别: 学号={cols['student_id']}, 成绩={cols.get('score')}, 学分={cols.get('credit')}")
+
+    # 数值化 + 过滤“一层节点=其它”（以掩码参与计算，不复制整表）
+    with profiler.stage("filter") as rec:
+        valid, export_dtypes = normalize_frame(df, cols, ruleset)
+        # 常驻时重复字符串列转 categorical、成绩/学分无损降精度：内存更小，重算规则一更快
+        dtypes = {**(compact_frame(df, cols, ruleset) if compact else {}), **export_dtypes}
+        groups, group_names, group_col = _resolve_partition(df, partition_col, log)
+        rec["rows"] = int(valid.sum())
+    if ruleset.exclude_present(cols):
+        log(f"已过滤 {ruleset.exclude_label}：{len(df)} -> {int(valid.sum())}")
+
+    # 共享掩码只算一次；分班时一次分组完成所有班级
+    base = evaluate_base(df, cols, valid=valid, groups=groups, profiler=profiler, ruleset=ruleset)
+    return {"df": df, "cols": cols, "valid": valid, "groups": groups, "group_names": group_names,
+            "group_col": group_col, "base": base, "dtypes": dtypes}
+
+def _export_prepared(prepared, infile, pubclass_qualified_num, divide_output, out_dir, log,
+                     writer="auto", extra_formats=(), profiler=NULL_PROFILER, report=False,
+                     ruleset=None):
+    """
+    在 _load_prepared 的结果上按阈值计算规则一、去重并写出。prepared 不会被修改。
+    report: 为 True 时另返回总表行的精简记录（report_records，供跨文件汇总）
+    ruleset: 须与 _load_prepared 所用的规则配置相同
+    返回 dict:
+        class_size, not_offered, xlsx, 各规则 CSV（csv_<规则 id>，内置为 csv_rule1..3）,
+        stats: {规则编号: (记录数, 学生数)},
+        groups: 分班时为 [{"name", "class_size", "not_offered"}]，否则为 None,
+        writers: {产物键: 写出器名},
+        extra: {格式: 路径}（parquet / feather 副本）,
+        report_records: list[dict] | None
+    """
+    from score_filter_rules import (
+        apply_rule1, dedup_columns, dedup_positions, take_labeled, log_not_offered, restore_dtypes,
+    )
+    from score_filter_report import report_records
+    ruleset = _resolve_ruleset(ruleset)
+    df, cols = prepared["df"], prepared["cols"]
+    groups, group_names, group_col = prepared["groups"], prepared["group_names"], prepared["group_col"]
+    student_id_col = cols["student_id"]
+
+    res = apply_rule1(prepared["base"], pubclass_qualified_num, profiler=profiler)
+    codes, export_pos = res["codes"], res["export_pos"]
+    class_size = res["class_size"]
+    not_offered_sorted = res["not_offered"]
+    log(f"班级总人数: {class_size}")
+    group_info = None
+    if groups is not None:
+        group_info = [{"name": name, "class_size": int(res["class_sizes"][g]),
+                       "not_offered": res["not_offered_by_group"].get(g, [])}
+                      for g, name in enumerate(group_names)]
+
+    sid = df[student_id_col]
+    stats = {}
+    for rule in ruleset.rules:
+        mask = codes == rule.code
+        stats[rule.code] = (int(mask.sum()), sid[mask].nunique())
+    # 按配置顺序输出各规则统计；未开设课程列在对应规则（规则二）之前
+    for rule in ruleset.rules:
+        if rule.not_offered:
+            prefix = ruleset.not_offered_prefix
+            if group_info is None:
+                log_not_offered(log, not_offered_sorted, prefix=prefix)
+            else:
+                for info in group_info:
+                    log_not_offered(log, info["not_offered"], prefix=f"{prefix}[{info['name']}] ")
+        log(ruleset.log_line(rule, stats))
+
+    # 去重（按导出顺序保留首条），最后一次性取出整行
+    subset_cols = dedup_columns(cols, group_col, ruleset)
+    with profiler.stage("dedup") as rec:
+        final_pos = dedup_positions(df, export_pos, subset_cols)
+        # 整行只在这里取出一次，并还原为读取时的列类型
+        df_final = restore_dtypes(take_labeled(df, final_pos, codes, pubclass_qualified_num, ruleset),
+                                  prepared["dtypes"])
+        rec["rows"] = len(df_final)
+    log(f"去重 {subset_cols}: {len(export_pos)} -> {len(final_pos)}")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with profiler.stage("write", rows=len(df_final)):
+        # 文件名
+        paths = export_paths(infile, out_dir, pubclass_qualified_num, ruleset)
+        out_xlsx_final = paths["xlsx"]
+        if group_info:
+            # 每班一个工作表（班级顺序与导出顺序一致）
+            final_groups = groups[final_pos]
+            sheets = [(sheet, df_final[final_groups == g])
+                      for g, sheet in enumerate(safe_sheet_names(group_names))]
+        else:
+            sheets = [("Sheet1", df_final)]
+        writers = {"xlsx": write_excel(out_xlsx_final, sheets, backend=writer)}
+        log(f"总表已导出: {out_xlsx_final}（{writers['xlsx']}）")
+
+        extra = {}
+        # 列式副本使用与分块模式相同的固定 schema（见 score_filter_io.TableStreamWriter）
+        numeric = [cols[k] for k in ruleset.numeric_keys if cols.get(k) is not None]
+        integer = [c for c in numeric if df_final[c].dtype.kind in "iu"]
+        for fmt in extra_formats:
+            writers[fmt] = write_table(df_final, paths[fmt], fmt, numeric_columns=numeric, integer_columns=integer)
+            extra[fmt] = paths[fmt]
+            log(f"{fmt} 已导出: {paths[fmt]}")
+
+        csvs = {rule.output_key: None for rule in ruleset.rules}
+        if divide_output:
+            # 分规则 CSV 不去重，按导出顺序排列：分班时先按班级，规则二再按课程，其余保持原行序
+            # （与 score_filter_stream 的分块结果一致）
+            def _rule_csv(code, key):
+                pos = export_pos[codes[export_pos] == code]
+                if len(pos) == 0:
+                    return None
+                path = paths[key]
+                rows = restore_dtypes(take_labeled(df, pos, codes, pubclass_qualified_num, ruleset),
+                                      prepared["dtypes"])
+                writers[key] = write_table(rows, path, "csv")
+                return path
+
+            for rule in ruleset.rules:
+                csvs[rule.output_key] = _rule_csv(rule.code, rule.output_key)
+            log("分规则 CSV 已输出（divide_output=True）")
+
+    records = report_records(df_final, cols, pubclass_qualified_num, group_col, ruleset) if report else None
+    return {"class_size": class_size, "stats": stats, "not_offered": not_offered_sorted,
+            "groups": group_info, "writers": writers, "extra": extra, "report_records": records,
+            "xlsx": out_xlsx_final, **csvs}
+
+def _rules_param(params, ruleset):
+    """自定义规则配置参与缓存键（内置规则不加，已有缓存仍可命中）"""
+    if ruleset is not None and not ruleset.is_default:
+        params["rules"] = ruleset.digest
+    return params
+
+def _frame_key(infile, reader, partition_col, ruleset=None):
+    return FrameStore.make_key(infile, _rules_param({"reader": reader, "partition_col": partition_col}, ruleset))
+
+def _in_store(frame_store, infile, reader, partition_col, ruleset=None):
+    try:
+        return _frame_key(infile, reader, partition_col, ruleset) in frame_store
+    except OSError:
+        return False
 
 def process_one_file(infile_path, pubclass_qualified_num=DEFAULT_PUBCLASS_QUALIFIED_NUM,
-                     divide_output=False, output_dir: str | Path | None = None, log_fn=None):
+                     divide_output=False, output_dir: str | Path | None = None, log_fn=None,
+                     reader="auto", cache=None, chunksize=None, partition_col=None,
+                     writer="auto", extra_formats=(), trace_memory=False, stage_fn=None, frame_store=None,
+                     snapshots=None, report_records=False, ruleset=None):
     """
     处理单个文件。返回 (success: bool, summary: str, outputs: dict)
+    reader: 读取后端（auto / calamine / openpyxl / xlrd，见 score_filter_io）
+    cache:  ResultCache 实例（见 score_filter_cache）；输入与参数未变化时直接返回缓存结果
+    chunksize: 指定时按块流式处理（仅 .xlsx，见 score_filter_stream），内存占用与文件大小无关；
+               用于全校汇总导出等超大文件
+    partition_col: 分班列名（如“班级”）；指定时按班分别计算班级人数与“未开设”课程，
+                   总表每班一个工作表
+    writer: xlsx 写出后端（auto / xlsxwriter / openpyxl / pandas，见 score_filter_io）
+    extra_formats: 额外输出总表的列式副本，如 ("parquet",) 或 ("parquet", "feather")
+    trace_memory: 记录各阶段峰值内存（tracemalloc，有额外开销）；耗时与行数始终记录
+    stage_fn: 每进入一个处理阶段时调用 stage_fn(阶段名)，用于进度显示
+    frame_store: FrameStore 实例（见 score_filter_cache）；保存已解析的数据，同一文件再次处理
+                 （如只改阈值）时跳过读取与规则二/三，仅重算规则一、去重与写出。分块模式不使用
+    snapshots: SnapshotStore 实例（见 score_filter_cache）；源文件未变化时加载列式快照代替解析 Excel。
+               分块模式不使用
+    report_records: 为 True 时 outputs 另含 "report_records"：总表行的精简记录
+                    （见 score_filter_report.report_records），供 process_files 构建跨文件汇总
+    ruleset: 编译后的规则配置（见 score_filter_ruleset.load_ruleset）；None 为内置规则
     outputs: {
         "xlsx": Path,
         "csv_rule1": Path|None,
         "csv_rule2": Path|None,
-        "csv_rule3": Path|None,
-        "not_offered_courses": list[str]
+        "csv_rule3": Path|None,  （自定义规则时为 csv_<规则 id>）
+        "not_offered_courses": list[str],
+        "not_offered_by_class": dict[str, list[str]]（仅分班时）,
+        "parquet" / "feather": Path（仅 extra_formats 指定时）,
+        "writers": dict[str, str]  产物键 -> 写出器名,
+        "cache_hit": bool,
+        "report_records": list[dict]（仅 report_records=True 时）,
+        "profile": dict  各阶段耗时/行数/峰值内存（见 score_filter_profile）
     }
     """
+    profiler = StageProfiler(trace_memory, on_stage=stage_fn)
     try:
         def log(s=""):
             if log_fn: log_fn(s)
             else: print(s)
 
+        ruleset = _resolve_ruleset(ruleset)
         infile = Path(infile_path)
         if infile.suffix.lower() not in SUPPORTED_EXTS:
             return False, f"跳过（不支持的扩展名）：{infile.name}", {}
 
-        log(f"读取文件: {infile}")
-        df = _read_excel_auto(infile)
-        cols = list(df.columns)
-
-        # 关键列
-        student_id_col = cols[0]
-        course_type_col = find_col_exact(cols, "一层节点")
-        course_name_col = find_col_exact(cols, "课程名称")
-        credit_col      = find_col_exact(cols, "获得学分")
-        score_col       = find_col_exact(cols, "成绩")
-        log(f"列识别: 学号={student_id_col}, 成绩={score_col}, 学分={credit_col}")
-
-        # 过滤“一层节点=其它”
-        if course_type_col is not None:
-            before = len(df)
-            df = df.loc[df[course_type_col].astype(str) != "其它"].copy()
-            log(f"已过滤 '其它' 行：{before} -> {len(df)}")
-
-        # 数值化
-        for c in [score_col, credit_col]:
-            if c in df.columns:
-                df[c] = pd.to_numeric(df[c], errors="coerce")
-
-        # 班级人数
-        class_size = df[student_id_col].nunique(dropna=True)
-        log(f"班级总人数: {class_size}")
-
-        # 公选/非公选
-        if course_type_col is not None:
-            is_public = df[course_type_col].astype(str).str.contains("公共选修课", na=False)
-        else:
-            is_public = pd.Series(False, index=df.index)
-
-        # 规则一：公选 & 学分<阈值 & 成绩<60/空
-        if (credit_col is not None) and (score_col is not None):
-            df_public_lt = df.loc[
-                is_public &
-                (df[credit_col] < pubclass_qualified_num) &
-                ((df[score_col] < 60) | (df[score_col].isna()))
-            ].copy()
-        else:
-            df_public_lt = pd.DataFrame(columns=df.columns)
-        public_count = df_public_lt[student_id_col].nunique()
-        log(f"规则一：学生数 {public_count}，记录 {len(df_public_lt)}")
-
-        # 规则二：非公选 & 成绩为空/0（需关注；若全班该课空/0，则视作未开设而不导出）
-        not_public = ~is_public
-        if score_col is not None:
-            zero_like = df[score_col].isna() | (df[score_col] == 0)
-            unpub_zero_rows = df.loc[not_public & zero_like].copy()
-        else:
-            unpub_zero_rows = pd.DataFrame(columns=df.columns)
-        export_zero_rows = pd.DataFrame(columns=df.columns)
-        not_offered_names = []
-
-        if not unpub_zero_rows.empty and (course_name_col is not None):
-            zero_counts = unpub_zero_rows.groupby(course_name_col)[student_id_col].nunique()
-            for course, cnt in zero_counts.items():
-                if cnt == class_size:
-                    not_offered_names.append(str(course))  # 全员空/0 -> 未开设
-                else:
-                    export_zero_rows = pd.concat(
-                        [export_zero_rows, unpub_zero_rows[unpub_zero_rows[course_name_col] == course]],
-                        axis=0
-                    )
-        else:
-            export_zero_rows = unpub_zero_rows.copy()
-
-        # ✅ 日志中输出未开设课程名称（全部列出）
-        if not_offered_names:
-            # 去重并排序再输出更美观
-            not_offered_sorted = sorted(set(map(str, not_offered_names)))
-            log(f"规则二：未开设课程（{len(not_offered_sorted)}）：")
-            for name in not_offered_sorted:
-                log(f"  - {name}")
-        else:
-            log("规则二：未开设课程（0）")
-
-        log(f"规则二：需关注记录 {len(export_zero_rows)}")
-
-        # 规则三：非公选 & 非空/0 & 成绩<60
-        if score_col is not None:
-            remaining = df.loc[not_public & ~(df[score_col].isna() | (df[score_col] == 0))].copy()
-            fail_rows = remaining.loc[(remaining[score_col] < 60)].copy()
-        else:
-            fail_rows = pd.DataFrame(columns=df.columns)
-        log(f"规则三：不及格人数 {fail_rows[student_id_col].nunique()}，记录 {len(fail_rows)}")
-
-        # 标签
-        if not df_public_lt.empty:
-            df_public_lt['来源规则'] = f'规则一: 公选 学分<{pubclass_qualified_num} 且 成绩<60/空'
-        if not export_zero_rows.empty:
-            export_zero_rows['来源规则'] = '规则二: 非公选 正常开设 成绩0分/空白'
-        if not fail_rows.empty:
-            fail_rows['来源规则'] = '规则三: 非公选 正常开设 0<成绩<60'
-
-        # 合并 + 去重
-        df_final = pd.concat([export_zero_rows, fail_rows, df_public_lt], ignore_index=True)
-
-        def _maybe_get_term_col(df_):
-            for name in ['学年学期', '学期', '建议修读学年']:
-                if name in df_.columns:
-                    return name
-            return None
-
-        subset_cols = [c for c in [student_id_col, course_name_col, _maybe_get_term_col(df)] if c and c in df_final.columns]
-        if subset_cols:
-            before = len(df_final)
-            df_final = df_final.drop_duplicates(subset=subset_cols, keep='first')
-            log(f"去重 {subset_cols}: {before} -> {len(df_final)}")
-
         # 输出目录
         out_dir = Path(output_dir) if output_dir else infile.parent
-        out_dir.mkdir(parents=True, exist_ok=True)
 
-        # 文件名
-        out_xlsx_final = out_dir / f"学业预警表_{infile.stem}.xlsx"
-        df_final.to_excel(out_xlsx_final, index=False)
-        log(f"总表已导出: {out_xlsx_final}")
+        cache_key = None
+        if cache is not None:
+            # 影响导出文件内容的参数都参与键：写出后端不同，xlsx 字节与 outputs["writers"] 也不同
+            params = {"pubclass_qualified_num": pubclass_qualified_num,
+                      "divide_output": bool(divide_output),
+                      "partition_col": partition_col,
+                      "writer": resolve_writer(writer),
+                      "streaming": bool(chunksize),
+                      "extra_formats": sorted(extra_formats)}
+            if report_records:
+                # 带汇总记录的条目单独缓存，保证命中时记录齐全
+                params["report_records"] = True
+            cache_key = cache.make_key(infile, _rules_param(params, ruleset))
+            with profiler.stage("cache"):
+                hit = cache.get(cache_key, out_dir)
+            if hit is not None:
+                summary, outputs = hit
+                outputs["cache_hit"] = True
+                outputs["profile"] = profiler.to_dict()
+                log(f"命中缓存，跳过处理: {infile}")
+                log(f"总表已恢复: {outputs.get('xlsx')}")
+                return True, summary, outputs
 
-        csv1 = csv2 = csv3 = None
-        if divide_output:
-            if not df_public_lt.empty:
-                csv1 = out_dir / f"{infile.stem}_公选_学分小于{pubclass_qualified_num}.csv"
-                df_public_lt.to_csv(csv1, index=False, encoding="utf-8-sig")
-            if not export_zero_rows.empty:
-                csv2 = out_dir / f"{infile.stem}_其他_0分需关注.csv"
-                export_zero_rows.to_csv(csv2, index=False, encoding="utf-8-sig")
-            if not fail_rows.empty:
-                csv3 = out_dir / f"{infile.stem}_其他_不及格小于60.csv"
-                fail_rows.to_csv(csv3, index=False, encoding="utf-8-sig")
-            log("分规则 CSV 已输出（divide_output=True）")
+        if chunksize:
+            from score_filter_stream import process_streaming
+            res = process_streaming(infile, pubclass_qualified_num, divide_output, out_dir, log, chunksize,
+                                    partition_col=partition_col, writer=writer, extra_formats=extra_formats,
+                                    profiler=profiler, report=report_records, ruleset=ruleset)
+        else:
+            prepared = frame_key = None
+            if frame_store is not None:
+                frame_key = _frame_key(infile, reader, partition_col, ruleset)
+                prepared = frame_store.get(frame_key)
+                if prepared is not None:
+                    log(f"复用内存中已解析的数据（仅重算规则一）: {infile}")
+            if prepared is None:
+                prepared = _load_prepared(infile, log, reader=reader, partition_col=partition_col,
+                                          profiler=profiler, snapshots=snapshots, ruleset=ruleset,
+                                          compact=frame_store is not None)
+                if frame_store is not None:
+                    frame_store.put(frame_key, prepared)
+            res = _export_prepared(prepared, infile, pubclass_qualified_num, divide_output, out_dir, log,
+                                   writer=writer, extra_formats=extra_formats, profiler=profiler,
+                                   report=report_records, ruleset=ruleset)
+        stats = res["stats"]
+        not_offered_sorted = res["not_offered"]
+        out_xlsx_final = res["xlsx"]
 
         # 汇总
-        not_offered_sorted = sorted(set(map(str, not_offered_names)))
-        noff_str = ("无" if not not_offered_sorted else "、".join(not_offered_sorted))
-        summary = (
-            f"文件：{infile.name}\n"
-            f"班级总人数: {class_size}\n"
-            f"规则一: 学分<{pubclass_qualified_num} 且 成绩<60/空 - 学生数 {public_count}, 记录 {len(df_public_lt)}\n"
-            f"规则二: 需关注记录 {len(export_zero_rows)}, 未开设课程 {len(not_offered_sorted)}：{noff_str}\n"
-            f"规则三: 不及格人数 {fail_rows[student_id_col].nunique()}, 记录 {len(fail_rows)}\n"
-            f"输出文件: {out_xlsx_final}"
-        )
+        summary = "\n".join([
+            f"文件：{infile.name}",
+            f"班级总人数: {res['class_size']}",
+            *ruleset.summary_lines(stats, pubclass_qualified_num, not_offered_sorted),
+            f"输出文件: {out_xlsx_final}",
+        ])
+        if res["groups"]:
+            summary += f"\n分班（{len(res['groups'])}）："
+            for info in res["groups"]:
+                noff = "、".join(info["not_offered"]) or "无"
+                summary += f"\n  {info['name']}：人数 {info['class_size']}，未开设课程 {len(info['not_offered'])}：{noff}"
 
         outputs = {
             "xlsx": out_xlsx_final,
-            "csv_rule1": csv1,
-            "csv_rule2": csv2,
-            "csv_rule3": csv3,
-            "not_offered_courses": not_offered_sorted
+            **{rule.output_key: res[rule.output_key] for rule in ruleset.rules},
+            "not_offered_courses": not_offered_sorted,
+            **res["extra"],
+            "writers": res["writers"],
+            "cache_hit": False
         }
+        if res["groups"]:
+            outputs["not_offered_by_class"] = {info["name"]: info["not_offered"] for info in res["groups"]}
+        if report_records:
+            outputs["report_records"] = res["report_records"]
+        if cache is not None:
+            cache.put(cache_key, summary, outputs)
+        # 不写入缓存：每次运行的耗时各不相同
+        outputs["profile"] = profiler.to_dict()
         return True, summary, outputs
 
     except Exception:
         tb = traceback.format_exc()
         if log_fn: log_fn(tb)
         return False, tb, {}
+    finally:
+        profiler.close()
+
+def process_one_collect(infile_path, kwargs, stage_queue=None, frame_store=None, keep_frames=None):
+    """
+    process_one_file 的进程池入口：日志收集为列表而不是回调，返回 (success, summary, outputs, logs, frames)
+    kwargs: 传给 process_one_file 的参数（须可 pickle）
+    stage_queue: 跨进程队列（Manager().Queue()）；进入各阶段时放入 (文件, 阶段名)
+    frame_store: 在本进程内调用时直接使用的 FrameStore
+    keep_frames: 子进程用；为字节上限时把解析出的数据作为 frames [(键, 数据)] 带回父进程保存"""
+    logs = []
+    stage_fn = None
+    if stage_queue is not None:
+        stage_fn = lambda stage: stage_queue.put((str(infile_path), stage))
+    if keep_frames is not None:
+        frame_store = FrameStore(keep_frames)
+    success, summary, outputs = process_one_file(infile_path, log_fn=logs.append, stage_fn=stage_fn,
+                                                 frame_store=frame_store, **kwargs)
+    frames = frame_store.items() if keep_frames is not None else []
+    return success, summary, outputs, logs, frames
+
+class _BatchProgress:
+    """批量进度：已完成文件数、速率与剩余时间估计，转为事件 dict 交给 progress_fn"""
+
+    def __init__(self, total, progress_fn):
+        self.total = total
+        self.done = 0
+        self.progress_fn = progress_fn
+        self.t0 = time.perf_counter()
+
+    def _emit(self, kind, file, **extra):
+        if self.progress_fn is None:
+            return
+        elapsed = time.perf_counter() - self.t0
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else None
+        self.progress_fn({"kind": kind, "file": Path(file), "done": self.done, "total": self.total,
+                          "elapsed": elapsed, "files_per_sec": rate, "eta_seconds": eta, **extra})
+
+    def stage(self, file, stage):
+        self._emit("stage", file, stage=stage)
+
+    def file_done(self, file, success):
+        self.done += 1
+        self._emit("file", file, success=success)
 
 def process_files(infiles, pubclass_qualified_num=DEFAULT_PUBCLASS_QUALIFIED_NUM,
-                  divide_output=False, output_dir: str | Path | None = None, log_fn=None):
+                  divide_output=False, output_dir: str | Path | None = None, log_fn=None,
+                  workers: int = 1, reader="auto", cache=None, chunksize=None, partition_col=None,
+                  writer="auto", extra_formats=(), trace_memory=False, profile_jsonl=None,
+                  show_profile=False, progress_fn=None, cancel_event=None, frame_store=None, snapshots=None,
+                  report_path=None, ruleset=None):
     """
     批量处理。返回 (ok_overall: bool, combined_summary: str, results: list[dict])
-    results: 每个元素为 {"file": Path, "success": bool, "summary": str, "outputs": dict}
+    results: 每个元素为 {"file": Path, "success": bool, "summary": str, "outputs": dict, "profile": dict|None}
+    workers: 并行进程数；<=1 时在当前进程内串行处理，>1 时使用进程池，
+             各文件日志按输入顺序回放给 log_fn。
+    cache:   ResultCache 实例；命中的文件直接复用上次的导出结果。
+    chunksize: 传给 process_one_file，按块流式处理大文件。
+    partition_col: 传给 process_one_file，单个工作簿内按分班列分别处理。
+    writer / extra_formats: 传给 process_one_file，选择写出后端与额外的列式输出。
+    trace_memory: 传给 process_one_file，记录各阶段峰值内存。
+    profile_jsonl: 指定路径时，每个文件的分阶段记录写为一行 JSON，最后一行为汇总。
+    show_profile: 在日志中输出每个文件及整批的分阶段耗时表。
+    progress_fn: 进度回调，参数为 dict：
+                 {"kind": "stage" | "file", "file": Path, "done": 已完成文件数, "total": 文件总数,
+                  "elapsed": 秒, "files_per_sec": float, "eta_seconds": float|None,
+                  "stage": 阶段名（kind="stage"）, "success": bool（kind="file"）}
+                 进程池模式下阶段事件经 Manager 队列从子进程转发。在处理线程中调用。
+    cancel_event: threading.Event 等；置位后不再开始新文件，已在处理的文件会完成，
+                  返回已完成部分的结果（此时 ok_overall 为 False）。
+    frame_store: FrameStore 实例；已保存过的文件在本进程内直接复用（只重算规则一），
+                 其余文件在子进程解析后把数据带回保存。
+    snapshots: SnapshotStore 实例；传给 process_one_file，复用磁盘上的列式快照。
+    report_path: 指定路径时生成跨文件汇总预警表（见 score_filter_report）：各文件完成时并入其预警行，
+                 全部结束后写出一次（取消时为已完成部分）。
+    ruleset: 规则配置——编译后的 RuleSet，或 JSON 配置文件路径（在这里编译一次，整批共用）；
+             None 为内置规则。
     """
+    infiles = list(infiles)
+    if isinstance(ruleset, (str, Path)):
+        from score_filter_ruleset import load_ruleset
+        ruleset = load_ruleset(ruleset)
+    kwargs = dict(pubclass_qualified_num=pubclass_qualified_num,
+                  divide_output=divide_output, output_dir=output_dir, reader=reader,
+                  cache=cache, chunksize=chunksize, partition_col=partition_col,
+                  writer=writer, extra_formats=tuple(extra_formats), trace_memory=trace_memory,
+                  snapshots=snapshots, report_records=report_path is not None, ruleset=ruleset)
+    report = None
+    if report_path is not None:
+        from score_filter_report import WarningReport
+        report = WarningReport(pubclass_qualified_num, ruleset)
     results = []
     ok_all = True
-    for p in infiles:
-        success, summary, outputs = process_one_file(
-            p, pubclass_qualified_num=pubclass_qualified_num,
-            divide_output=divide_output, output_dir=output_dir, log_fn=log_fn
-        )
-        results.append({"file": Path(p), "success": success, "summary": summary, "outputs": outputs})
-        ok_all = ok_all and success
+    progress = _BatchProgress(len(infiles), progress_fn)
 
+    def _cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    def _collect(p, success, summary, outputs):
+        nonlocal ok_all
+        profile = outputs.get("profile")
+        # 汇总记录并入报告后不再保留在结果中
+        records = outputs.pop("report_records", None)
+        if report is not None and success and records is not None:
+            report.add(p, records)
+        results.append({"file": Path(p), "success": success, "summary": summary, "outputs": outputs,
+                        "profile": profile})
+        ok_all = ok_all and success
         if log_fn:
+            if show_profile and profile:
+                log_fn(format_profile_table(profile, title=f"分阶段耗时：{Path(p).name}"))
             log_fn("-" * 60)
 
-    combined = "批量处理完成：\n\n" + "\n\n".join(r["summary"] for r in results)
+    workers = max(1, min(int(workers or 1), len(infiles) or 1))
+    if workers == 1:
+        for p in infiles:
+            if _cancelled():
+                break
+            stage_fn = (lambda stage, p=p: progress.stage(p, stage)) if progress_fn else None
+            success, summary, outputs = process_one_file(p, log_fn=log_fn, stage_fn=stage_fn,
+                                                         frame_store=frame_store, **kwargs)
+            progress.file_done(p, success)
+            _collect(p, success, summary, outputs)
+    else:
+        if log_fn:
+            log_fn(f"并行处理：{workers} 个进程")
+        with ExitStack() as stack:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            stage_queue = None
+            if progress_fn is not None:
+                stage_queue = stack.enter_context(multiprocessing.Manager()).Queue()
+            # 内存中已有解析数据的文件在本进程处理（很快），其余提交进程池
+            use_store = frame_store is not None and not chunksize
+            keep_frames = frame_store.max_bytes if use_store else None
+            # 按需提交：进程池中至多 workers 个文件（都在处理中），取消后不再提交，
+            # 不会有已排队的文件在取消之后才开始
+            futures = [None] * len(infiles)
+            future_file = {}
+            local, queued = [], []
+            for i, p in enumerate(infiles):
+                if use_store and _in_store(frame_store, p, reader, partition_col, ruleset):
+                    local.append(i)
+                else:
+                    queued.append(i)
+            queued.reverse()
+            pending = set()
+
+            def _submit():
+                while queued and len(pending) < workers and not _cancelled():
+                    i = queued.pop()
+                    fut = pool.submit(process_one_collect, infiles[i], kwargs, stage_queue, None, keep_frames)
+                    futures[i] = fut
+                    future_file[fut] = infiles[i]
+                    pending.add(fut)
+
+            _submit()
+            for i in local:
+                fut = futures[i] = Future()
+                if _cancelled():
+                    fut.cancel()
+                else:
+                    fut.set_result(process_one_collect(infiles[i], kwargs, stage_queue, frame_store))
+
+            def _drain_stages():
+                while stage_queue is not None:
+                    try:
+                        p, stage = stage_queue.get_nowait()
+                    except queue.Empty:
+                        return
+                    progress.stage(p, stage)
+
+            next_i = 0
+            while next_i < len(futures):
+                if _cancelled():
+                    # 尚未开始的文件不再调度；已在处理的文件等待完成
+                    for fut in pending:
+                        fut.cancel()
+                    queued.clear()
+                if pending:
+                    done, pending = wait(pending, timeout=_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        if not fut.cancelled():
+                            progress.file_done(future_file[fut], fut.exception() is None and fut.result()[0])
+                _drain_stages()
+                _submit()
+                # 按输入顺序取结果，保证日志与结果顺序与输入一致；未提交的文件在取消后跳过
+                while next_i < len(futures):
+                    p, fut = infiles[next_i], futures[next_i]
+                    if fut is None and not queued:
+                        next_i += 1
+                        continue
+                    if fut is None or not fut.done():
+                        break
+                    next_i += 1
+                    if fut.cancelled():
+                        continue
+                    try:
+                        success, summary, outputs, logs, frames = fut.result()
+                    except Exception:
+                        # 子进程异常退出等无法在 process_one_file 内捕获的错误
+                        success, summary, outputs, logs, frames = False, traceback.format_exc(), {}, [], []
+                        logs.append(summary)
+                    for key, entry in frames:
+                        frame_store.put(key, entry)
+                    for line in logs:
+                        if log_fn: log_fn(line)
+                        else: print(line)
+                    _collect(p, success, summary, outputs)
+
+    skipped = len(infiles) - len(results)
+    if skipped:
+        ok_all = False
+        if log_fn:
+            log_fn(f"已取消：{skipped} 个文件未处理")
+
+    if cache is not None and log_fn:
+        hits = sum(1 for r in results if r["outputs"].get("cache_hit"))
+        log_fn(f"缓存命中：{hits}/{len(results)} 个文件")
+
+    if show_profile or profile_jsonl:
+        aggregate = aggregate_profiles(r["profile"] for r in results)
+        if show_profile and log_fn:
+            log_fn(format_profile_table(aggregate, title=f"分阶段耗时汇总（{len(results)} 个文件）"))
+        if profile_jsonl:
+            write_profile_jsonl(profile_jsonl, results, aggregate)
+            if log_fn:
+                log_fn(f"分阶段记录已写出: {profile_jsonl}")
+
+    if report is not None:
+        report_path = Path(report_path)
+        report.write(report_path, writer=writer)
+        if log_fn:
+            log_fn(f"汇总预警表已导出: {report_path}（{report.files} 个文件，{len(report)} 条记录）")
+
+    header = f"批量处理已取消（完成 {len(results)}/{len(infiles)}）：" if skipped else "批量处理完成："
+    combined = header + "\n\n" + "\n\n".join(r["summary"] for r in results)
+    if report is not None:
+        combined += f"\n\n汇总预警表: {report_path}"
     return ok_all, combined, results
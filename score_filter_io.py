@@ -0,0 +1,448 @@
+# score_filter_io.py
+# -*- coding: utf-8 -*-
+"""
+Excel 读写后端。
+
+读取：
+
+- calamine：基于 python-calamine（Rust 实现），.xlsx/.xls 均可读，速度远快于 openpyxl；
+- openpyxl：pandas 默认引擎（只读流式模式），作为兜底；
+- xlrd：仅用于 .xls，且需要 xlrd==1.2.0。
+
+auto 模式下优先使用 calamine，未安装时回退到 openpyxl / xlrd。
+超大文件可用 iter_excel_chunks 按块流式读取（openpyxl 只读模式）。
+
+写出：
+- xlsxwriter：constant_memory 模式逐行写出，内存恒定且最快；
+- openpyxl：write_only 模式逐行写出，作为兜底；
+- pandas：DataFrame.to_excel（openpyxl 完整对象树），保留旧行为以便对比；
+- 另可输出 Parquet / Feather（需要 pyarrow），供下游分析使用。
+
+pandas 在用到时才导入（见各函数），只取常量与路径函数（SUPPORTED_EXTS / export_paths / report_path 等）时导入很快，
+图形界面据此先显示窗口。
+"""
+from pathlib import Path
+
+# 规则实际用到的列（第一列学号按位置取，不在此列出）
+RULE_COLUMNS = ("一层节点", "课程名称", "获得学分", "成绩", "学年学期", "学期", "建议修读学年")
+
+
+def _has_module(name):
+    try:
+        __import__(name)
+        return True
+    except Exception:
+        return False
+
+
+def _usecols_positions(path, engine, columns):
+    """先只读表头，把列名转换为位置索引；第一列（学号）始终保留"""
+    import pandas as pd
+    header = pd.read_excel(path, engine=engine, nrows=0).columns
+    wanted = {str(c) for c in columns}
+    return [i for i, c in enumerate(header) if i == 0 or str(c) in wanted]
+
+
+def _read_with_engine(path, engine, columns=None):
+    import pandas as pd
+    usecols = _usecols_positions(path, engine, columns) if columns is not None else None
+    return pd.read_excel(path, dtype={0: str}, engine=engine, usecols=usecols)
+
+
+def _read_calamine(path, columns=None):
+    return _read_with_engine(path, "calamine", columns)
+
+
+def _read_openpyxl(path, columns=None):
+    return _read_with_engine(path, "openpyxl", columns)
+
+
+def _read_xlrd(path, columns=None):
+    try:
+        import xlrd  # noqa: F401
+    except Exception as e:
+        raise RuntimeError("检测到 .xls 文件，但未安装 xlrd==1.2.0；"
+                           "建议先将 .xls 另存为 .xlsx，或安装 xlrd==1.2.0 / python-calamine 再试。") from e
+    return _read_with_engine(path, "xlrd", columns)
+
+
+# 后端名 -> (读取函数, 支持的扩展名, 依赖模块)
+READER_BACKENDS = {
+    "calamine": (_read_calamine, {".xlsx", ".xls"}, "python_calamine"),
+    "openpyxl": (_read_openpyxl, {".xlsx"}, "openpyxl"),
+    "xlrd": (_read_xlrd, {".xls"}, None),
+}
+
+# auto 模式的尝试顺序
+_AUTO_ORDER = ("calamine", "openpyxl", "xlrd")
+
+
+def available_readers():
+    """返回当前环境可用的读取后端名列表"""
+    return [name for name, (_, _, mod) in READER_BACKENDS.items() if mod is None or _has_module(mod)]
+
+
+def resolve_reader(path, backend="auto"):
+    """根据扩展名与已安装依赖选出实际使用的后端名"""
+    ext = Path(path).suffix.lower()
+    if backend != "auto":
+        if backend not in READER_BACKENDS:
+            raise ValueError(f"未知的读取后端：{backend}（可选：{', '.join(READER_BACKENDS)}）")
+        if ext not in READER_BACKENDS[backend][1]:
+            raise ValueError(f"读取后端 {backend} 不支持 {ext} 文件")
+        return backend
+    for name in _AUTO_ORDER:
+        _, exts, mod = READER_BACKENDS[name]
+        if ext in exts and (mod is None or _has_module(mod)):
+            return name
+    raise ValueError("仅支持 .xlsx 或 .xls")
+
+
+def read_excel(path, backend="auto", columns=None):
+    """
+    读取 Excel，第一列按字符串读取。返回 (DataFrame, 实际使用的后端名)
+    columns: 只读取这些列名（外加第一列）；None 表示读取全部列。
+    auto 模式下快速后端读取失败时回退到 openpyxl。
+    """
+    name = resolve_reader(path, backend)
+    reader = READER_BACKENDS[name][0]
+    if backend == "auto" and name == "calamine" and Path(path).suffix.lower() == ".xlsx":
+        try:
+            return reader(path, columns), name
+        except Exception:
+            return _read_openpyxl(path, columns), "openpyxl"
+    return reader(path, columns), name
+
+
+def _first_col_to_str(v):
+    if v is None:
+        return None
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v)
+
+
+def iter_excel_chunks(path, chunksize=50_000):
+    """
+    以 openpyxl 只读模式逐块读取 .xlsx 第一个工作表，每块为一个 DataFrame
+    （列名取首行，第一列转为字符串，空行跳过）。内存占用只与 chunksize 有关。
+    只有表头、没有数据行时产出一个 0 行的块，以便调用方拿到列名；工作表完全为空时不产出。
+    """
+    if Path(path).suffix.lower() != ".xlsx":
+        raise ValueError("分块读取仅支持 .xlsx 文件")
+    import openpyxl
+    import pandas as pd
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = list(header)
+        while header and header[-1] is None:
+            header.pop()
+        width = len(header)
+        buf = []
+        emitted = False
+        for row in rows:
+            row = list(row[:width]) + [None] * (width - len(row))
+            if all(v is None for v in row):
+                continue
+            row[0] = _first_col_to_str(row[0])
+            buf.append(row)
+            if len(buf) >= chunksize:
+                yield pd.DataFrame(buf, columns=header)
+                emitted = True
+                buf = []
+        if buf or not emitted:
+            yield pd.DataFrame(buf, columns=header)
+    finally:
+        wb.close()
+
+
+# 支持的输入扩展名
+SUPPORTED_EXTS = {".xlsx", ".xls"}
+# 总表文件名前缀（批量扫描目录时据此跳过本工具的输出）
+OUTPUT_PREFIX = "学业预警表_"
+# 跨文件汇总预警表的文件名（加 OUTPUT_PREFIX 前缀）
+REPORT_STEM = "汇总"
+
+
+def is_input_candidate(path):
+    """可作为输入的工作簿：扩展名受支持，且不是 Excel 锁文件（~$）或本工具的输出"""
+    p = Path(path)
+    return (p.suffix.lower() in SUPPORTED_EXTS
+            and not p.name.startswith("~$")
+            and not p.name.startswith(OUTPUT_PREFIX))
+
+
+def report_path(out_dir):
+    """汇总预警表的默认路径；以 OUTPUT_PREFIX 开头，目录扫描时不会被当作输入"""
+    return Path(out_dir) / f"{OUTPUT_PREFIX}{REPORT_STEM}.xlsx"
+
+
+def export_paths(infile, out_dir, pubclass_qualified_num, ruleset=None):
+    """
+    导出文件路径：总表 + 各规则 CSV + 总表的列式副本
+    （键为 xlsx / csv_rule1 / csv_rule2 / csv_rule3 / parquet / feather；
+    CSV 的键与文件名后缀来自规则配置 ruleset，None 为内置规则）
+    """
+    if ruleset is None:
+        from score_filter_ruleset import DEFAULT_RULESET as ruleset
+    stem = Path(infile).stem
+    out_dir = Path(out_dir)
+    return {
+        "xlsx": out_dir / f"{OUTPUT_PREFIX}{stem}.xlsx",
+        "parquet": out_dir / f"{OUTPUT_PREFIX}{stem}.parquet",
+        "feather": out_dir / f"{OUTPUT_PREFIX}{stem}.feather",
+        **{key: out_dir / f"{stem}_{suffix}.csv" for key, suffix in ruleset.csv_names(pubclass_qualified_num).items()},
+    }
+
+
+_SHEET_BAD_CHARS = str.maketrans({c: "_" for c in '[]:*?/\\'})
+
+
+def safe_sheet_names(names):
+    """把任意名称转换为合法且互不重复的 Excel 工作表名（≤31 字符，去除非法字符）"""
+    result, used = [], set()
+    for name in names:
+        base = (str(name).translate(_SHEET_BAD_CHARS).strip("'") or "Sheet")[:31]
+        candidate, i = base, 1
+        while candidate.lower() in used:
+            suffix = f"_{i}"
+            candidate = base[:31 - len(suffix)] + suffix
+            i += 1
+        used.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+# ---------------- 写出 ----------------
+
+# 后端名 -> 依赖模块
+EXCEL_WRITERS = {"xlsxwriter": "xlsxwriter", "openpyxl": "openpyxl", "pandas": "openpyxl"}
+TABLE_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+
+def resolve_writer(backend="auto"):
+    """选出实际使用的 xlsx 写出后端名"""
+    if backend == "auto":
+        return "xlsxwriter" if _has_module("xlsxwriter") else "openpyxl"
+    if backend not in EXCEL_WRITERS:
+        raise ValueError(f"未知的写出后端：{backend}（可选：{', '.join(EXCEL_WRITERS)}）")
+    if not _has_module(EXCEL_WRITERS[backend]):
+        raise RuntimeError(f"写出后端 {backend} 需要安装 {EXCEL_WRITERS[backend]}")
+    return backend
+
+
+def _rows_for_excel(frame):
+    """DataFrame -> 逐行 Python 值元组；空值转为 None（写为空单元格）"""
+    rows = frame.astype(object)
+    return rows.where(rows.notna(), None).itertuples(index=False, name=None)
+
+
+class ExcelStreamWriter:
+    """
+    流式 xlsx 写出：按块追加行，不在内存中保留工作表，可同时写多个工作表。
+    header: 各工作表共用的表头；或 {工作表名: 表头}，各表列不同
+    backend: auto / xlsxwriter / openpyxl
+    """
+
+    def __init__(self, path, header, sheets=("Sheet1",), backend="auto"):
+        self.path = path
+        self.backend = resolve_writer(backend)
+        if self.backend == "pandas":
+            raise ValueError("pandas 写出后端不支持流式写出")
+        if not isinstance(header, dict):
+            header = {name: header for name in sheets}
+        headers = {name: [str(c) for c in header[name]] for name in sheets}
+        self.sheets = {}
+        if self.backend == "xlsxwriter":
+            import xlsxwriter
+            self.wb = xlsxwriter.Workbook(str(path), {
+                "constant_memory": True,
+                "strings_to_numbers": False, "strings_to_formulas": False, "strings_to_urls": False,
+                "default_date_format": "yyyy-mm-dd hh:mm:ss",
+            })
+            bold = self.wb.add_format({"bold": True, "border": 1, "align": "center"})
+            for name in sheets:
+                ws = self.wb.add_worksheet(name)
+                ws.write_row(0, 0, headers[name], bold)
+                self.sheets[name] = [ws, 1]
+        else:
+            import openpyxl
+            from openpyxl.cell import WriteOnlyCell
+            from openpyxl.styles import Font
+            self.wb = openpyxl.Workbook(write_only=True)
+            for name in sheets:
+                ws = self.wb.create_sheet(name)
+                cells = []
+                for h in headers[name]:
+                    cell = WriteOnlyCell(ws, value=h)
+                    cell.font = Font(bold=True)
+                    cells.append(cell)
+                ws.append(cells)
+                self.sheets[name] = [ws, 1]
+        self._default = next(iter(self.sheets))
+
+    def append(self, frame, sheet=None):
+        entry = self.sheets[sheet or self._default]
+        ws = entry[0]
+        if self.backend == "xlsxwriter":
+            r = entry[1]
+            for row in _rows_for_excel(frame):
+                ws.write_row(r, 0, row)
+                r += 1
+            entry[1] = r
+        else:
+            for row in _rows_for_excel(frame):
+                ws.append(row)
+
+    def close(self):
+        if self.backend == "xlsxwriter":
+            self.wb.close()
+        else:
+            self.wb.save(self.path)
+            self.wb.close()
+
+
+def write_excel(path, sheets, backend="auto"):
+    """
+    写出 xlsx。sheets: [(工作表名, DataFrame)]。返回实际使用的后端名。
+    """
+    name = resolve_writer(backend)
+    if name == "pandas":
+        import pandas as pd
+        with pd.ExcelWriter(path, engine="openpyxl") as xw:
+            for sheet, frame in sheets:
+                frame.to_excel(xw, sheet_name=sheet, index=False)
+        return name
+    writer = ExcelStreamWriter(path, {sheet: frame.columns for sheet, frame in sheets},
+                               sheets=[sheet for sheet, _ in sheets], backend=name)
+    try:
+        for sheet, frame in sheets:
+            writer.append(frame, sheet)
+    finally:
+        writer.close()
+    return name
+
+
+def _arrow_safe(frame):
+    """把混合类型的 object 列规范为数值或字符串，使 pyarrow 能稳定推断出一致的 schema"""
+    import pandas as pd
+    out = {}
+    for c in frame.columns:
+        col = frame[c]
+        if col.dtype == object:
+            try:
+                col = pd.to_numeric(col)
+            except (ValueError, TypeError):
+                col = col.astype("string")
+        elif pd.api.types.is_integer_dtype(col.dtype):
+            col = col.astype("float64")  # 各块中可能出现空值，统一为浮点
+        elif isinstance(col.dtype, pd.CategoricalDtype):
+            col = col.astype("string")
+        out[str(c)] = col
+    return pd.DataFrame(out, index=frame.index)
+
+
+def _arrow_schema(columns, numeric_columns, integer_columns=()):
+    """固定 schema：integer_columns 为 int64，其余 numeric_columns 为 float64，其余列一律为字符串"""
+    import pyarrow as pa
+    return pa.schema([(str(c), pa.int64() if c in integer_columns else pa.float64() if c in numeric_columns
+                       else pa.string()) for c in columns])
+
+
+def _stream_arrow_frame(frame, numeric_columns, integer_columns=()):
+    """按固定 schema（见 _arrow_schema）规范一块数据；数值列中无法解析的值置空"""
+    import pandas as pd
+    out = {}
+    for c in frame.columns:
+        col = frame[c]
+        if c in numeric_columns:
+            col = pd.to_numeric(col, errors="coerce")
+            col = col.astype("int64" if c in integer_columns else "float64")
+        else:
+            col = col.astype(object).where(col.notna(), None).map(lambda v: v if v is None else str(v))
+            col = col.astype("string")
+        out[str(c)] = col
+    return pd.DataFrame(out, index=frame.index)
+
+
+class TableStreamWriter:
+    """
+    流式表格写出：csv 追加写入（首块写表头与 BOM）；parquet 使用 pyarrow ParquetWriter 按块写入。
+    parquet 的 schema 由表头一次确定：numeric_columns（成绩、学分）为 float64（其中 integer_columns 为 int64），
+    其余列一律为字符串。各块单独推断类型不可靠——如备注列前几块全空、后面才出现“补考”。
+    整表模式的 write_table 使用同一 schema，两种模式的列式输出一致。
+    """
+
+    def __init__(self, path, fmt="csv", numeric_columns=(), integer_columns=()):
+        if fmt not in ("csv", "parquet"):
+            raise ValueError(f"流式写出仅支持 csv / parquet：{fmt}")
+        self.path = path
+        self.fmt = fmt
+        self.backend = "csv" if fmt == "csv" else "pyarrow"
+        self._writer = None
+        self._schema = None
+        self.numeric_columns = set(numeric_columns)
+        self.integer_columns = set(integer_columns)
+        self.rows = 0
+
+    def append(self, frame):
+        if self.fmt == "csv":
+            first = self.rows == 0
+            frame.to_csv(self.path, index=False, header=first,
+                         mode="w" if first else "a", encoding="utf-8-sig" if first else "utf-8")
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._writer is None:
+                self._schema = _arrow_schema(frame.columns, self.numeric_columns, self.integer_columns)
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            table = pa.Table.from_pandas(_stream_arrow_frame(frame, self.numeric_columns, self.integer_columns),
+                                         schema=self._schema, preserve_index=False)
+            self._writer.write_table(table)
+        self.rows += len(frame)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def write_table(frame, path, fmt="csv", numeric_columns=None, integer_columns=()):
+    """
+    写出 csv / parquet / feather，返回写出器名。
+    numeric_columns: 给出时 parquet / feather 按固定 schema 写出（同 TableStreamWriter），
+                     否则按各列的 dtype 推断
+    """
+    if fmt == "csv":
+        frame.to_csv(path, index=False, encoding="utf-8-sig")
+        return "csv"
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"未知的表格格式：{fmt}（可选：{', '.join(TABLE_FORMATS)}）")
+    if not _has_module("pyarrow"):
+        raise RuntimeError(f"输出 {fmt} 需要安装 pyarrow")
+    frame = frame.reset_index(drop=True)
+    if numeric_columns is not None:
+        import pyarrow as pa
+        numeric_columns, integer_columns = set(numeric_columns), set(integer_columns)
+        table = pa.Table.from_pandas(_stream_arrow_frame(frame, numeric_columns, integer_columns),
+                                     schema=_arrow_schema(frame.columns, numeric_columns, integer_columns),
+                                     preserve_index=False)
+        # 与 ParquetWriter 写出的一致：不附带 pandas 元数据
+        table = table.replace_schema_metadata()
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            pq.write_table(table, path)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(table, path)
+        return "pyarrow"
+    try:
+        getattr(frame, f"to_{fmt}")(path)
+    except Exception:
+        # 混合类型列（如成绩中夹杂文字）pyarrow 无法直接转换
+        getattr(_arrow_safe(frame), f"to_{fmt}")(path)
+    return "pyarrow"
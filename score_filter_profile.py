@@ -0,0 +1,154 @@
+# score_filter_profile.py
+# -*- coding: utf-8 -*-
+"""
+分阶段性能记录：每个文件记录各阶段（读取、列识别、过滤、规则一/二/三、去重、写出；分块模式另有落盘）
+的耗时、行数与峰值内存，便于定位慢文件与性能回退，无需另外挂性能分析器。
+
+峰值内存使用 tracemalloc（pandas/numpy 的数组分配也会被统计），开启后有一定开销，
+因此仅在 trace_memory=True 时记录；耗时与行数始终记录。
+"""
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# 阶段的展示顺序
+STAGES = ("cache", "read", "columns", "filter", "masks", "rule1", "rule2", "rule3", "spill", "dedup", "write")
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），不可用时返回 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 2**20
+        except Exception:
+            return None
+
+
+class StageProfiler:
+    """
+    用法：
+        prof = StageProfiler(trace_memory=True)
+        with prof.stage("read") as rec:
+            df = ...
+            rec["rows"] = len(df)
+    同名阶段多次进入（如分块模式）时累加耗时与行数，峰值内存取最大值。
+    on_stage: 每次进入阶段时调用 on_stage(name)，用于进度显示
+    """
+
+    def __init__(self, trace_memory=False, on_stage=None):
+        self.trace_memory = trace_memory
+        self.on_stage = on_stage
+        self.stages = {}
+        self._started_tracing = False
+        self._t0 = time.perf_counter()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        rec = {"rows": rows}
+        if self.on_stage is not None:
+            self.on_stage(name)
+        if self.trace_memory:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            seconds = time.perf_counter() - t0
+            peak = None
+            if self.trace_memory:
+                peak = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+            agg = self.stages.setdefault(name, {"stage": name, "seconds": 0.0, "rows": None, "peak_mb": None})
+            agg["seconds"] += seconds
+            if rec["rows"] is not None:
+                agg["rows"] = (agg["rows"] or 0) + int(rec["rows"])
+            if peak is not None:
+                agg["peak_mb"] = max(agg["peak_mb"] or 0.0, peak)
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def to_dict(self):
+        order = {s: i for i, s in enumerate(STAGES)}
+        stages = sorted(self.stages.values(), key=lambda r: order.get(r["stage"], len(order)))
+        return {
+            "total_seconds": time.perf_counter() - self._t0,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": [dict(r) for r in stages],
+        }
+
+
+class _NullProfiler:
+    """不记录任何内容的占位实现"""
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        yield {"rows": rows}
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+def aggregate_profiles(profiles):
+    """多个文件的 profile 合并：各阶段耗时、行数求和，峰值内存取最大值"""
+    stages = {}
+    total = 0.0
+    rss = None
+    for prof in profiles:
+        if not prof:
+            continue
+        total += prof.get("total_seconds") or 0.0
+        if prof.get("peak_rss_mb") is not None:
+            rss = max(rss or 0.0, prof["peak_rss_mb"])
+        for r in prof.get("stages", []):
+            agg = stages.setdefault(r["stage"], {"stage": r["stage"], "seconds": 0.0, "rows": None, "peak_mb": None})
+            agg["seconds"] += r["seconds"]
+            if r.get("rows") is not None:
+                agg["rows"] = (agg["rows"] or 0) + r["rows"]
+            if r.get("peak_mb") is not None:
+                agg["peak_mb"] = max(agg["peak_mb"] or 0.0, r["peak_mb"])
+    order = {s: i for i, s in enumerate(STAGES)}
+    return {
+        "total_seconds": total,
+        "peak_rss_mb": rss,
+        "stages": sorted(stages.values(), key=lambda r: order.get(r["stage"], len(order))),
+    }
+
+
+def format_profile_table(profile, title=""):
+    """把 profile 格式化为等宽文本表格（用于日志）"""
+    lines = []
+    if title:
+        lines.append(title)
+    lines.append(f"{'阶段':<10}{'耗时(s)':>10}{'占比':>8}{'行数':>10}{'峰值内存(MB)':>14}")
+    total = profile.get("total_seconds") or 0.0
+    for r in profile.get("stages", []):
+        share = f"{r['seconds'] / total:.0%}" if total else "-"
+        rows = "-" if r.get("rows") is None else str(r["rows"])
+        peak = "-" if r.get("peak_mb") is None else f"{r['peak_mb']:.1f}"
+        lines.append(f"{r['stage']:<10}{r['seconds']:>10.3f}{share:>8}{rows:>10}{peak:>14}")
+    rss = profile.get("peak_rss_mb")
+    lines.append(f"合计 {total:.3f}s" + (f"，进程峰值内存 {rss:.1f} MB" if rss is not None else ""))
+    return "\n".join(lines)
+
+
+def write_profile_jsonl(path, results, aggregate=None):
+    """每个文件一行 JSON（file / success / profile），最后一行为汇总（file 为 null）"""
+    with open(path, "w", encoding="utf-8") as f:
+        for r in results:
+            f.write(json.dumps({"file": str(r["file"]), "success": r["success"], "profile": r.get("profile")},
+                               ensure_ascii=False) + "\n")
+        if aggregate is not None:
+            f.write(json.dumps({"file": None, "profile": aggregate}, ensure_ascii=False) + "\n")
@@ -0,0 +1,137 @@
+# score_filter_report.py
+# -*- coding: utf-8 -*-
+"""
+跨文件汇总预警表：批量处理时把各文件的预警行（去重后的总表行）逐个并入，
+最后一次性写出一个工作簿：
+    学生汇总：每个学生一行——各规则记录数、不及格学分、涉及课程与来源文件
+    预警明细：全部预警行（精简列 + 来源文件），按学号排序
+
+各文件只带回精简后的记录（list[dict]，见 report_records），可经进程池传回、写入结果缓存，
+汇总时无需重新读取已导出的总表。
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from score_filter_io import REPORT_STEM, report_path, write_excel  # noqa: F401  report_path 在此再导出
+from score_filter_rules import LABEL_COL, find_col_exact, rule_labels
+
+NAME_COLUMN = "姓名"
+SOURCE_COL = "来源文件"
+RULE_COL = "规则"
+# 明细列：记录键 -> 表头
+DETAIL_COLUMNS = {
+    "student_id": "学号", "name": NAME_COLUMN, "group": "班级", "course_name": "课程名称",
+    "course_type": "一层节点", "credit": "获得学分", "score": "成绩", "term": "学期",
+}
+
+
+def _python_value(v):
+    if v is None or (isinstance(v, float) and np.isnan(v)) or v is pd.NA or v is pd.NaT:
+        return None
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def report_records(df_final, cols, pubclass_qualified_num, group_col=None, ruleset=None):
+    """
+    总表行（含“来源规则”列）-> 精简记录 list[dict]：
+        student_id, name, group, course_name, course_type, credit, score, term,
+        rule: 规则编号（RuleSet 中的 rule.code）
+    缺失的列记为 None。
+    """
+    if len(df_final) == 0:
+        return []
+    src = {
+        "student_id": cols["student_id"], "name": find_col_exact(df_final.columns, NAME_COLUMN),
+        "group": group_col, "course_name": cols.get("course_name"), "course_type": cols.get("course_type"),
+        "credit": cols.get("credit"), "score": cols.get("score"), "term": cols.get("term"),
+    }
+    rule = pd.Categorical(df_final[LABEL_COL].astype(str),
+                          categories=rule_labels(pubclass_qualified_num, ruleset)).codes
+    data = {key: (df_final[c].astype(object).to_numpy() if c is not None else [None] * len(df_final))
+            for key, c in src.items()}
+    data["rule"] = rule
+    keys = list(data)
+    return [{k: _python_value(v) for k, v in zip(keys, row)} for row in zip(*data.values())]
+
+
+class WarningReport:
+    """
+    增量构建的跨文件汇总：add() 并入一个文件的记录，write() 在最后写出。
+    用法：
+        report = WarningReport(pubclass_qualified_num)
+        report.add(infile, outputs["report_records"])
+        report.write(path)
+    ruleset: 各文件所用的规则配置（见 score_filter_ruleset）；None 为内置规则
+    """
+
+    def __init__(self, pubclass_qualified_num, ruleset=None):
+        if ruleset is None:
+            from score_filter_ruleset import DEFAULT_RULESET as ruleset
+        self.pubclass_qualified_num = pubclass_qualified_num
+        self.ruleset = ruleset
+        self._records = []
+        self.files = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, source, records):
+        name = Path(source).name
+        self._records.extend({**r, "source": name} for r in records)
+        self.files += 1
+
+    def detail_frame(self):
+        """预警明细：学号、姓名、班级、课程……、来源规则、来源文件；按学号排序（同一学号内保持并入顺序）"""
+        labels = rule_labels(self.pubclass_qualified_num, self.ruleset)
+        df = pd.DataFrame(self._records, columns=[*DETAIL_COLUMNS, "rule", "source"])
+        # pandas 3 中空值为 NaN（而非 None）
+        df["student_id"] = df["student_id"].map(lambda v: str(v) if pd.notna(v) else None)
+        df[LABEL_COL] = pd.Categorical.from_codes(df["rule"].astype(np.int8), categories=labels)
+        df = df.sort_values("student_id", kind="stable", na_position="last")
+        # 没有该列的来源（如无“姓名”“班级”列）整列为空时不输出
+        keep = [k for k in DETAIL_COLUMNS if k in ("student_id", "course_name") or df[k].notna().any()]
+        out = df[keep + [LABEL_COL, "source"]].rename(columns={**DETAIL_COLUMNS, "source": SOURCE_COL})
+        return out.reset_index(drop=True)
+
+    def student_frame(self):
+        """
+        学生汇总：学号、姓名、各规则记录数（按 RuleSet 的规则顺序）、预警记录数、不及格学分、课程列表、
+        来源文件数、来源文件。不及格学分为 failed_credit 规则（内置为规则二/三）课程的学分合计；
+        同一学号的同一课程、学期在多个文件中出现时只计一次（来源文件仍全部列出）。
+        按预警记录数降序、学号升序排列。
+        """
+        df = pd.DataFrame(self._records, columns=[*DETAIL_COLUMNS, "rule", "source"])
+        df = df[df["student_id"].notna()]
+        df["student_id"] = df["student_id"].astype(str)
+        # 来源文件在去重之前汇总：同一条预警出现在多个文件中时各文件都计入
+        sources = df.groupby("student_id", sort=True)["source"]
+        df = df.drop_duplicates(["student_id", "course_name", "term", "rule"])
+        g = df.groupby("student_id", sort=True)
+        rules = self.ruleset.rules
+        counts = pd.crosstab(df["student_id"], df["rule"]).reindex(columns=[r.code for r in rules], fill_value=0)
+        failed = df["rule"].isin(self.ruleset.failed_codes)
+        credit = pd.to_numeric(df["credit"], errors="coerce").where(failed, 0.0).fillna(0.0)
+        out = pd.DataFrame({
+            "学号": counts.index,
+            NAME_COLUMN: g["name"].first().reindex(counts.index).to_numpy(),
+            **{f"{r.name}记录数": counts[r.code].to_numpy() for r in rules},
+            "预警记录数": counts.sum(axis=1).to_numpy(),
+            "不及格学分": credit.groupby(df["student_id"]).sum().reindex(counts.index).to_numpy(),
+            "课程列表": g["course_name"].agg(
+                lambda s: "、".join(dict.fromkeys(str(c) for c in s.dropna()))).reindex(counts.index).to_numpy(),
+            "来源文件数": sources.nunique().reindex(counts.index).to_numpy(),
+            SOURCE_COL: sources.agg(lambda s: "、".join(dict.fromkeys(s))).reindex(counts.index).to_numpy(),
+        })
+        if out[NAME_COLUMN].isna().all():
+            out = out.drop(columns=NAME_COLUMN)
+        out = out.sort_values(["预警记录数", "学号"], ascending=[False, True], kind="stable")
+        return out.reset_index(drop=True)
+
+    def write(self, path, writer="auto"):
+        """写出“学生汇总”与“预警明细”两个工作表，返回实际使用的写出后端名"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return write_excel(path, [("学生汇总", self.student_frame()), ("预警明细", self.detail_frame())],
+                           backend=writer)
@@ -0,0 +1,331 @@
+# score_filter_rules.py
+# -*- coding: utf-8 -*-
+"""
+规则引擎：一次性计算共享掩码，为每行打上规则编号，再按导出顺序一次取出。
+
+规则、列名、谓词与来源规则文字都来自编译后的规则配置（score_filter_ruleset.RuleSet），
+各函数的 ruleset 参数即该配置，None 时使用内置规则。
+规则编号为 RuleSet 按 priority 排定的导出顺序（rule.code，去重时保留靠前者），
+NO_RULE（-1）表示未命中或被排除条件过滤掉；每行至多命中一条规则（编号最小者）。
+依赖公选课学分阈值的条件留到 apply_rule1：evaluate_base 计算其余部分，阈值变化时只重算这部分。
+"""
+import numpy as np
+import pandas as pd
+
+from score_filter_profile import NULL_PROFILER
+
+# 内置规则（score_filter_ruleset.DEFAULT_RULES_CONFIG）的取值
+PASS_SCORE = 60
+OTHER_COURSE_TYPE = "其它"
+PUBLIC_COURSE_TYPE = "公共选修课"
+TERM_COLUMNS = ("学年学期", "学期", "建议修读学年")
+# 字符串列的不同取值不超过行数的该比例时转为 categorical（学号、课程名、学期等重复很多的列）
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+NO_RULE = -1
+LABEL_COL = "来源规则"
+UNASSIGNED_GROUP = "未分班"
+
+
+def find_col_exact(columns, wanted):
+    for c in columns:
+        if str(c) == wanted:
+            return c
+    return None
+
+
+def _ruleset(ruleset):
+    if ruleset is not None:
+        return ruleset
+    from score_filter_ruleset import DEFAULT_RULESET
+    return DEFAULT_RULESET
+
+
+def detect_columns(columns, ruleset=None):
+    """识别关键列，返回 dict（缺失的列为 None）；内置规则中第一列视为学号"""
+    return _ruleset(ruleset).detect(columns)
+
+
+def rule_labels(pubclass_qualified_num, ruleset=None):
+    """规则编号 -> 来源规则文字，按编号顺序排列"""
+    return _ruleset(ruleset).labels(pubclass_qualified_num)
+
+
+def dedup_columns(cols, group_col=None, ruleset=None):
+    """去重键的实际列名：分班列（若有）+ 配置中的 dedup_keys（内置为学号、课程名称、学期），缺失的列跳过"""
+    keys = [group_col] + [cols.get(k) for k in _ruleset(ruleset).dedup_keys]
+    return [c for c in keys if c is not None]
+
+
+def str_mask(series, fn):
+    """
+    对列的字符串形式（astype(str)）计算布尔掩码 fn(Series[str]) -> Series[bool]。
+    categorical 列只在各类别上计算一次，再按类别编号取值。
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # 末尾追加空值对应的结果：编号 -1 恰好取到最后一个元素
+        labels = pd.Series([*series.cat.categories.astype(str), np.nan], dtype=object).astype(str)
+        return fn(labels).to_numpy(dtype=bool)[series.cat.codes.to_numpy()]
+    return fn(series.astype(str)).to_numpy(dtype=bool)
+
+
+def normalize_frame(df, cols, ruleset=None):
+    """
+    成绩、学分（配置中的 numeric 列）数值化（原地修改，无法解析的值置空）。
+    返回 (valid, dtypes)：
+        valid:  “非其它”（未被排除的）行掩码
+        dtypes: {列名: 导出时的列类型}，只含与数值化后类型不同的列，写出前用 restore_dtypes 还原。
+                最初的实现先删去“其它”行再数值化：被排除的行里有“免修”等文字时，其余行全为整数的列
+                仍导出为整数，而整列数值化会得到 float64（CSV 中“2”变成“2.0”）
+    """
+    ruleset = _ruleset(ruleset)
+    raw = {}
+    for key in ruleset.numeric_keys:
+        c = cols.get(key)
+        if c is not None:
+            raw[c] = df[c]
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    if ruleset.exclude_enabled(cols):
+        valid = ~ruleset.context(df, cols).mask(ruleset.exclude)
+    else:
+        valid = np.ones(len(df), dtype=bool)
+
+    dtypes = {}
+    if not valid.all():
+        for c, s in raw.items():
+            # 读取时已是数值列的，删行不改变类型；只有混有文字的列需要按保留的行重新推断
+            if pd.api.types.is_numeric_dtype(s.dtype) or df[c].dtype.kind != "f":
+                continue
+            dtype = pd.to_numeric(s[valid], errors="coerce").dtype
+            if dtype != df[c].dtype:
+                dtypes[c] = dtype
+    return valid, dtypes
+
+
+def compact_frame(df, cols, ruleset=None):
+    """
+    原地压缩内存（在 normalize_frame 之后调用）：
+    - 重复较多的字符串列（学号、课程名称、一层节点、学期等）转为 categorical；
+    - 成绩、学分（numeric 列）在 float32 可精确表示全部取值时降为 float32，否则保留 float64。
+    规则计算与去重直接在压缩后的列上进行。返回 {列名: 原 dtype}，写出前用 restore_dtypes 还原，
+    导出结果与未压缩时完全一致。
+    """
+    original = {}
+    n = len(df)
+    if n == 0 or not df.columns.is_unique:
+        return original
+    for c in df.columns:
+        col = df[c]
+        if not (col.dtype == object or isinstance(col.dtype, pd.StringDtype)):
+            continue
+        if pd.api.types.infer_dtype(col, skipna=True) != "string":
+            continue
+        if col.nunique(dropna=True) <= n * CATEGORY_MAX_UNIQUE_RATIO:
+            original[c] = col.dtype
+            df[c] = col.astype("category")
+    for key in _ruleset(ruleset).numeric_keys:
+        c = cols.get(key)
+        if c is not None and df[c].dtype == np.float64:
+            x = df[c].to_numpy()
+            y = x.astype(np.float32)
+            if np.array_equal(y.astype(np.float64), x, equal_nan=True):
+                original[c] = df[c].dtype
+                df[c] = y
+    return original
+
+
+def _float_values(series):
+    """数值列 -> 浮点 ndarray；已是 float32/float64 时不复制（压缩后的 float32 上比较结果不变）"""
+    if series.dtype in (np.float32, np.float64):
+        return series.to_numpy()
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+
+def restore_dtypes(frame, original):
+    """把 compact_frame 压缩过的列还原为原 dtype（用于写出）"""
+    changed = {c: t for c, t in original.items() if c in frame.columns}
+    return frame.astype(changed) if changed else frame
+
+
+def partition_names(series):
+    """分班列规范化为字符串班级名；空值归入“未分班”"""
+    return series.astype(object).where(series.notna(), UNASSIGNED_GROUP).astype(str)
+
+
+def partition_codes(series):
+    """
+    分班列 -> (每行分班编号 np.ndarray, 分班名列表)。编号按班级名排序；
+    分班列为空的行归入“未分班”。
+    """
+    codes, uniques = pd.factorize(partition_names(series), sort=True)
+    return codes.astype(np.int64), [str(u) for u in uniques]
+
+
+def evaluate_rules(df, cols, pubclass_qualified_num, valid=None, defer_not_offered=False, groups=None,
+                   profiler=None, ruleset=None):
+    """
+    单次遍历计算全部规则。df 不会被复制或修改。
+    valid: 参与计算的行掩码（排除条件过滤后的行，内置规则为去掉“其它”），None 表示全部行
+    defer_not_offered: 分块模式用；not_offered 规则的候选行全部标记，不做“未开设”判断，
+                       由调用方累计全表计数后再剔除
+    groups: 每行的分班编号（见 partition_codes）；None 表示整表为一个班。
+            分班时班级人数与“未开设”判断均按班计算
+    profiler: StageProfiler（见 score_filter_profile），记录 masks 及各规则（按规则 id）阶段
+    ruleset: 编译后的规则配置（见 score_filter_ruleset）；None 为内置规则
+    返回 dict:
+        codes:        np.int8 数组，每行的规则编号
+        export_pos:   按导出顺序（班级、规则、课程、原行序）排列的命中行位置（未去重）
+        class_size:   总人数
+        class_sizes:  各班人数（按分班编号）
+        not_offered:  未开设课程名（各班合并，去重排序）
+        not_offered_by_group: {分班编号: 未开设课程名列表}
+    """
+    base = evaluate_base(df, cols, valid=valid, defer_not_offered=defer_not_offered, groups=groups,
+                         profiler=profiler, ruleset=ruleset)
+    return apply_rule1(base, pubclass_qualified_num, profiler=profiler)
+
+
+def evaluate_base(df, cols, valid=None, defer_not_offered=False, groups=None, profiler=None, ruleset=None):
+    """
+    与公选课学分阈值无关的部分：共享掩码、不引用 threshold 的规则、班级人数与未开设课程。
+    结果可以保留下来，阈值变化时只需 apply_rule1 重算引用 threshold 的条件（参数含义同 evaluate_rules）。
+    返回 dict（codes 中尚无依赖阈值的规则）：
+        codes, rank, gcodes, class_size, class_sizes, not_offered, not_offered_by_group,
+        deferred: [(规则编号, 阶段名, 候选行掩码, 依赖阈值的谓词)]，
+                  如内置规则一的“公选 & 成绩<60/空”与“学分<阈值”
+        context:  依赖阈值的谓词的求值上下文（无 deferred 时为 None）
+    """
+    prof = profiler or NULL_PROFILER
+    ruleset = _ruleset(ruleset)
+    n = len(df)
+    codes = np.full(n, NO_RULE, dtype=np.int8)
+    rank = np.zeros(n, dtype=np.int64)  # not_offered 规则内部按课程分组排序用
+    not_offered_by_group = {}
+    deferred = []
+
+    # 共享掩码：各规则与阈值无关的部分，相同的子条件只计算一次
+    with prof.stage("masks", rows=n):
+        valid = np.ones(n, dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+        sid = df[cols["student_id"]]
+        class_size = sid[valid].nunique(dropna=True)
+        if groups is None:
+            gcodes = np.zeros(n, dtype=np.int64)
+            class_sizes = np.array([class_size])
+        else:
+            gcodes = np.asarray(groups, dtype=np.int64)
+            ngroups = int(gcodes.max()) + 1 if n else 0
+            class_sizes = (sid[valid].groupby(gcodes[valid]).nunique()
+                           .reindex(range(ngroups), fill_value=0).to_numpy())
+
+        ctx = ruleset.context(df, cols)
+        cands = {rule.code: (valid & ctx.mask(rule.base)) if rule.base is not None else valid
+                 for rule in ruleset.by_code if ruleset.enabled(rule, cols)}
+
+    # 按编号依次标记：每行归入编号最小的命中规则
+    course_col = cols.get("course_name")
+    for rule in ruleset.by_code:
+        if rule.code not in cands:
+            continue
+        if rule.deferred is not None:
+            deferred.append((rule.code, rule.id, cands[rule.code], rule.deferred))
+            continue
+        with prof.stage(rule.id) as rec:
+            free = cands[rule.code] & (codes == NO_RULE)
+            if rule.not_offered and course_col is not None:
+                # not_offered 规则（内置为规则二）：若全班该课都命中，则视作未开设而不导出
+                cand = np.flatnonzero(free)
+                if cand.size and defer_not_offered:
+                    cand = cand[df[course_col].iloc[cand].notna().to_numpy()]
+                    codes[cand] = rule.code
+                elif cand.size:
+                    courses = df[course_col].iloc[cand]
+                    cand_groups = gcodes[cand]
+                    # 一次分组：(班级, 课程) 内命中的学生数，等于该班人数即未开设
+                    keys = courses if groups is None else [cand_groups, courses]
+                    grouped = sid.iloc[cand].groupby(keys, sort=True, observed=True)
+                    zero_counts = grouped.transform("nunique").to_numpy()
+                    off = (zero_counts == class_sizes[cand_groups])
+                    for g, course in set(zip(cand_groups[off].tolist(), courses[off].tolist())):
+                        not_offered_by_group.setdefault(g, set()).add(str(course))
+                    # 课程名为空的行不参与分组，也不导出
+                    keep = courses.notna().to_numpy() & ~off
+                    rank[cand] = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+                    cand = cand[keep]
+                    codes[cand] = rule.code
+                rec["rows"] = int(cand.size)
+            else:
+                codes[free] = rule.code
+                rec["rows"] = int(free.sum())
+
+    ctx.release()
+    not_offered_by_group = {g: sorted(v) for g, v in sorted(not_offered_by_group.items())}
+    return {
+        "codes": codes,
+        "rank": rank,
+        "gcodes": gcodes,
+        "class_size": class_size,
+        "class_sizes": class_sizes,
+        "not_offered": sorted(set().union(*not_offered_by_group.values())),
+        "not_offered_by_group": not_offered_by_group,
+        "deferred": deferred,
+        "context": ctx if deferred else None,
+    }
+
+
+def apply_rule1(base, pubclass_qualified_num, profiler=None):
+    """在 evaluate_base 的结果上按阈值标记依赖阈值的规则（内置为规则一）并生成导出顺序；
+    base 不会被修改。返回值同 evaluate_rules"""
+    prof = profiler or NULL_PROFILER
+    codes = base["codes"].copy()
+    rank = base["rank"]
+    for code, stage, cand, node in base["deferred"]:
+        # 候选行 & 依赖阈值的条件；覆盖编号更大（优先级更低）的规则
+        with prof.stage(stage) as rec:
+            hit = cand & base["context"].evaluate(node, pubclass_qualified_num)
+            hit &= (codes == NO_RULE) | (codes > code)
+            if rank[hit].any():
+                # 课程分组序只对 not_offered 规则有效，被覆盖的行清零
+                rank = rank.copy() if rank is base["rank"] else rank
+                rank[hit] = 0
+            codes[hit] = code
+            rec["rows"] = int(hit.sum())
+
+    hit = np.flatnonzero(codes != NO_RULE)
+    gcodes = base["gcodes"]
+    # 主键：班级；其次规则编号；not_offered 规则内按课程分组序；最后保持原行序
+    export_pos = hit[np.lexsort((hit, rank[hit], codes[hit], gcodes[hit]))]
+    return {
+        "codes": codes,
+        "export_pos": export_pos,
+        "class_size": base["class_size"],
+        "class_sizes": base["class_sizes"],
+        "not_offered": base["not_offered"],
+        "not_offered_by_group": base["not_offered_by_group"],
+    }
+
+
+def log_not_offered(log, names, prefix="规则二："):
+    """日志中输出未开设课程名称（全部列出）"""
+    if names:
+        log(f"{prefix}未开设课程（{len(names)}）：")
+        for name in names:
+            log(f"  - {name}")
+    else:
+        log(f"{prefix}未开设课程（0）")
+
+
+def dedup_positions(df, positions, subset_cols):
+    """在导出顺序下按 subset_cols 去重（保留首条），返回保留的行位置"""
+    if not subset_cols or len(positions) == 0:
+        return positions
+    keys = df[subset_cols].iloc[positions]
+    return positions[~keys.duplicated(keep="first").to_numpy()]
+
+
+def take_labeled(df, positions, codes, pubclass_qualified_num, ruleset=None):
+    """按位置取出行并附加“来源规则”分类列（此处为唯一一次整行复制）"""
+    out = df.iloc[positions]
+    if len(out):
+        labels = pd.Categorical.from_codes(codes[positions], categories=rule_labels(pubclass_qualified_num, ruleset))
+        out = out.assign(**{LABEL_COL: labels})
+    return out
@@ -0,0 +1,540 @@
+# score_filter_ruleset.py
+# -*- coding: utf-8 -*-
+"""
+声明式规则配置：列名、谓词、阈值、来源规则文字、去重键都写在 JSON 配置里，改政策不必改代码、重新打包。
+
+配置在批处理开始时编译一次（compile_ruleset / load_ruleset），得到可 pickle 的 RuleSet，
+随参数传给各进程；score_filter_rules 用它对每个文件做向量化求值：
+- 谓词编译为节点树，每个节点对整列求值得到布尔数组；同一文件内相同的子表达式
+  （如“一层节点含 公共选修课”）只计算一次；
+- 规则的 when 为 all 时，不引用 threshold 的条件在 evaluate_base 中先算好，
+  引用 threshold（公选课学分阈值）的条件留到 apply_rule1，阈值变化时只重算这部分。
+
+内置规则即 DEFAULT_RULES_CONFIG（与历史行为逐字节一致）。导出模板：
+    python main.py --dump-rules 规则.json
+配置格式：
+{
+  "params":  {"pass_score": 60},                   # 供谓词 {"param": "..."} 与文字模板引用
+  "columns": {                                    # 逻辑列名 -> 表头
+    "student_id": {"index": 0},                   # 按位置
+    "course_type": {"name": "一层节点", "optional": true},   # optional：缺列时按全空值参与计算
+    "score": {"name": "成绩", "numeric": true},    # numeric：读取后数值化（无法解析的值置空）
+    "term": {"names": ["学年学期", "学期"]}          # 依次尝试
+  },
+  "exclude": {"when": 谓词, "label": "'其它' 行"},  # 整行排除（不参与班级人数与任何规则）
+  "dedup_keys": ["student_id", "course_name", "term"],
+  "rules": [                                      # 按展示顺序；priority 小者先导出、去重时保留
+    {"id": "rule1", "name": "规则一", "priority": 2, "label": "...{threshold}...",
+     "when": 谓词, "not_offered": false, "failed_credit": false,
+     "csv": "公选_学分小于{threshold}", "summary": "{name}: 学生数 {students}, 记录 {records}",
+     "log": "{name}：学生数 {students}，记录 {records}"}
+  ]
+}
+谓词：{"all": [...]} / {"any": [...]} / {"not": 谓词} /
+      {"column": 列, "lt"|"le"|"gt"|"ge"|"eq"|"ne": 数值或 {"param": 名}} /
+      {"column": 列, "equals": 文字} / {"column": 列, "in": [文字, ...]} / {"column": 列, "contains": 文字} /
+      {"column": 列, "isna": true|false}
+not_offered：命中行按 (班级, course_name 列) 统计，全班都命中的课程视为“未开设”，整组不导出；
+             课程名为空的行不导出。至多一条规则可设置。
+每行至多命中一条规则（priority 最小者）；引用了非 optional 且表中缺失的列的规则不会命中任何行。
+label / csv / summary / log 中可用 {threshold} 与 params 中的参数；summary / log 另可用 {name} {records}
+{students}，not_offered 规则的 summary 还可用 {not_offered_count} {not_offered}。
+"""
+import abc
+import copy
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+from score_filter_rules import (
+    PASS_SCORE, OTHER_COURSE_TYPE, PUBLIC_COURSE_TYPE, TERM_COLUMNS, find_col_exact, str_mask, _float_values,
+)
+
+THRESHOLD_PARAM = "threshold"
+_NUMERIC_OPS = {"lt": np.less, "le": np.less_equal, "gt": np.greater, "ge": np.greater_equal,
+                "eq": np.equal, "ne": np.not_equal}
+_TEXT_OPS = ("equals", "in", "contains")
+
+_PUBLIC = {"column": "course_type", "contains": PUBLIC_COURSE_TYPE}
+_BLANK_OR_ZERO = {"any": [{"column": "score", "isna": True}, {"column": "score", "eq": 0}]}
+_BELOW_PASS = {"column": "score", "lt": {"param": "pass_score"}}
+
+DEFAULT_RULES_CONFIG = {
+    "version": 1,
+    "params": {"pass_score": PASS_SCORE},
+    "columns": {
+        "student_id": {"index": 0},
+        "course_type": {"name": "一层节点", "optional": True},
+        "course_name": {"name": "课程名称"},
+        "credit": {"name": "获得学分", "numeric": True},
+        "score": {"name": "成绩", "numeric": True},
+        "term": {"names": list(TERM_COLUMNS)},
+    },
+    "exclude": {"when": {"column": "course_type", "equals": OTHER_COURSE_TYPE}, "label": f"'{OTHER_COURSE_TYPE}' 行"},
+    "dedup_keys": ["student_id", "course_name", "term"],
+    "rules": [
+        {
+            "id": "rule1", "name": "规则一", "priority": 2,
+            "label": "规则一: 公选 学分<{threshold} 且 成绩<{pass_score}/空",
+            "when": {"all": [_PUBLIC,
+                             {"any": [_BELOW_PASS, {"column": "score", "isna": True}]},
+                             {"column": "credit", "lt": {"param": THRESHOLD_PARAM}}]},
+            "csv": "公选_学分小于{threshold}",
+            "summary": "{name}: 学分<{threshold} 且 成绩<{pass_score}/空 - 学生数 {students}, 记录 {records}",
+        },
+        {
+            "id": "rule2", "name": "规则二", "priority": 0,
+            "label": "规则二: 非公选 正常开设 成绩0分/空白",
+            "when": {"all": [{"not": _PUBLIC}, _BLANK_OR_ZERO]},
+            "not_offered": True, "failed_credit": True,
+            "csv": "其他_0分需关注",
+            "log": "{name}：需关注记录 {records}",
+            "summary": "{name}: 需关注记录 {records}, 未开设课程 {not_offered_count}：{not_offered}",
+        },
+        {
+            "id": "rule3", "name": "规则三", "priority": 1,
+            "label": "规则三: 非公选 正常开设 0<成绩<{pass_score}",
+            "when": {"all": [{"not": _PUBLIC}, {"not": _BLANK_OR_ZERO}, _BELOW_PASS]},
+            "failed_credit": True,
+            "csv": "其他_不及格小于{pass_score}",
+            "log": "{name}：不及格人数 {students}，记录 {records}",
+            "summary": "{name}: 不及格人数 {students}, 记录 {records}",
+        },
+    ],
+}
+DEFAULT_SUMMARY = "{name}: 学生数 {students}, 记录 {records}"
+DEFAULT_LOG = "{name}：学生数 {students}，记录 {records}"
+
+
+def _error(msg):
+    return ValueError(f"规则配置错误：{msg}")
+
+
+# ---------------- 谓词节点 ----------------
+
+class _Node(abc.ABC):
+    """谓词节点。key 为规范化的 JSON（同一文件内据此复用结果）；columns / params 为引用的逻辑列与参数"""
+    key = ""
+    columns = frozenset()
+    params = frozenset()
+
+    @abc.abstractmethod
+    def eval(self, ctx):
+        """在 EvalContext 上求值，返回长度为 ctx.n 的布尔数组"""
+
+
+class _Numeric(_Node):
+    def __init__(self, column, op, value):
+        self.column, self.op, self.value = column, op, value
+        self.columns = frozenset([column])
+        self.params = frozenset([value["param"]]) if isinstance(value, dict) else frozenset()
+
+    def eval(self, ctx):
+        x = ctx.numbers(self.column)
+        if x is None:
+            return np.zeros(ctx.n, dtype=bool)
+        v = ctx.params[self.value["param"]] if isinstance(self.value, dict) else self.value
+        with np.errstate(invalid="ignore"):
+            return _NUMERIC_OPS[self.op](x, v)
+
+
+class _Text(_Node):
+    def __init__(self, column, op, value):
+        self.column, self.op, self.value = column, op, value
+        self.columns = frozenset([column])
+
+    def eval(self, ctx):
+        s = ctx.series(self.column)
+        if s is None:
+            return np.zeros(ctx.n, dtype=bool)
+        if self.op == "equals":
+            fn = lambda t: t == self.value
+        elif self.op == "in":
+            fn = lambda t: t.isin(self.value)
+        else:
+            fn = lambda t: t.str.contains(self.value, regex=False, na=False)
+        # 空值不等于、也不包含任何文字
+        return str_mask(s, fn) & s.notna().to_numpy()
+
+
+class _IsNull(_Node):
+    def __init__(self, column, flag):
+        self.column, self.flag = column, bool(flag)
+        self.columns = frozenset([column])
+
+    def eval(self, ctx):
+        s = ctx.series(self.column)
+        if s is None:
+            na = np.ones(ctx.n, dtype=bool)
+        elif ctx.is_numeric(self.column):
+            na = np.isnan(ctx.numbers(self.column))
+        else:
+            na = s.isna().to_numpy()
+        return na if self.flag else ~na
+
+
+class _All(_Node):
+    def __init__(self, children):
+        self.children = children
+        self.columns = frozenset().union(*(c.columns for c in children))
+        self.params = frozenset().union(*(c.params for c in children))
+
+    def eval(self, ctx):
+        out = np.ones(ctx.n, dtype=bool)
+        for c in self.children:
+            out = out & ctx.mask(c)
+        return out
+
+
+class _Any(_Node):
+    def __init__(self, children):
+        self.children = children
+        self.columns = frozenset().union(*(c.columns for c in children))
+        self.params = frozenset().union(*(c.params for c in children))
+
+    def eval(self, ctx):
+        out = np.zeros(ctx.n, dtype=bool)
+        for c in self.children:
+            out = out | ctx.mask(c)
+        return out
+
+
+class _Not(_Node):
+    def __init__(self, child):
+        self.child = child
+        self.columns, self.params = child.columns, child.params
+
+    def eval(self, ctx):
+        return ~ctx.mask(self.child)
+
+
+def _compile_predicate(spec, columns, params, where):
+    if not isinstance(spec, dict):
+        raise _error(f"{where}：谓词应为对象，实际为 {spec!r}")
+    if "all" in spec or "any" in spec:
+        kind = "all" if "all" in spec else "any"
+        items = spec[kind]
+        if not isinstance(items, list) or not items:
+            raise _error(f"{where}：{kind} 应为非空列表")
+        children = [_compile_predicate(s, columns, params, where) for s in items]
+        node = _All(children) if kind == "all" else _Any(children)
+    elif "not" in spec:
+        node = _Not(_compile_predicate(spec["not"], columns, params, where))
+    elif "column" in spec:
+        col = spec["column"]
+        if col not in columns:
+            raise _error(f"{where}：未定义的列 {col!r}（可用：{', '.join(columns)}）")
+        ops = [k for k in spec if k != "column"]
+        if len(ops) != 1:
+            raise _error(f"{where}：列条件只能有一个比较运算，实际为 {ops}")
+        op = ops[0]
+        value = spec[op]
+        if op in _NUMERIC_OPS:
+            if isinstance(value, dict):
+                name = value.get("param")
+                if name != THRESHOLD_PARAM and name not in params:
+                    raise _error(f"{where}：未定义的参数 {name!r}")
+            elif not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise _error(f"{where}：{op} 的值应为数值或 {{\"param\": 名}}")
+            node = _Numeric(col, op, value)
+        elif op in _TEXT_OPS:
+            if op == "in":
+                if not isinstance(value, list):
+                    raise _error(f"{where}：in 的值应为列表")
+                value = [str(v) for v in value]
+            else:
+                value = str(value)
+            node = _Text(col, op, value)
+        elif op == "isna":
+            node = _IsNull(col, value)
+        else:
+            raise _error(f"{where}：未知的运算 {op!r}")
+    else:
+        raise _error(f"{where}：无法识别的谓词 {spec!r}")
+    node.key = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+    return node
+
+
+def _split_threshold(node):
+    """when -> (与阈值无关部分, 依赖阈值部分)；各自可能为 None。只拆分顶层 all"""
+    if THRESHOLD_PARAM not in node.params:
+        return node, None
+    if not isinstance(node, _All):
+        return None, node
+    base = [c for c in node.children if THRESHOLD_PARAM not in c.params]
+    later = [c for c in node.children if THRESHOLD_PARAM in c.params]
+
+    def _join(parts):
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        joined = _All(parts)
+        joined.key = json.dumps({"all": [json.loads(p.key) for p in parts]}, sort_keys=True, ensure_ascii=False)
+        return joined
+
+    return _join(base), _join(later)
+
+
+# ---------------- 求值上下文 ----------------
+
+class EvalContext:
+    """
+    一个 DataFrame 上的求值上下文：缓存数值化后的列与子表达式结果（依赖阈值的节点不缓存）。
+    可 pickle（随 evaluate_base 的结果保存在 FrameStore 中）。
+    """
+
+    def __init__(self, df, cols, params, numeric_keys):
+        self.df = df
+        self.cols = cols
+        self.params = dict(params)
+        self.numeric_keys = frozenset(numeric_keys)
+        self.n = len(df)
+        self.memo = {}
+
+    def series(self, key):
+        c = self.cols.get(key)
+        return None if c is None else self.df[c]
+
+    def is_numeric(self, key):
+        return key in self.numeric_keys
+
+    def numbers(self, key):
+        c = self.cols.get(key)
+        if c is None:
+            return None
+        memo_key = ("numbers", key)
+        if memo_key not in self.memo:
+            s = self.df[c]
+            if s.dtype.kind not in "fiub":
+                import pandas as pd
+                s = pd.to_numeric(s, errors="coerce")
+            self.memo[memo_key] = _float_values(s)
+        return self.memo[memo_key]
+
+    def mask(self, node):
+        if THRESHOLD_PARAM in node.params:
+            return node.eval(self)
+        hit = self.memo.get(node.key)
+        if hit is None:
+            hit = self.memo[node.key] = node.eval(self)
+        return hit
+
+    def evaluate(self, node, threshold):
+        """对依赖阈值的节点求值"""
+        self.params[THRESHOLD_PARAM] = threshold
+        try:
+            return self.mask(node)
+        finally:
+            self.params.pop(THRESHOLD_PARAM, None)
+
+    def release(self):
+        """丢弃缓存的中间结果（evaluate_base 完成后调用，只保留对原表的引用）"""
+        self.memo.clear()
+
+
+# ---------------- 编译结果 ----------------
+
+class Rule:
+    """编译后的单条规则。code 为导出顺序编号（priority 排名）"""
+
+    def __init__(self, spec, code, when, columns_spec):
+        self.id = spec["id"]
+        self.name = spec.get("name", self.id)
+        self.code = code
+        self.label = spec.get("label", self.name)
+        self.csv = spec.get("csv", self.id)
+        self.summary = spec.get("summary", DEFAULT_SUMMARY)
+        self.log = spec.get("log", DEFAULT_LOG)
+        self.not_offered = bool(spec.get("not_offered", False))
+        self.failed_credit = bool(spec.get("failed_credit", False))
+        self.base, self.deferred = _split_threshold(when)
+        # 缺失时规则不命中的列：引用到的非 optional 列
+        self.required = frozenset(c for c in when.columns if not columns_spec[c].get("optional"))
+
+    @property
+    def output_key(self):
+        """outputs 中分规则 CSV 的键"""
+        return f"csv_{self.id}"
+
+
+class RuleSet:
+    """
+    编译后的规则配置（见模块说明）。主要属性：
+        rules:       按配置顺序（展示顺序）的 Rule 列表
+        by_code:     按导出顺序（code）的 Rule 列表
+        numeric_keys / dedup_keys / exclude / exclude_label / params
+        digest:      配置内容的哈希（参与缓存键）；is_default: 是否为内置规则
+    """
+
+    def __init__(self, config):
+        self.config = copy.deepcopy(config)
+        canonical = json.dumps(self.config, sort_keys=True, ensure_ascii=False)
+        self.digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+        self.params = dict(self.config.get("params", {}))
+        if THRESHOLD_PARAM in self.params:
+            raise _error(f"参数名 {THRESHOLD_PARAM!r} 保留给公选课学分阈值")
+
+        self.columns = self.config.get("columns") or {}
+        if "student_id" not in self.columns:
+            raise _error("columns 必须定义 student_id（学号）")
+        for key, spec in self.columns.items():
+            if not isinstance(spec, dict) or not ({"index", "name", "names"} & set(spec)):
+                raise _error(f"列 {key!r} 需要 index、name 或 names")
+        self.numeric_keys = tuple(k for k, spec in self.columns.items() if spec.get("numeric"))
+
+        exclude = self.config.get("exclude")
+        self.exclude = self.exclude_label = None
+        if exclude:
+            self.exclude = _compile_predicate(exclude["when"], self.columns, self.params, "exclude")
+            if THRESHOLD_PARAM in self.exclude.params:
+                raise _error("exclude 不能引用 threshold")
+            self.exclude_label = exclude.get("label", "排除行")
+
+        self.dedup_keys = list(self.config.get("dedup_keys", []))
+        for key in self.dedup_keys:
+            if key not in self.columns:
+                raise _error(f"dedup_keys 中未定义的列 {key!r}")
+
+        specs = self.config.get("rules") or []
+        if not specs:
+            raise _error("rules 不能为空")
+        ids = [s.get("id") for s in specs]
+        if None in ids or len(set(ids)) != len(ids):
+            raise _error("每条规则需要唯一的 id")
+        # priority 小者先导出；相同时按配置顺序
+        order = sorted(range(len(specs)), key=lambda i: (specs[i].get("priority", i), i))
+        code_of = {i: code for code, i in enumerate(order)}
+        self.rules = []
+        for i, spec in enumerate(specs):
+            where = f"规则 {spec['id']}"
+            if "when" not in spec:
+                raise _error(f"{where} 缺少 when")
+            when = _compile_predicate(spec["when"], self.columns, self.params, where)
+            rule = Rule(spec, code_of[i], when, self.columns)
+            if rule.not_offered and rule.deferred is not None:
+                raise _error(f"{where}：not_offered 规则不能引用 threshold")
+            self.rules.append(rule)
+        self.by_code = sorted(self.rules, key=lambda r: r.code)
+        self._check_unique("label", lambda r: r.label)
+        # Windows 文件名不区分大小写
+        self._check_unique("csv", lambda r: r.csv, fold=True)
+        offered = [r for r in self.rules if r.not_offered]
+        if len(offered) > 1:
+            raise _error("至多一条规则可设置 not_offered")
+        if offered and "course_name" not in self.columns:
+            raise _error("not_offered 规则需要在 columns 中定义 course_name（课程名）")
+        self.not_offered_rule = offered[0] if offered else None
+        self.is_default = self.digest == _DEFAULT_DIGEST
+
+    def _check_unique(self, field, get, fold=False):
+        """来源规则文字（导出时作为分类值）与 CSV 后缀（输出路径）不能重复；
+        threshold 保留为占位符比较，其余参数代入后比较"""
+        seen = {}
+        for r in self.rules:
+            try:
+                text = self._fmt(get(r), "{threshold}")
+            except (KeyError, IndexError, ValueError) as e:
+                raise _error(f"规则 {r.id} 的 {field} 模板有误：{e!r}") from None
+            key = text.casefold() if fold else text
+            if key in seen:
+                raise _error(f"规则 {seen[key]} 与 {r.id} 的 {field} 相同：{text!r}")
+            seen[key] = r.id
+
+    # ----- 列 -----
+    def detect(self, columns):
+        """表头 -> {逻辑列名: 实际列名或 None}"""
+        columns = list(columns)
+        cols = {}
+        for key, spec in self.columns.items():
+            if "index" in spec:
+                i = spec["index"]
+                cols[key] = columns[i] if -len(columns) <= i < len(columns) else None
+                continue
+            found = None
+            for name in ([spec["name"]] if "name" in spec else spec["names"]):
+                found = find_col_exact(columns, name)
+                if found is not None:
+                    break
+            cols[key] = found
+        return cols
+
+    def enabled(self, rule, cols):
+        """规则所需的列都存在"""
+        return all(cols.get(k) is not None for k in rule.required)
+
+    def exclude_enabled(self, cols):
+        """是否计算排除条件（缺少非 optional 列时不排除任何行）"""
+        return self.exclude is not None and all(
+            cols.get(k) is not None for k in self.exclude.columns if not self.columns[k].get("optional"))
+
+    def exclude_present(self, cols):
+        """排除条件引用的列都存在（日志中报告过滤行数）"""
+        return self.exclude is not None and all(cols.get(k) is not None for k in self.exclude.columns)
+
+    def context(self, df, cols):
+        return EvalContext(df, cols, self.params, self.numeric_keys)
+
+    # ----- 文字 -----
+    def _fmt(self, template, threshold, **extra):
+        return template.format(threshold=threshold, **self.params, **extra)
+
+    def labels(self, threshold):
+        """规则编号 -> 来源规则文字"""
+        return [self._fmt(r.label, threshold) for r in self.by_code]
+
+    def csv_names(self, threshold):
+        """{outputs 键: 文件名后缀}（按配置顺序）"""
+        return {r.output_key: self._fmt(r.csv, threshold) for r in self.rules}
+
+    @property
+    def not_offered_prefix(self):
+        """未开设课程日志的前缀（见 score_filter_rules.log_not_offered）"""
+        rule = self.not_offered_rule
+        return None if rule is None else f"{rule.name}："
+
+    @property
+    def failed_codes(self):
+        """计入不及格学分的规则编号"""
+        return [r.code for r in self.rules if r.failed_credit]
+
+    def summary_lines(self, stats, threshold, not_offered):
+        """stats: {code: (记录数, 学生数)}；not_offered: 未开设课程名列表"""
+        noff = "无" if not not_offered else "、".join(not_offered)
+        return [self._fmt(r.summary, threshold, name=r.name, records=stats[r.code][0],
+                          students=stats[r.code][1], not_offered_count=len(not_offered), not_offered=noff)
+                for r in self.rules]
+
+    def log_line(self, rule, stats):
+        return self._fmt(rule.log, None, name=rule.name, records=stats[rule.code][0], students=stats[rule.code][1])
+
+    def __repr__(self):
+        return f"RuleSet({', '.join(r.id for r in self.rules)}, digest={self.digest})"
+
+
+def compile_ruleset(config):
+    """配置 dict -> RuleSet；配置有误时抛出 ValueError"""
+    return RuleSet(config)
+
+
+def load_ruleset(path=None):
+    """从 JSON 文件加载并编译规则配置；path 为 None 时返回内置规则"""
+    if path is None:
+        return DEFAULT_RULESET
+    try:
+        config = json.loads(Path(path).read_text(encoding="utf-8-sig"))
+    except json.JSONDecodeError as e:
+        raise _error(f"{path} 不是合法的 JSON：{e}") from None
+    return compile_ruleset(config)
+
+
+def dump_default_config(path):
+    """把内置规则写成 JSON，作为自定义规则的模板"""
+    Path(path).write_text(json.dumps(DEFAULT_RULES_CONFIG, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+_DEFAULT_DIGEST = hashlib.sha256(json.dumps(DEFAULT_RULES_CONFIG, sort_keys=True, ensure_ascii=False)
+                                 .encode("utf-8")).hexdigest()[:16]
+DEFAULT_RULESET = compile_ruleset(DEFAULT_RULES_CONFIG)
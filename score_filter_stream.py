@@ -0,0 +1,353 @@
+# score_filter_stream.py
+# -*- coding: utf-8 -*-
+"""
+超大文件的分块流式处理（全校汇总导出等）。
+
+- 按块读取（openpyxl 只读模式），每块独立计算规则一/三；
+- 规则二依赖全表的“班级人数”和各课程空/0 学生数，用增量累加器（学生集合）统计，
+  候选行先按课程排序落盘，全部读完后再剔除未开设课程；
+- 导出时对各块落盘结果做多路归并，保持与整表处理相同的行顺序，逐行写出；
+- 指定分班列时，累加器按 (班级, 课程) 统计，每班写一个工作表；规则一/三的命中行也按班级
+  逐块分组落盘并归并，分规则 CSV 与整表处理一样按“班级 -> 原行序”排列。
+峰值内存只与块大小、学生数和导出行数有关，与输入文件大小无关。
+"""
+import heapq
+import math
+import pickle
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from score_filter_io import (
+    iter_excel_chunks, export_paths, safe_sheet_names, ExcelStreamWriter, TableStreamWriter,
+)
+from score_filter_rules import (
+    LABEL_COL, find_col_exact, detect_columns, normalize_frame, dedup_columns,
+    evaluate_rules, rule_labels, partition_names, log_not_offered,
+)
+from score_filter_ruleset import DEFAULT_RULESET
+from score_filter_profile import NULL_PROFILER
+from score_filter_report import report_records
+
+DEFAULT_CHUNKSIZE = 50_000
+
+
+def _course_sort_key(course):
+    # 与 pandas 对字符串分组键的排序一致；混合类型时按类型名分开
+    return type(course).__name__, course
+
+
+def _dump_frames(path):
+    """返回一个向 path 追加写入对象的函数及对应文件句柄"""
+    f = open(path, "wb")
+    return f, lambda obj: pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load_all(path):
+    """逐个读出 path 中依次写入的对象"""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _na_to_none(v):
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return None
+    return v
+
+
+def _timed_chunks(chunks, profiler):
+    """把每块的读取耗时计入 read 阶段"""
+    it = iter(chunks)
+    while True:
+        with profiler.stage("read") as rec:
+            chunk = next(it, None)
+            rec["rows"] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def process_streaming(infile, pubclass_qualified_num, divide_output, out_dir, log,
+                      chunksize=DEFAULT_CHUNKSIZE, partition_col=None, writer="auto", extra_formats=(),
+                      profiler=NULL_PROFILER, report=False, ruleset=None):
+    """
+    分块流式处理单个 .xlsx。返回值与 score_filter_core._export_prepared 相同。
+    partition_col: 分班列名；指定时累加器按 (班级, 课程) 统计，每班一个工作表
+    writer: xlsx 流式写出后端（auto / xlsxwriter / openpyxl）
+    extra_formats: 仅支持 ("parquet",)，按块追加写出
+    profiler: StageProfiler；各阶段按块累加，另记 spill（中间结果落盘）
+    report: 为 True 时在写出的同时收集总表行的精简记录（report_records）
+    ruleset: 规则配置（见 score_filter_ruleset）；None 为内置规则。not_offered 规则（规则二）走累加器，
+             其余规则（规则一/三）逐块落盘
+    """
+    ruleset = ruleset or DEFAULT_RULESET
+    noff = ruleset.not_offered_rule
+    spilled = [r.code for r in ruleset.by_code if not r.not_offered]
+    unsupported = set(extra_formats) - {"parquet"}
+    if unsupported:
+        raise ValueError(f"流式模式不支持输出：{', '.join(sorted(unsupported))}")
+    infile = Path(infile)
+    log(f"流式读取文件: {infile}（每块 {chunksize} 行）")
+    with tempfile.TemporaryDirectory(prefix="score_filter_") as tmp:
+        tmp = Path(tmp)
+        cols = header = group_col = None
+        students = set()                  # 总人数累加器
+        group_students = defaultdict(set)  # 班级 -> 学生（班级人数累加器）
+        zero_students = defaultdict(set)  # (班级, 课程) -> 成绩空/0 的学生（规则二）
+        rule_rows = {code: 0 for code in spilled}
+        rule_students = {r.code: set() for r in ruleset.rules}
+        spill = {code: _dump_frames(tmp / f"rule{code}.pkl") for code in spilled}
+        # 分班时规则一/三每块按班级排序后单独落盘，导出时按班级归并
+        group_files = {code: [] for code in spilled}
+        rule2_files = []
+        # 成绩/学分列 -> [是否有块混有文字, 各块读取时是否都是整数列, 各块保留行是否都是整数值]
+        integral = {}
+        total = kept = 0
+
+        try:
+            for i, chunk in enumerate(_timed_chunks(iter_excel_chunks(infile, chunksize), profiler)):
+                if cols is None:
+                    with profiler.stage("columns"):
+                        cols = detect_columns(chunk.columns, ruleset)
+                    header = list(chunk.columns)
+                    log(f"列识别: 学号={cols['student_id']}, 成绩={cols.get('score')}, 学分={cols.get('credit')}")
+                    if partition_col:
+                        group_col = find_col_exact(header, partition_col)
+                        if group_col is None:
+                            raise ValueError(f"未找到分班列：{partition_col}")
+                with profiler.stage("filter") as rec:
+                    numeric = [c for c in (cols.get(k) for k in ruleset.numeric_keys) if c is not None]
+                    raw = {c: (chunk[c].dtype, chunk[c].notna().to_numpy()) for c in numeric}
+                    valid, _ = normalize_frame(chunk, cols, ruleset)
+                    # 各块单独数值化时，全为整数的块得到 int64、其余为 float64。块内统一为 float64，
+                    # 导出时再按全表结果取类型（与整表处理一致），避免 CSV 中混有“2”与“2.0”
+                    for c in numeric:
+                        if len(chunk):
+                            dtype, present = raw[c]
+                            flags = integral.setdefault(c, [False, True, True])
+                            x = chunk[c].to_numpy(dtype="float64", na_value=np.nan)
+                            # 文字：原本非空、数值化后为空（整块为空值时也是 object 列，不算文字）
+                            flags[0] = flags[0] or bool((np.isnan(x) & present).any())
+                            flags[1] = flags[1] and pd.api.types.is_integer_dtype(dtype)
+                            x = x[valid]
+                            flags[2] = flags[2] and bool(np.isfinite(x).all() and (x == np.trunc(x)).all())
+                        chunk[c] = chunk[c].astype("float64")
+                    total += len(chunk)
+                    kept += int(valid.sum())
+                    sid = chunk[cols["student_id"]]
+                    # 班级键：不分班时整表为同一个班（键为 None）
+                    gkey = partition_names(chunk[group_col]) if group_col is not None else None
+                    students.update(sid[valid].dropna())
+                    if gkey is not None:
+                        for g, s_ in sid[valid].dropna().groupby(gkey[valid]):
+                            group_students[g].update(s_)
+                        for g in gkey.unique():
+                            group_students.setdefault(g, set())
+                    rec["rows"] = int(valid.sum())
+
+                codes = evaluate_rules(chunk, cols, pubclass_qualified_num, valid=valid,
+                                       defer_not_offered=True, profiler=profiler, ruleset=ruleset)["codes"]
+                with profiler.stage("spill"):
+                    for code in spilled:
+                        pos = np.flatnonzero(codes == code)
+                        if pos.size:
+                            part = chunk.iloc[pos]
+                            if gkey is None:
+                                spill[code][1](part)
+                            else:
+                                path = tmp / f"group{code}_{i}.pkl"
+                                f, dump = _dump_frames(path)
+                                with f:
+                                    for g, gpart in part.groupby(gkey.iloc[pos], sort=True):
+                                        dump((g, gpart))
+                                group_files[code].append(path)
+                            rule_rows[code] += len(part)
+                            rule_students[code].update(part[cols["student_id"]].dropna())
+
+                    # 规则二候选：按 (班级, 课程) 排序后逐组落盘，供最终多路归并
+                    pos = np.flatnonzero(codes == noff.code) if noff is not None else []
+                    if len(pos):
+                        part = chunk.iloc[pos]
+                        path = tmp / f"offered_{i}.pkl"
+                        f, dump = _dump_frames(path)
+                        with f:
+                            if cols.get("course_name") is not None:
+                                pg = gkey.iloc[pos] if gkey is not None else None
+                                keys = [pg, cols["course_name"]] if pg is not None else cols["course_name"]
+                                for key, g in part.groupby(keys, sort=True):
+                                    key = key if pg is not None else (None, key)
+                                    zero_students[key].update(g[cols["student_id"]].dropna())
+                                    dump((key, g))
+                            else:
+                                dump(((None, None), part))
+                        rule2_files.append(path)
+                log(f"已读取 {total} 行（第 {i + 1} 块）")
+        finally:
+            for f, _ in spill.values():
+                f.close()
+
+        if cols is None:
+            raise ValueError(f"工作表为空：{infile.name}")
+        if ruleset.exclude_present(cols):
+            log(f"已过滤 {ruleset.exclude_label}：{total} -> {kept}")
+        if group_col is not None:
+            log(f"按 '{group_col}' 分班：{len(group_students)} 个班")
+
+        class_size = len(students)
+        log(f"班级总人数: {class_size}")
+        sizes = {g: len(v) for g, v in group_students.items()} if group_col is not None else {None: class_size}
+        not_offered = {key for key, v in zero_students.items() if len(v) == sizes[key[0]]}
+        not_offered_sorted = sorted({str(c) for _, c in not_offered})
+        del zero_students, group_students
+
+        # 按配置顺序输出统计；规则二（not_offered）的记录数写出时才能确定，它及其后的规则在写出后输出
+        stats = {code: (rule_rows[code], len(rule_students[code])) for code in spilled}
+        later = list(ruleset.rules)
+        while later and not later[0].not_offered:
+            log(ruleset.log_line(later.pop(0), stats))
+        group_info = None
+        if group_col is not None:
+            group_info = [{"name": g, "class_size": sizes[g],
+                           "not_offered": sorted({str(c) for gg, c in not_offered if gg == g})}
+                          for g in sorted(sizes)]
+        if noff is not None:
+            prefix = ruleset.not_offered_prefix
+            if group_info is None:
+                log_not_offered(log, not_offered_sorted, prefix=prefix)
+            else:
+                for info in group_info:
+                    log_not_offered(log, info["not_offered"], prefix=f"{prefix}[{info['name']}] ")
+
+        # ---------- 导出：规则二（按班级、课程归并）-> 规则三 -> 规则一，逐块去重写出 ----------
+        def rule2_frames():
+            streams = [_load_all(p) for p in rule2_files]
+            merged = heapq.merge(*streams, key=lambda t: (_course_sort_key(t[0][0]), _course_sort_key(t[0][1])))
+            for key, g in merged:
+                if key[1] is None or key not in not_offered:
+                    yield g
+
+        def spilled_frames(code):
+            if group_col is None:
+                yield from _load_all(tmp / f"rule{code}.pkl")
+                return
+            streams = [_load_all(p) for p in group_files[code]]
+            for _, g in heapq.merge(*streams, key=lambda t: _course_sort_key(t[0])):
+                yield g
+
+        with profiler.stage("write") as write_rec:
+            out_dir = Path(out_dir)
+            out_dir.mkdir(parents=True, exist_ok=True)
+            paths = export_paths(infile, out_dir, pubclass_qualified_num, ruleset)
+            labels = rule_labels(pubclass_qualified_num, ruleset)
+            subset_cols = dedup_columns(cols, group_col, ruleset)
+            seen = set()
+            rule2_rows = written = 0
+            # 与整表处理（见 normalize_frame）一致：读取时全表都是整数列，或该列混有文字而保留的行
+            # 都是整数时，导出为整数
+            as_int = {c: "int64" for c, (text, raw_int, valid_int) in integral.items()
+                      if (valid_int if text else raw_int)}
+            records = [] if report else None
+
+            sheet_of = None
+            if group_info is not None:
+                sheet_of = dict(zip((info["name"] for info in group_info),
+                                    safe_sheet_names(info["name"] for info in group_info)))
+
+            def open_xlsx(labeled):
+                # 与整表处理一致：没有导出行时表头不含“来源规则”列
+                columns = header + [LABEL_COL] if labeled else header
+                if sheet_of is None:
+                    return ExcelStreamWriter(paths["xlsx"], columns, backend=writer)
+                return ExcelStreamWriter(paths["xlsx"], columns, sheets=list(sheet_of.values()), backend=writer)
+
+            xlsx = None  # 首个导出行出现时创建
+            # 分班时列式副本按班级顺序写出（与整表处理一致）：去重后的行先按班级落盘
+            class_spill = {}
+            if sheet_of is not None and extra_formats:
+                class_spill = {g: _dump_frames(tmp / f"export{k}.pkl") for k, g in enumerate(sheet_of)}
+            tables = {}  # 产物键 -> TableStreamWriter（分规则 CSV 首次有数据时创建）
+            for fmt in extra_formats:
+                tables[fmt] = TableStreamWriter(paths[fmt], fmt, numeric_columns=[
+                    cols[k] for k in ruleset.numeric_keys if cols.get(k) is not None], integer_columns=as_int)
+            try:
+                for rule in ruleset.by_code:
+                    code, csv_key = rule.code, rule.output_key
+                    frames = rule2_frames() if rule.not_offered else spilled_frames(code)
+                    for frame in frames:
+                        frame = frame.astype(as_int).assign(**{LABEL_COL: labels[code]})
+                        if rule.not_offered:
+                            rule2_rows += len(frame)
+                            rule_students[code].update(frame[cols["student_id"]].dropna())
+                        if divide_output:
+                            if csv_key not in tables:
+                                tables[csv_key] = TableStreamWriter(paths[csv_key], "csv")
+                            tables[csv_key].append(frame)
+
+                        keys = [tuple(_na_to_none(v) for v in k)
+                                for k in frame[subset_cols].itertuples(index=False, name=None)]
+                        keep = []
+                        for k in keys:
+                            keep.append(k not in seen)
+                            seen.add(k)
+                        rows = frame.loc[keep]
+                        if not len(rows):
+                            continue
+                        if xlsx is None:
+                            xlsx = open_xlsx(labeled=True)
+                        if group_info is None:
+                            xlsx.append(rows)
+                        else:
+                            for g, part in rows.groupby(partition_names(rows[group_col]), sort=False):
+                                xlsx.append(part, sheet=sheet_of[g])
+                                if class_spill:
+                                    class_spill[g][1](part)
+                        if not class_spill:
+                            for fmt in extra_formats:
+                                tables[fmt].append(rows)
+                        if records is not None:
+                            records.extend(report_records(rows, cols, pubclass_qualified_num, group_col, ruleset))
+                        written += len(rows)
+                if xlsx is None:
+                    xlsx = open_xlsx(labeled=False)
+                for f, _ in class_spill.values():
+                    f.close()
+                    for part in _load_all(f.name):
+                        for fmt in extra_formats:
+                            tables[fmt].append(part)
+                for fmt in extra_formats:
+                    if tables[fmt].rows == 0:
+                        tables[fmt].append(pd.DataFrame(columns=header))
+            finally:
+                for f, _ in class_spill.values():
+                    f.close()
+                if xlsx is not None:
+                    xlsx.close()
+                for t in tables.values():
+                    t.close()
+            write_rec["rows"] = written
+
+        if noff is not None:
+            stats[noff.code] = (rule2_rows, len(rule_students[noff.code]))
+        for rule in later:
+            log(ruleset.log_line(rule, stats))
+        log(f"去重 {subset_cols}: {sum(rows for rows, _ in stats.values())} -> {written}")
+        log(f"总表已导出: {paths['xlsx']}（{xlsx.backend}）")
+        for fmt in extra_formats:
+            log(f"{fmt} 已导出: {paths[fmt]}")
+        if divide_output:
+            log("分规则 CSV 已输出（divide_output=True）")
+
+    return {"class_size": class_size, "stats": stats, "not_offered": not_offered_sorted,
+            "groups": group_info,
+            "writers": {"xlsx": xlsx.backend, **{k: t.backend for k, t in tables.items()}},
+            "extra": {fmt: paths[fmt] for fmt in extra_formats},
+            "report_records": records,
+            "xlsx": paths["xlsx"],
+            **{r.output_key: tables[r.output_key].path if r.output_key in tables else None for r in ruleset.rules}}
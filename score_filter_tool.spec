@@ -1,11 +1,20 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import collect_data_files
-from PyInstaller.utils.hooks import collect_submodules
 
 datas = []
-hiddenimports = ['openpyxl.cell._writer']
+# openpyxl 的其余子模块由静态分析收集，这里只补充动态导入的部分；
+# pandas 的 Excel 引擎按名称动态导入，calamine / xlsxwriter 需显式列出
+hiddenimports = ['openpyxl.cell._writer', 'python_calamine', 'xlsxwriter']
 datas += collect_data_files('openpyxl')
-hiddenimports += collect_submodules('openpyxl')
+
+# 运行时不会导入的模块（测试、绘图、样式、交互环境等）。
+# 注意：pandas.io.sql / html / stata 等在 import pandas 时即被导入，不能排除
+excludes = [
+    'pandas.tests', 'pandas.plotting._matplotlib', 'pandas.io.formats.style', 'pandas.io.clipboard',
+    'numpy.tests', 'numpy.f2py', 'numpy.distutils',
+    'matplotlib', 'scipy', 'IPython', 'jinja2', 'sqlalchemy', 'tables', 'lxml', 'bs4', 'html5lib',
+    'pytest', 'setuptools', 'pydoc_data',
+]
 
 
 a = Analysis(
@@ -17,7 +26,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=excludes,
     noarchive=False,
     optimize=0,
 )
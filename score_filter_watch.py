@@ -0,0 +1,180 @@
+# score_filter_watch.py
+# -*- coding: utf-8 -*-
+"""
+监视目录模式：成绩导出文件陆续放入共享目录时，自动处理新增或修改过的工作簿。
+
+    python main.py 成绩目录 --watch -o 输出 -j 2
+
+- 定时轮询目录（os.scandir，只比较大小与修改时间，不读文件内容）；
+- 去抖：文件的大小与修改时间连续 settle_seconds 秒不变才视为写完，避免读到半截文件；
+- 跳过 Excel 的 ~$ 锁文件与本工具生成的“学业预警表_*”（见 score_filter_io.is_input_candidate）；
+- 内容哈希与上次处理时相同（只是被“另存为”或 touch）时跳过；
+- 在有界进程池中经 process_one_file 处理，同时处理的文件数不超过 workers；
+  处理中的文件再次变化时，完成后重新排队。
+"""
+import os
+import signal
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from score_filter_cache import file_digest
+from score_filter_core import process_one_collect
+from score_filter_io import is_input_candidate
+
+DEFAULT_POLL_SECONDS = 1.0
+DEFAULT_SETTLE_SECONDS = 2.0
+
+
+def _scan(folder, recursive):
+    """目录 -> {路径: (大小, 修改时间 ns)}；扫描期间被删除的文件忽略"""
+    found = {}
+    stack = [folder]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for e in entries:
+            try:
+                if e.is_dir():
+                    if recursive:
+                        stack.append(e.path)
+                elif e.is_file() and is_input_candidate(e.name):
+                    st = e.stat()
+                    found[Path(e.path)] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                pass
+    return found
+
+
+class FolderWatcher:
+    """
+    轮询目录并做去抖。poll() 返回本轮已稳定、需要处理的文件列表。
+    settle_seconds: 大小与修改时间保持不变的最短时间
+    """
+
+    def __init__(self, folder, recursive=False, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.folder = Path(folder)
+        self.recursive = recursive
+        self.settle_seconds = settle_seconds
+        self._pending = {}  # 路径 -> (stat, 首次观察到该 stat 的时刻)
+        self._handled = {}  # 路径 -> 已交付处理时的 stat
+
+    def poll(self, now=None):
+        now = time.monotonic() if now is None else now
+        current = _scan(self.folder, self.recursive)
+        for p in set(self._handled) - set(current):
+            del self._handled[p]
+        for p in set(self._pending) - set(current):
+            del self._pending[p]
+        ready = []
+        for p, stat in sorted(current.items()):
+            if self._handled.get(p) == stat:
+                continue
+            prev = self._pending.get(p)
+            if prev is None or prev[0] != stat:
+                self._pending[p] = (stat, now)
+            elif now - prev[1] >= self.settle_seconds:
+                ready.append(p)
+        return ready
+
+    def mark_handled(self, path):
+        """path 已交付处理：记下当时的 stat，之后只在再次变化时重新报告"""
+        entry = self._pending.pop(path, None)
+        if entry is not None:
+            self._handled[path] = entry[0]
+
+
+def _ignore_sigint():
+    """进程池初始化：Ctrl+C 只由主进程处理，子进程把手头的文件做完"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _collected(fut):
+    """进程池结果；子进程异常退出等错误转为失败结果"""
+    try:
+        return fut.result()
+    except Exception:
+        tb = traceback.format_exc()
+        return False, tb, {}, [tb], []
+
+
+def watch_folder(folder, log_fn=None, workers=1, recursive=False, poll_seconds=DEFAULT_POLL_SECONDS,
+                 settle_seconds=DEFAULT_SETTLE_SECONDS, stop_event=None, result_fn=None, **kwargs):
+    """
+    持续监视 folder，直到 stop_event 置位（或 KeyboardInterrupt）。返回已处理的文件数。
+    workers:   同时处理的文件数上限；<=1 时在当前进程内逐个处理，>1 时使用进程池
+    result_fn: 每处理完一个文件调用 result_fn(dict)，dict 与 process_files 的 results 元素相同
+    kwargs:    其余参数传给 process_one_file（pubclass_qualified_num / output_dir / cache / reader 等）
+    """
+    def log(s=""):
+        if log_fn: log_fn(s)
+        else: print(s)
+
+    watcher = FolderWatcher(folder, recursive=recursive, settle_seconds=settle_seconds)
+    digests = {}   # 路径 -> 上次处理时的内容哈希
+    inflight = {}  # future -> (路径, 哈希)
+    workers = max(1, int(workers or 1))
+    handled = 0
+
+    def _finish(p, digest, collected):
+        nonlocal handled
+        success, summary, outputs, logs, _ = collected
+        for line in logs:
+            log(line)
+        # 失败时不记录哈希：文件再次变化（如重新导出）时重试
+        if success:
+            digests[p] = digest
+        handled += 1
+        log(("已处理: " if success else "处理失败: ") + str(p))
+        log("-" * 60)
+        if result_fn is not None:
+            result_fn({"file": p, "success": success, "summary": summary, "outputs": outputs,
+                       "profile": outputs.get("profile")})
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_ignore_sigint) if workers > 1 else None
+    log(f"开始监视目录: {folder}（每 {poll_seconds:g} 秒检查，文件稳定 {settle_seconds:g} 秒后处理；"
+        f"{workers} 个进程）")
+    try:
+        while stop_event is None or not stop_event.is_set():
+            busy = {p for p, _ in inflight.values()}
+            for p in watcher.poll():
+                # 处理中的文件先不标记，完成后若仍有变化会再次报告
+                if p in busy or len(inflight) >= workers:
+                    continue
+                try:
+                    digest = file_digest(p)
+                except OSError:
+                    continue  # 刚被删除或仍被独占
+                watcher.mark_handled(p)
+                if digests.get(p) == digest:
+                    log(f"内容未变化，跳过: {p}")
+                    continue
+                log(f"检测到新文件或修改: {p}")
+                if pool is None:
+                    _finish(p, digest, process_one_collect(p, kwargs))
+                else:
+                    inflight[pool.submit(process_one_collect, p, kwargs)] = (p, digest)
+                    busy.add(p)
+
+            if inflight:
+                done, _ = wait(inflight, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    p, digest = inflight.pop(fut)
+                    _finish(p, digest, _collected(fut))
+            elif stop_event is not None:
+                stop_event.wait(poll_seconds)
+            else:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        log("收到中断，停止监视（等待处理中的文件完成）…")
+    finally:
+        if pool is not None:
+            for fut in list(inflight):
+                p, digest = inflight.pop(fut)
+                _finish(p, digest, _collected(fut))
+            pool.shutdown(cancel_futures=True)
+    log(f"监视结束：共处理 {handled} 个文件")
+    return handled
@@ -0,0 +1,7 @@
+# tests/conftest.py
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+# 仓库为平铺布局（无安装包），测试直接从仓库根目录导入各模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
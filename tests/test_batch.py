@@ -0,0 +1,36 @@
+# tests/test_batch.py
+# -*- coding: utf-8 -*-
+"""
+批量处理：多进程时结果按输入顺序返回；处理开始前已取消时一个文件也不处理。
+"""
+import threading
+
+import pytest
+
+from test_regression import build_workbook
+
+
+def _files(tmp_path, n=4):
+    return [build_workbook(tmp_path / f"{i}班.xlsx", "messy") for i in range(1, n + 1)]
+
+
+def test_pool_keeps_input_order(tmp_path):
+    from score_filter_core import process_files
+    files = _files(tmp_path)
+    ok, summary, results = process_files(files, output_dir=tmp_path / "out", log_fn=lambda s: None,
+                                         workers=2)
+    assert ok, summary
+    assert [r["file"] for r in results] == files
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_cancel_before_start(tmp_path, workers):
+    from score_filter_core import process_files
+    cancel = threading.Event()
+    cancel.set()
+    ok, summary, results = process_files(_files(tmp_path), output_dir=tmp_path / "out",
+                                         log_fn=lambda s: None, workers=workers, cancel_event=cancel)
+    assert not ok
+    assert results == []
+    assert summary.startswith("批量处理已取消（完成 0/4）")
+    assert not (tmp_path / "out").exists() or not any((tmp_path / "out").iterdir())
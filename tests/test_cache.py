@@ -0,0 +1,101 @@
+# tests/test_cache.py
+# -*- coding: utf-8 -*-
+"""
+结果缓存：输入与影响输出的参数都不变时命中，任一变化时重新处理。
+内存数据缓存（FrameStore）：只改公选课学分阈值时复用已解析的数据，结果与重新处理相同。
+列式快照（SnapshotStore）：从快照读取与直接解析 Excel 的导出完全一致。
+"""
+import pytest
+
+from test_regression import build_workbook, xlsx_cells
+
+
+def _exports(out_dir):
+    """输出目录 -> {文件名: 内容}（CSV 按字节，xlsx 按单元格）"""
+    return {p.name: xlsx_cells(p) if p.suffix == ".xlsx" else p.read_bytes()
+            for p in sorted(out_dir.iterdir())}
+
+
+def _process(infile, out_dir, **kwargs):
+    from score_filter_core import process_one_file
+    logs = []
+    ok, summary, outputs = process_one_file(infile, divide_output=True, output_dir=out_dir,
+                                            log_fn=logs.append, **kwargs)
+    assert ok, summary
+    return outputs, logs
+
+
+@pytest.fixture
+def run(tmp_path):
+    from score_filter_cache import ResultCache
+    from score_filter_core import process_one_file
+    infile = build_workbook(tmp_path / "messy.xlsx", "messy")
+    cache = ResultCache(tmp_path / "cache")
+
+    def _run(**kwargs):
+        ok, summary, outputs = process_one_file(infile, output_dir=tmp_path / "out", log_fn=lambda s: None,
+                                                cache=cache, **kwargs)
+        assert ok, summary
+        return outputs
+    return _run
+
+
+def test_writer_is_part_of_key(run):
+    pytest.importorskip("xlsxwriter")
+    assert run(writer="xlsxwriter")["cache_hit"] is False
+    outputs = run(writer="openpyxl")
+    assert outputs["cache_hit"] is False
+    assert outputs["writers"]["xlsx"] == "openpyxl"
+    outputs = run(writer="xlsxwriter")
+    assert outputs["cache_hit"] is True
+    assert outputs["writers"]["xlsx"] == "xlsxwriter"
+
+
+def test_hit_and_miss(run, tmp_path):
+    assert run()["cache_hit"] is False
+    fresh = _exports(tmp_path / "out")
+    # 参数不变：命中，被删除的导出文件从缓存恢复
+    for p in (tmp_path / "out").iterdir():
+        p.unlink()
+    assert run()["cache_hit"] is True
+    assert _exports(tmp_path / "out") == fresh
+    # 阈值变化：未命中；改回原阈值再次命中
+    assert run(pubclass_qualified_num=13)["cache_hit"] is False
+    assert run(pubclass_qualified_num=13)["cache_hit"] is True
+    assert run()["cache_hit"] is True
+    # 文件内容变化：未命中
+    build_workbook(tmp_path / "messy.xlsx", "messy_other_text")
+    assert run()["cache_hit"] is False
+
+
+def test_frame_store_reuses_parsed_data(tmp_path):
+    from score_filter_cache import FrameStore
+    infile = build_workbook(tmp_path / "messy.xlsx", "messy")
+    store = FrameStore()
+    _, logs = _process(infile, tmp_path / "a", frame_store=store)
+    assert len(store) == 1 and not any("复用内存中已解析的数据" in s for s in logs)
+
+    # 只改阈值：复用已解析的数据（不再读取文件），结果与重新处理相同
+    _, logs = _process(infile, tmp_path / "b", frame_store=store, pubclass_qualified_num=13)
+    assert any("复用内存中已解析的数据" in s for s in logs)
+    assert not any(s.startswith("读取文件") for s in logs)
+    _process(infile, tmp_path / "c", pubclass_qualified_num=13)
+    assert _exports(tmp_path / "b") == _exports(tmp_path / "c")
+    assert _exports(tmp_path / "a") != _exports(tmp_path / "b")
+
+    # 缓存的数据未被改动：回到原阈值时结果仍与第一次相同
+    _process(infile, tmp_path / "d", frame_store=store)
+    assert _exports(tmp_path / "d") == _exports(tmp_path / "a")
+
+
+@pytest.mark.parametrize("name", ["messy", "messy_other_text"])
+def test_snapshot_roundtrip(tmp_path, name):
+    from score_filter_cache import SnapshotStore
+    infile = build_workbook(tmp_path / f"{name}.xlsx", name)
+    snapshots = SnapshotStore(tmp_path / "snapshots")
+    _, logs = _process(infile, tmp_path / "excel", snapshots=snapshots)
+    assert any("快照" in s for s in logs if s.startswith("读取文件"))
+    _, logs = _process(infile, tmp_path / "snapshot", snapshots=snapshots)
+    assert any(s.startswith("读取文件") and s.endswith("（快照）") for s in logs)
+    _process(infile, tmp_path / "plain")
+    assert _exports(tmp_path / "snapshot") == _exports(tmp_path / "plain") == _exports(tmp_path / "excel")
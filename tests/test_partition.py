@@ -0,0 +1,88 @@
+# tests/test_partition.py
+# -*- coding: utf-8 -*-
+"""
+一个文件含多个班（--partition-col 班级）：班级人数与“未开设”课程按班计算，结果与整表作为一个班时不同；
+整表与分块模式的输出一致。
+"""
+import pytest
+
+from test_regression import xlsx_cells
+
+HEADER = ["学号", "姓名", "一层节点", "课程名称", "获得学分", "成绩", "学年学期", "班级"]
+ROWS = [
+    # 一班（2 人）：大学英语全班空白——按班计算时未开设，不导出
+    ["2021001", "张三", "通识必修课", "大学英语", 3, None, "2024-2025-1", "一班"],
+    ["2021002", "李四", "通识必修课", "大学英语", 3, None, "2024-2025-1", "一班"],
+    ["2021001", "张三", "专业必修课", "高等数学", 4, 45, "2024-2025-1", "一班"],
+    ["2021002", "李四", "公共选修课", "音乐鉴赏", 2, 50, "2024-2025-2", "一班"],
+    # 二班（3 人）：大学英语正常开设，空白成绩需关注；体育全班 0 分——未开设
+    ["2022001", "王五", "通识必修课", "大学英语", 3, 80, "2024-2025-1", "二班"],
+    ["2022002", "赵六", "通识必修课", "大学英语", 3, None, "2024-2025-1", "二班"],
+    ["2022003", "钱七", "通识必修课", "大学英语", 3, 70, "2024-2025-1", "二班"],
+    ["2022001", "王五", "通识必修课", "体育", 1, 0, "2024-2025-1", "二班"],
+    ["2022002", "赵六", "通识必修课", "体育", 1, 0, "2024-2025-1", "二班"],
+    ["2022003", "钱七", "通识必修课", "体育", 1, 0, "2024-2025-1", "二班"],
+    ["2022003", "钱七", "公共选修课", "影视赏析", 12, 30, "2024-2025-2", "二班"],
+    ["2022002", "赵六", "专业必修课", "高等数学", 4, 52, "2024-2025-1", "二班"],
+]
+
+
+def _workbook(path):
+    import openpyxl
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    for r in ROWS:
+        ws.append(r)
+    wb.save(path)
+    return path
+
+
+def _run(tmp_path, out, **kwargs):
+    from score_filter_core import process_one_file
+    infile = tmp_path / "年级.xlsx"
+    if not infile.exists():
+        _workbook(infile)
+    ok, summary, outputs = process_one_file(infile, divide_output=True, output_dir=tmp_path / out,
+                                            log_fn=lambda s: None, **kwargs)
+    assert ok, summary
+    return summary, outputs
+
+
+def test_classes_computed_separately(tmp_path):
+    whole_summary, whole = _run(tmp_path, "whole")
+    summary, outputs = _run(tmp_path, "classes", partition_col="班级")
+
+    # 整表视为一个班：5 人；大学英语、体育都有人不是空白/0 分，不算未开设，全部需关注
+    assert "班级总人数: 5" in whole_summary
+    assert whole["not_offered_courses"] == []
+    # 按班：一班 2 人、大学英语未开设；二班 3 人、体育未开设
+    assert "  一班：人数 2，未开设课程 1：大学英语" in summary
+    assert "  二班：人数 3，未开设课程 1：体育" in summary
+    assert outputs["not_offered_by_class"] == {"一班": ["大学英语"], "二班": ["体育"]}
+
+    def rule2_students(out):
+        rows = xlsx_cells(out["xlsx"])
+        return sorted(r[0] for sheet in rows.values() for r in sheet[1:] if r[-1].startswith("规则二"))
+
+    assert rule2_students(whole) == ["2021001", "2021002", "2022001", "2022002", "2022002", "2022003"]
+    assert rule2_students(outputs) == ["2022002"]
+
+    sheets = xlsx_cells(outputs["xlsx"])
+    assert list(sheets) == ["一班", "二班"]
+    assert {r[-2] for r in sheets["一班"][1:]} == {"一班"}
+
+
+@pytest.mark.parametrize("chunksize", [2, 5])
+def test_streaming_matches_in_memory(tmp_path, chunksize):
+    pq = pytest.importorskip("pyarrow.parquet")
+    summary, outputs = _run(tmp_path, "memory", partition_col="班级", extra_formats=("parquet",))
+    s_summary, s_outputs = _run(tmp_path, "stream", partition_col="班级", extra_formats=("parquet",),
+                                chunksize=chunksize)
+    assert summary.replace(str(tmp_path / "memory"), "") == s_summary.replace(str(tmp_path / "stream"), "")
+    assert xlsx_cells(outputs["xlsx"]) == xlsx_cells(s_outputs["xlsx"])
+    memory = {p.name: p.read_bytes() for p in (tmp_path / "memory").glob("*.csv")}
+    stream = {p.name: p.read_bytes() for p in (tmp_path / "stream").glob("*.csv")}
+    assert memory and memory == stream
+    # 列式副本按班级顺序排列
+    assert pq.read_table(outputs["parquet"]).to_pylist() == pq.read_table(s_outputs["parquet"]).to_pylist()
@@ -0,0 +1,170 @@
+# tests/test_regression.py
+# -*- coding: utf-8 -*-
+"""
+输出回归测试：构造一个“脏”成绩表，处理后与冻结的期望输出逐字节（CSV）/逐单元格（xlsx）比较。
+期望输出位于 tests/expected/<工作簿名>/，由最初的逐行实现生成，之后的各项优化都不应改变它。
+
+覆盖：课程名为空、“其它”课程（含学分为文字的“其它”行）、成绩列混有“缺考”等文字、重复行、无学期列、
+全班成绩空白的课程（视为未开设）、公选课学分阈值。
+
+需要重新生成期望输出时（仅在有意改变输出格式时）：
+    python tests/test_regression.py --regenerate
+"""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+EXPECTED_DIR = Path(__file__).parent / "expected"
+HEADER = ["学号", "姓名", "一层节点", "课程名称", "获得学分", "成绩", "学年学期"]
+
+# 学号混有文字与数字；成绩混有数字、空白与“缺考”
+ROWS = [
+    # 必修课：及格 / 0 分 / 缺考 / 不及格 / 空白 / 59.5
+    ["2021001", "张三", "专业必修课", "高等数学", 4, 85, "2024-2025-1"],
+    ["2021002", "李四", "专业必修课", "高等数学", 4, 0, "2024-2025-1"],
+    ["2021003", "王五", "专业必修课", "高等数学", 4, "缺考", "2024-2025-1"],
+    ["2021004", "赵六", "专业必修课", "高等数学", 4, 45, "2024-2025-1"],
+    ["2021005", "钱七", "专业必修课", "高等数学", 4, None, "2024-2025-1"],
+    [2021006, "孙八", "专业必修课", "高等数学", 4, 59.5, "2024-2025-1"],
+    # 全班空白：未开设，不应导出
+    ["2021001", "张三", "通识必修课", "大学英语", 3, None, "2024-2025-1"],
+    ["2021002", "李四", "通识必修课", "大学英语", 3, None, "2024-2025-1"],
+    ["2021003", "王五", "通识必修课", "大学英语", 3, None, "2024-2025-1"],
+    ["2021004", "赵六", "通识必修课", "大学英语", 3, 0, "2024-2025-1"],
+    ["2021005", "钱七", "通识必修课", "大学英语", 3, None, "2024-2025-1"],
+    [2021006, "孙八", "通识必修课", "大学英语", 3, "缺考", "2024-2025-1"],
+    # “其它”课程整行过滤（即便成绩为 0/不及格）
+    ["2021001", "张三", "其它", "体育", 1, 0, "2024-2025-1"],
+    ["2021002", "李四", "其它", "体育", 1, 30, "2024-2025-1"],
+    # 公选课：学分 < 10 且 成绩 < 60/空 -> 规则一；学分 >= 10 时不命中
+    ["2021001", "张三", "公共选修课", "音乐鉴赏", 2, 50, "2024-2025-2"],
+    ["2021002", "李四", "公共选修课", "音乐鉴赏", 2, "缺考", "2024-2025-2"],
+    ["2021003", "王五", "公共选修课", "音乐鉴赏", 2, 90, "2024-2025-2"],
+    ["2021004", "赵六", "公共选修课", "影视赏析", 12, 30, "2024-2025-2"],
+    ["2021005", "钱七", "公共选修课", "影视赏析", 0, None, "2024-2025-2"],
+    # 课程名为空：0 分行不导出（无法判断是否开设），不及格行照常导出
+    ["2021003", "王五", "专业选修课", None, 2, 0, "2024-2025-2"],
+    ["2021004", "赵六", "专业选修课", None, 2, 40, "2024-2025-2"],
+    # 完全重复的行与不同学期的重修记录（无学期列时二者都会被去重）
+    ["2021004", "赵六", "专业必修课", "高等数学", 4, 45, "2024-2025-1"],
+    ["2021004", "赵六", "专业必修课", "高等数学", 4, 52, "2024-2025-2"],
+    ["2021002", "李四", "专业必修课", "线性代数", 3, 0, "2024-2025-2"],
+    ["2021002", "李四", "专业必修课", "线性代数", 3, 0, "2024-2025-2"],
+    ["2021005", "钱七", "专业必修课", "线性代数", 3, 72, "2024-2025-2"],
+]
+
+# “其它”行的学分为文字：最初的实现先删去“其它”行再数值化，其余行的学分全为整数，导出为整数
+OTHER_TEXT_ROWS = [["2021003", "王五", "其它", "体育", "免修", "良好", "2024-2025-1"]]
+
+# 没有任何预警行：总表只有原表头（不含“来源规则”列），不输出分规则 CSV
+ALL_PASS_ROWS = [
+    ["2021001", "张三", "专业必修课", "高等数学", 4, 85, "2024-2025-1"],
+    ["2021002", "李四", "专业必修课", "高等数学", 4, 60, "2024-2025-1"],
+    ["2021001", "张三", "公共选修课", "影视赏析", 12, 30, "2024-2025-2"],
+    ["2021002", "李四", "其它", "体育", 1, 0, "2024-2025-1"],
+]
+
+WORKBOOKS = {
+    "messy": (HEADER, ROWS),
+    "messy_noterm": (HEADER[:-1], [r[:-1] for r in ROWS]),
+    "messy_other_text": (HEADER, ROWS + OTHER_TEXT_ROWS),
+    "all_pass": (HEADER, ALL_PASS_ROWS),
+}
+
+
+def build_workbook(path, name):
+    import openpyxl
+    header, rows = WORKBOOKS[name]
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(header)
+    for r in rows:
+        ws.append(r)
+    wb.save(path)
+    return Path(path)
+
+
+def xlsx_cells(path):
+    """工作簿 -> {工作表名: [[单元格值, ...], ...]}（含表头）"""
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        return {ws.title: [list(r) for r in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+    finally:
+        wb.close()
+
+
+def _outputs(process_one_file, name, tmp, **kwargs):
+    infile = build_workbook(Path(tmp) / f"{name}.xlsx", name)
+    out_dir = Path(tmp) / "out"
+    ok, summary, outputs = process_one_file(infile, divide_output=True, output_dir=out_dir,
+                                            log_fn=lambda s: None, **kwargs)
+    assert ok, summary
+    return outputs
+
+
+@pytest.mark.parametrize("name", sorted(WORKBOOKS))
+@pytest.mark.parametrize("mode", [{}, {"chunksize": 4}], ids=["in-memory", "streaming"])
+def test_output_matches_frozen(tmp_path, name, mode):
+    from score_filter_core import process_one_file
+    outputs = _outputs(process_one_file, name, tmp_path, **mode)
+    expected = EXPECTED_DIR / name
+
+    produced = {p.name for p in (tmp_path / "out").iterdir()}
+    wanted = {p.name for p in expected.iterdir()}
+    assert produced == {n.replace(".json", ".xlsx") for n in wanted}
+
+    for exp in expected.glob("*.csv"):
+        assert (tmp_path / "out" / exp.name).read_bytes() == exp.read_bytes(), exp.name
+
+    cells = json.loads((expected / f"学业预警表_{name}.json").read_text(encoding="utf-8"))
+    assert xlsx_cells(outputs["xlsx"]) == cells
+
+
+@pytest.mark.parametrize("name", sorted(WORKBOOKS))
+def test_streaming_columnar_matches_in_memory(tmp_path, name):
+    """分块模式的 parquet 副本与整表模式逐列一致（列名、schema 与取值）"""
+    pq = pytest.importorskip("pyarrow.parquet")
+    from score_filter_core import process_one_file
+    tables = []
+    for i, mode in enumerate([{}, {"chunksize": 4}]):
+        run = tmp_path / f"run{i}"
+        run.mkdir()
+        outputs = _outputs(process_one_file, name, run, extra_formats=("parquet",), **mode)
+        tables.append(pq.read_table(outputs["parquet"]))
+    assert tables[0].schema.equals(tables[1].schema, check_metadata=True)
+    assert tables[0].to_pylist() == tables[1].to_pylist()
+
+
+def test_core_keeps_moved_helpers():
+    """移到 score_filter_rules 的辅助函数仍可从 score_filter_core 导入"""
+    import score_filter_rules
+    from score_filter_core import find_col_exact
+    assert find_col_exact is score_filter_rules.find_col_exact
+    assert find_col_exact(["学号", "班级"], "班级") == "班级"
+
+
+def _regenerate():
+    """用当前 score_filter_core 重新生成期望输出（应在已验证正确的实现上运行）"""
+    import tempfile
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from score_filter_core import process_one_file
+    for name in WORKBOOKS:
+        target = EXPECTED_DIR / name
+        target.mkdir(parents=True, exist_ok=True)
+        for old in target.iterdir():
+            old.unlink()
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = _outputs(process_one_file, name, tmp)
+            for p in (Path(tmp) / "out").iterdir():
+                if p.suffix == ".csv":
+                    (target / p.name).write_bytes(p.read_bytes())
+            (target / f"学业预警表_{name}.json").write_text(
+                json.dumps(xlsx_cells(outputs["xlsx"]), ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"已生成: {target}")
+
+
+if __name__ == "__main__" and "--regenerate" in sys.argv:
+    _regenerate()
@@ -0,0 +1,76 @@
+# tests/test_report.py
+# -*- coding: utf-8 -*-
+"""
+跨文件汇总预警表：多个文件中的同一条预警只计一次但来源文件全部列出；空值不会变成 "nan"；
+经 process_files 批量处理时各文件的预警行都并入汇总。
+"""
+from test_regression import build_workbook, xlsx_cells
+
+
+def _code(rule_id):
+    from score_filter_ruleset import DEFAULT_RULESET
+    return next(r.code for r in DEFAULT_RULESET.rules if r.id == rule_id)
+
+
+def _record(student_id, course_name, rule_id, credit=3, name="张三", term="2024-2025-1"):
+    return {"student_id": student_id, "name": name, "group": None, "course_name": course_name,
+            "course_type": "专业必修课", "credit": credit, "score": 0, "term": term, "rule": _code(rule_id)}
+
+
+def _report():
+    from score_filter_report import WarningReport
+    report = WarningReport(10)
+    # 同一条预警同时出现在两个文件中；学号 2021002 的课程名为空
+    report.add("a.xlsx", [_record("2021001", "高等数学", "rule2", credit=4),
+                          _record("2021002", None, "rule3", name="李四")])
+    report.add("b.xlsx", [_record("2021001", "高等数学", "rule2", credit=4),
+                          _record("2021001", "线性代数", "rule3")])
+    report.add("c.xlsx", [_record(None, "大学英语", "rule3", name=None)])
+    return report
+
+
+def test_student_frame_merges_files():
+    df = _report().student_frame().set_index("学号")
+    assert list(df.index) == ["2021001", "2021002"]
+
+    first = df.loc["2021001"]
+    # 高等数学只计一次，但两个来源文件都列出
+    assert (first["规则二记录数"], first["规则三记录数"], first["预警记录数"]) == (1, 1, 2)
+    assert first["不及格学分"] == 7
+    assert first["课程列表"] == "高等数学、线性代数"
+    assert (first["来源文件数"], first["来源文件"]) == (2, "a.xlsx、b.xlsx")
+
+    second = df.loc["2021002"]
+    assert second["课程列表"] == ""
+    assert (second["来源文件数"], second["来源文件"]) == (1, "a.xlsx")
+
+
+def test_detail_frame_keeps_blanks_blank():
+    df = _report().detail_frame()
+    assert len(df) == 5
+    assert "nan" not in df["学号"].astype(str).tolist()
+    assert df["学号"].isna().sum() == 1
+    assert df["课程名称"].isna().sum() == 1
+    assert df["来源文件"].tolist()[:3] == ["a.xlsx", "b.xlsx", "b.xlsx"]
+
+
+def test_batch_report(tmp_path):
+    from score_filter_core import process_files
+    from score_filter_report import report_path
+    files = [build_workbook(tmp_path / f"{k}.xlsx", "messy") for k in ("一班", "二班")]
+    path = report_path(tmp_path / "out")
+    ok, summary, results = process_files(files, output_dir=tmp_path / "out", log_fn=lambda s: None,
+                                         report_path=path)
+    assert ok, summary
+    sheets = xlsx_cells(path)
+    header, *rows = sheets["学生汇总"]
+    by_id = {r[0]: dict(zip(header, r)) for r in rows}
+    # 两份相同的成绩表：每条预警只计一次，来源文件为两个
+    assert by_id["2021002"]["来源文件数"] == 2
+    assert by_id["2021002"]["来源文件"] == "一班.xlsx、二班.xlsx"
+    assert by_id["2021002"]["预警记录数"] == 3
+    assert by_id["2021002"]["课程列表"] == "线性代数、高等数学、音乐鉴赏"
+    assert "nan" not in {c for r in rows for c in r}
+    # 明细保留各文件的全部预警行
+    per_file = len(xlsx_cells(tmp_path / "out" / "学业预警表_一班.xlsx")["Sheet1"]) - 1
+    assert len(sheets["预警明细"]) - 1 == 2 * per_file
@@ -0,0 +1,131 @@
+# tests/test_ruleset.py
+# -*- coding: utf-8 -*-
+"""
+规则配置：内置配置可导出后原样加载；自定义配置（改列名、及格线、新增规则）在整表与分块模式下结果一致；
+配置有误时给出 ValueError。内置规则的输出由 test_regression 覆盖。
+"""
+import copy
+import csv
+import json
+
+import pytest
+
+from test_regression import HEADER, ROWS, xlsx_cells
+
+
+def _custom_config():
+    from score_filter_ruleset import DEFAULT_RULES_CONFIG
+    config = copy.deepcopy(DEFAULT_RULES_CONFIG)
+    config["params"]["pass_score"] = 50
+    config["columns"]["score"]["name"] = "总评"
+    # 新增：公选课 50 分以上但未满 60 分的记录（与阈值无关），排在最后导出
+    config["rules"].append({
+        "id": "rule4", "name": "规则四", "priority": 3, "label": "规则四: 公选 50<=成绩<60",
+        "when": {"all": [{"column": "course_type", "contains": "公共选修课"},
+                         {"column": "score", "ge": {"param": "pass_score"}},
+                         {"column": "score", "lt": 60}]},
+        "csv": "公选_待提高",
+    })
+    return config
+
+
+def _workbook(path):
+    import openpyxl
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["总评" if h == "成绩" else h for h in HEADER])
+    for r in ROWS:
+        ws.append(r)
+    # 规则四：公选 55 分，学分 >= 阈值
+    ws.append(["2021006", "孙八", "公共选修课", "书法", 12, 55, "2024-2025-2"])
+    wb.save(path)
+    return path
+
+
+def _read_csv(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_default_config_roundtrip(tmp_path):
+    from score_filter_ruleset import DEFAULT_RULESET, dump_default_config, load_ruleset
+    path = tmp_path / "rules.json"
+    dump_default_config(path)
+    ruleset = load_ruleset(path)
+    assert ruleset.is_default and ruleset.digest == DEFAULT_RULESET.digest
+    assert ruleset.labels(10) == DEFAULT_RULESET.labels(10)
+
+
+@pytest.mark.parametrize("mode", [{}, {"chunksize": 4}], ids=["in-memory", "streaming"])
+def test_custom_rules(tmp_path, mode):
+    from score_filter_core import process_one_file
+    from score_filter_ruleset import compile_ruleset
+    ruleset = compile_ruleset(_custom_config())
+    infile = _workbook(tmp_path / "custom.xlsx")
+    ok, summary, outputs = process_one_file(infile, divide_output=True, output_dir=tmp_path / "out",
+                                            log_fn=lambda s: None, ruleset=ruleset, **mode)
+    assert ok, summary
+    # 45、40 分与重复的 45 分；52、59.5 分不再算不及格
+    assert "规则三: 不及格人数 1, 记录 3" in summary
+    # 50 分的公选课不再命中规则一，归入规则四
+    assert "规则一: 学分<10 且 成绩<50/空 - 学生数 2, 记录 2" in summary
+    assert summary.splitlines()[5] == "规则四: 学生数 2, 记录 2"
+
+    rule3 = _read_csv(outputs["csv_rule3"])
+    assert outputs["csv_rule3"].name == "custom_其他_不及格小于50.csv"
+    assert [r[5] for r in rule3[1:]] == ["45.0", "40.0", "45.0"]
+    assert rule3[1][-1] == "规则三: 非公选 正常开设 0<成绩<50"
+    rule4 = _read_csv(outputs["csv_rule4"])
+    assert [r[3] for r in rule4[1:]] == ["音乐鉴赏", "书法"]
+
+    rows = xlsx_cells(outputs["xlsx"])["Sheet1"]
+    assert rows[0][5] == "总评"
+    assert rows[-1][-1] == "规则四: 公选 50<=成绩<60"
+
+
+def test_custom_rules_streaming_matches_in_memory(tmp_path):
+    from score_filter_core import process_one_file
+    from score_filter_ruleset import compile_ruleset
+    ruleset = compile_ruleset(_custom_config())
+    infile = _workbook(tmp_path / "custom.xlsx")
+    produced = []
+    for i, mode in enumerate([{}, {"chunksize": 3}]):
+        out_dir = tmp_path / f"out{i}"
+        ok, summary, outputs = process_one_file(infile, divide_output=True, output_dir=out_dir,
+                                                log_fn=lambda s: None, ruleset=ruleset, **mode)
+        assert ok, summary
+        produced.append(({p.name: p.read_bytes() for p in out_dir.glob("*.csv")},
+                         xlsx_cells(outputs["xlsx"]), summary.splitlines()[:-1]))
+    assert produced[0] == produced[1]
+
+
+def test_custom_rules_not_served_from_default_cache(tmp_path):
+    from score_filter_cache import ResultCache
+    from score_filter_core import process_one_file
+    from score_filter_ruleset import compile_ruleset
+    infile = _workbook(tmp_path / "custom.xlsx")
+    cache = ResultCache(tmp_path / "cache")
+    kwargs = dict(output_dir=tmp_path / "out", log_fn=lambda s: None, cache=cache)
+    ruleset = compile_ruleset(_custom_config())
+    assert process_one_file(infile, ruleset=ruleset, **kwargs)[2]["cache_hit"] is False
+    assert process_one_file(infile, **kwargs)[2]["cache_hit"] is False
+    assert process_one_file(infile, ruleset=ruleset, **kwargs)[2]["cache_hit"] is True
+
+
+@pytest.mark.parametrize("change, message", [
+    (lambda c: c["rules"][0]["when"]["all"].append({"column": "绩点", "lt": 2}), "未定义的列"),
+    (lambda c: c["rules"][1].update(when={"column": "score", "lt": {"param": "fail_line"}}), "未定义的参数"),
+    (lambda c: c["rules"][2].update(id="rule1"), "唯一的 id"),
+    (lambda c: c["rules"][2].update(not_offered=True), "not_offered"),
+    (lambda c: c["rules"][2].update(label=c["rules"][1]["label"]), "label 相同"),
+    (lambda c: c["rules"][2].update(label="规则一: 公选 学分<{threshold} 且 成绩<60/空"), "label 相同"),
+    (lambda c: c["rules"][2].update(csv=c["rules"][1]["csv"]), "csv 相同"),
+])
+def test_invalid_config(tmp_path, change, message):
+    from score_filter_ruleset import DEFAULT_RULES_CONFIG, load_ruleset
+    config = copy.deepcopy(DEFAULT_RULES_CONFIG)
+    change(config)
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        load_ruleset(path)
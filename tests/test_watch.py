@@ -0,0 +1,70 @@
+# tests/test_watch.py
+# -*- coding: utf-8 -*-
+"""
+监视目录：文件稳定 settle_seconds 后才报告，已处理且未变化的文件不再报告，锁文件与本工具的输出被忽略；
+watch_folder 处理新放入的文件，stop_event 置位后退出。
+"""
+import os
+import shutil
+import threading
+
+from test_regression import build_workbook
+
+
+def test_watcher_debounce(tmp_path):
+    from score_filter_watch import FolderWatcher
+    watcher = FolderWatcher(tmp_path, settle_seconds=2)
+    path = build_workbook(tmp_path / "一班.xlsx", "messy")
+    shutil.copyfile(path, tmp_path / "~$一班.xlsx")
+    shutil.copyfile(path, tmp_path / "学业预警表_一班.xlsx")
+
+    assert watcher.poll(now=0) == []
+    assert watcher.poll(now=1) == []
+    assert watcher.poll(now=2) == [path]
+    watcher.mark_handled(path)
+    assert watcher.poll(now=10) == []
+
+    # 文件再次变化：重新去抖后报告
+    build_workbook(path, "messy_other_text")
+    assert watcher.poll(now=11) == []
+    assert watcher.poll(now=13) == [path]
+
+
+def test_watch_folder_processes_new_file(tmp_path):
+    from score_filter_watch import watch_folder
+    folder, out_dir = tmp_path / "in", tmp_path / "out"
+    folder.mkdir()
+    stop = threading.Event()
+    results, handled = [], []
+
+    def on_result(r):
+        results.append(r)
+        stop.set()
+
+    thread = threading.Thread(target=lambda: handled.append(watch_folder(
+        folder, log_fn=lambda s: None, poll_seconds=0.05, settle_seconds=0.1, stop_event=stop,
+        result_fn=on_result, output_dir=out_dir)))
+    thread.start()
+    try:
+        # 先在目录外写好再移入，避免读到写了一半的文件
+        path = folder / "一班.xlsx"
+        os.replace(build_workbook(tmp_path / "一班.xlsx", "messy"), path)
+        thread.join(timeout=60)
+    finally:
+        stop.set()
+        thread.join(timeout=60)
+    assert not thread.is_alive()
+    assert handled == [1]
+    assert [(r["file"], r["success"]) for r in results] == [(path, True)]
+    assert (out_dir / "学业预警表_一班.xlsx").exists()
+
+
+def test_watch_folder_stops_when_idle(tmp_path):
+    from score_filter_watch import watch_folder
+    stop = threading.Event()
+    timer = threading.Timer(0.2, stop.set)
+    timer.start()
+    try:
+        assert watch_folder(tmp_path, log_fn=lambda s: None, poll_seconds=0.05, stop_event=stop) == 0
+    finally:
+        timer.cancel()